@@ -0,0 +1,82 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare replay time of fixed size and adaptively sized query batches.
+
+Runs against an in-process fake Rewind (see `rewind.client.testing`) that
+honours batch size hints and delays every reply to simulate a network round
+trip. Example usage, simulating a 1 ms round trip::
+
+    python benchmarks/adaptive.py --events 200000 --size 10 --rtt-ms 1
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.adaptive as adaptive
+from rewind.client.testing import FakeRewind
+
+
+def _fixed(socket):
+    """Replay all events in batches of the size picked by the server."""
+    return sum(1 for _ in clients.query_events(socket))
+
+
+def _adaptive(max_bytes):
+    """Return a function replaying all events in adaptively sized batches."""
+    def replay(socket):
+        controller = adaptive.BatchSizeController(max_bytes=max_bytes,
+                                                  hints=True)
+        return sum(1 for _ in adaptive.query_events(socket,
+                                                    controller=controller))
+    return replay
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000,
+                        help='the number of events to replay.')
+    parser.add_argument('--size', type=int, default=10,
+                        help='the size of every event in bytes.')
+    parser.add_argument('--rtt-ms', type=float, default=1.0,
+                        help='the simulated round trip time.')
+    parser.add_argument('--max-bytes', type=int, default=16 * 1024 * 1024,
+                        help='the memory cap of adaptive batches.')
+    args = parser.parse_args(argv)
+
+    context = zmq.Context(1)
+    server = FakeRewind(context, 'inproc://adaptive-benchmark',
+                        max_hint=100000, reply_delay=args.rtt_ms / 1000.0)
+    server.load(b'x' * args.size for _ in range(args.events))
+    server.start()
+    socket = context.socket(zmq.REQ)
+    socket.connect('inproc://adaptive-benchmark')
+    try:
+        print('{0:<10} {1:>10} {2:>12}'.format('batches', 'wall (s)',
+                                               'events/s'))
+        for name, replay in [('fixed', _fixed),
+                             ('adaptive', _adaptive(args.max_bytes))]:
+            start = time.time()
+            nevents = replay(socket)
+            wall = time.time() - start
+            print('{0:<10} {1:>10.3f} {2:>12.0f}'.format(name, wall,
+                                                         nevents / wall))
+    finally:
+        socket.close()
+        server.stop()
+        context.term()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare filtering events after and while receiving them.
+
+Publishes events of which only a fraction (1% by default) belong to the
+aggregate being looked for, and measures the wall clock time and the CPU
+time spent by the client finding them by:
+
+ * filtering the output of `rewind.client.query_events`,
+ * `rewind.client.filtering.query_events` with `copy=True`, and
+ * `rewind.client.filtering.query_events` with `copy=False`.
+
+Runs against an in-process fake Rewind (see `rewind.client.testing`) unless
+given the query endpoint of a running Rewind instance. Example usage::
+
+    python benchmarks/filtering.py --events 200000 --selectivity 0.01
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+import zmq
+
+try:
+    _thread_time = time.thread_time
+except AttributeError:
+    # Python < 3.7
+    _thread_time = time.clock
+
+import rewind.client as clients
+import rewind.client.batch as batch
+import rewind.client.filtering as filtering
+from rewind.client.testing import FakeRewind
+
+
+_WANTED = b'aggregate-0000042:'
+_OTHER = b'aggregate-0000007:'
+
+
+def populate(context, endpoint, nevents, size, selectivity):
+    """Publish events, a fraction `selectivity` of them being wanted.
+
+    Returns the id of the event published right before them, or None.
+
+    """
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    try:
+        lastid = None
+        for lastid, _ in clients.query_events(socket):
+            pass
+    finally:
+        socket.close()
+
+    every = int(round(1 / selectivity))
+    padding = b'x' * max(0, size - len(_WANTED))
+    wanted = _WANTED + padding
+    other = _OTHER + padding
+    events = (wanted if i % every == 0 else other for i in range(nevents))
+
+    socket = context.socket(zmq.DEALER)
+    socket.connect(endpoint)
+    try:
+        batch.publish_events(socket, events)
+    finally:
+        socket.close()
+    return lastid
+
+
+def _unfiltered(socket, from_):
+    """Find the wanted events by filtering all queried events."""
+    return [(eventid, eventdata)
+            for eventid, eventdata in clients.query_events(socket, from_)
+            if eventdata.startswith(_WANTED)]
+
+
+def _filtered(copy):
+    """Return a function finding the wanted events using `filtering`."""
+    predicate = filtering.prefix(_WANTED)
+
+    def find(socket, from_):
+        return list(filtering.query_events(socket, predicate, from_,
+                                           copy=copy))
+    return find
+
+
+def measure(context, endpoint, from_, find, rounds):
+    """Measure finding the wanted events a number of times.
+
+    Returns the tuple `(wall seconds, client CPU seconds, number found)`,
+    taking the best of the rounds. Client CPU time only includes the calling
+    thread, excluding an in-process fake Rewind.
+
+    """
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    try:
+        bestwall = bestcpu = None
+        for _ in range(rounds):
+            start = time.time()
+            cpustart = _thread_time()
+            found = find(socket, from_)
+            cpu = _thread_time() - cpustart
+            wall = time.time() - start
+            bestwall = wall if bestwall is None else min(bestwall, wall)
+            bestcpu = cpu if bestcpu is None else min(bestcpu, cpu)
+        return bestwall, bestcpu, len(found)
+    finally:
+        socket.close()
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--query-endpoint', default=None,
+                        help='the query endpoint of a running Rewind. If not'
+                             ' given, an in-process fake Rewind is used.')
+    parser.add_argument('--events', type=int, default=200000,
+                        help='the number of events to publish.')
+    parser.add_argument('--size', type=int, default=100,
+                        help='the size of every event in bytes.')
+    parser.add_argument('--selectivity', type=float, default=0.01,
+                        help='the fraction of events that are wanted.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='the number of times to measure each method.')
+    args = parser.parse_args(argv)
+
+    context = zmq.Context(1)
+    server = None
+    endpoint = args.query_endpoint
+    if endpoint is None:
+        endpoint = 'inproc://filtering-benchmark'
+        server = FakeRewind(context, endpoint)
+        server.start()
+
+    try:
+        from_ = populate(context, endpoint, args.events, args.size,
+                         args.selectivity)
+        methods = [
+            ('filter after query_events', _unfiltered),
+            ('filtering, copy=True', _filtered(True)),
+            ('filtering, copy=False', _filtered(False)),
+        ]
+        print('{0:<28} {1:>10} {2:>10} {3:>8} {4:>6}'.format(
+            'method', 'wall (s)', 'CPU (s)', 'CPU gain', 'found'))
+        baseline = None
+        for name, find in methods:
+            wall, cpu, nfound = measure(context, endpoint, from_, find,
+                                        args.rounds)
+            baseline = baseline or cpu
+            print('{0:<28} {1:>10.3f} {2:>10.3f} {3:>7.2f}x {4:>6}'.format(
+                name, wall, cpu, baseline / cpu, nfound))
+    finally:
+        if server is not None:
+            server.stop()
+        context.term()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Measure the cold start time of the client and its command line tools.
+
+Starts a fresh interpreter for every measurement and reports the median wall
+clock time, along with the bare interpreter start for reference. Example
+usage::
+
+    python benchmarks/importtime.py --runs 30
+
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+STATEMENTS = [
+    ('interpreter', 'pass'),
+    ('import zmq', 'import zmq'),
+    ('import rewind.client', 'import rewind.client'),
+    ('import rewind.client.cli', 'import rewind.client.cli'),
+    ('rewind-publish --help',
+     'import sys; sys.argv[1:] = ["--help"];'
+     ' import rewind.client.cli as cli; cli.publish_main()'),
+]
+
+
+def measure(statement, runs, cwd):
+    """Return the median seconds taken by interpreters running a statement."""
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call([sys.executable, '-c', statement], cwd=cwd,
+                            stdout=devnull)
+            times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20,
+                        help='the number of interpreters to start per'
+                             ' measurement.')
+    args = parser.parse_args(argv)
+
+    # Import the working tree rather than any installed version.
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print('{0:<28} {1:>10}'.format('statement', 'median (ms)'))
+    for name, statement in STATEMENTS:
+        print('{0:<28} {1:>10.1f}'.format(
+            name, 1000 * measure(statement, args.runs, cwd)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare producer latency of direct publishing and publishing via outbox.
+
+Runs against an in-process fake Rewind (see `rewind.client.testing`) with a
+configurable reply delay, and against no Rewind at all to simulate an
+outage, where direct publishing is not measured since it would time out.
+Example usage::
+
+    python benchmarks/outbox.py --events 20000 --reply-delay-ms 0.5
+
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.outbox as outbox
+from rewind.client.testing import FakeRewind
+
+
+def _percentiles(latencies):
+    """Return the 50th and 99th percentile of latencies in milliseconds."""
+    latencies = sorted(latencies)
+    return tuple(1000 * latencies[int(fraction * (len(latencies) - 1))]
+                 for fraction in (0.5, 0.99))
+
+
+def _direct(context, endpoint, nevents, event):
+    """Return the latencies of publishing events directly."""
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    latencies = []
+    try:
+        for _ in range(nevents):
+            start = time.time()
+            clients.publish_event(socket, event)
+            latencies.append(time.time() - start)
+    finally:
+        socket.close()
+    return latencies
+
+
+def _outbox(context, endpoint, directory, nevents, event):
+    """Return the latencies of publishing events via an outbox."""
+    latencies = []
+    with outbox.Outbox(context, endpoint, directory) as ob:
+        for _ in range(nevents):
+            start = time.time()
+            ob.publish(event)
+            latencies.append(time.time() - start)
+    return latencies
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000,
+                        help='the number of events to publish.')
+    parser.add_argument('--size', type=int, default=100,
+                        help='the size of every event in bytes.')
+    parser.add_argument('--reply-delay-ms', type=float, default=0.5,
+                        help='the reply delay of the fake Rewind.')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    endpoint = 'ipc://' + os.path.join(tmpdir, 'query')
+    event = b'x' * args.size
+    context = zmq.Context(1)
+    try:
+        print('{0:<24} {1:>10} {2:>10}'.format('producer', 'p50 (ms)',
+                                               'p99 (ms)'))
+        server = FakeRewind(context, endpoint,
+                            reply_delay=args.reply_delay_ms / 1000.0)
+        server.start()
+        try:
+            runs = [
+                ('direct', _direct(context, endpoint, args.events, event)),
+                ('outbox', _outbox(context, endpoint,
+                                   os.path.join(tmpdir, 'up'), args.events,
+                                   event)),
+            ]
+        finally:
+            server.stop()
+        runs.append(('outbox, Rewind down',
+                     _outbox(context, endpoint, os.path.join(tmpdir, 'down'),
+                             args.events, event)))
+        for name, latencies in runs:
+            print('{0:<24} {1:>10.4f} {2:>10.4f}'.format(
+                name, *_percentiles(latencies)))
+    finally:
+        context.term()
+        shutil.rmtree(tmpdir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare replay time of plain and prefetching queries.
+
+Every replayed event is "processed" by busy looping for a configurable amount
+of time, mimicking projection code. Requires a running Rewind instance.
+Example usage, replaying a few million events::
+
+    rewind --query-bind-endpoint tcp://127.0.0.1:8090 &
+    python benchmarks/prefetch.py --populate 3000000 --work-us 5
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.batch as batch
+import rewind.client.prefetch as prefetch
+
+
+def populate(context, endpoint, nevents, size):
+    """Publish `nevents` events of `size` bytes each to Rewind."""
+    socket = context.socket(zmq.DEALER)
+    socket.connect(endpoint)
+    try:
+        batch.publish_events(socket, (b'x' * size for _ in range(nevents)))
+    finally:
+        socket.close()
+
+
+def replay(context, endpoint, query_events, work):
+    """Replay all events while simulating `work` seconds of processing each.
+
+    Returns the tuple `(nevents, seconds)`.
+
+    """
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    try:
+        nevents = 0
+        start = time.time()
+        for _ in query_events(socket):
+            nevents += 1
+            deadline = time.time() + work
+            while time.time() < deadline:
+                pass
+        return nevents, time.time() - start
+    finally:
+        socket.close()
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--query-endpoint', default='tcp://127.0.0.1:8090',
+                        help='the query endpoint of a running Rewind.')
+    parser.add_argument('--populate', type=int, default=0,
+                        help='the number of events to publish beforehand.')
+    parser.add_argument('--size', type=int, default=100,
+                        help='the size of each populated event in bytes.')
+    parser.add_argument('--work-us', type=float, default=5.0,
+                        help='microseconds of processing per event.')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='the number of batches to prefetch.')
+    args = parser.parse_args(argv)
+
+    context = zmq.Context(1)
+    try:
+        if args.populate:
+            populate(context, args.query_endpoint, args.populate, args.size)
+
+        work = args.work_us / 1e6
+        nplain, plain = replay(context, args.query_endpoint,
+                               clients.query_events, work)
+
+        def prefetching(socket):
+            return prefetch.query_events(socket, depth=args.depth)
+        nprefetched, prefetched = replay(context, args.query_endpoint,
+                                         prefetching, work)
+    finally:
+        context.term()
+
+    assert nplain == nprefetched, (nplain, nprefetched)
+    print("events replayed:  {0:10d}".format(nplain))
+    print("query_events:     {0:10.0f} events/s".format(nplain / plain))
+    print("prefetching:      {0:10.0f} events/s (depth={1})".format(
+        nprefetched / prefetched, args.depth))
+    print("speedup:          {0:10.2f}x".format(plain / prefetched))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
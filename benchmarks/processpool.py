@@ -0,0 +1,84 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare replaying JSON events in one process and in a process pool.
+
+Runs against an in-process fake Rewind (see `rewind.client.testing`). Every
+event is a JSON document that the handler decodes and picks a field from.
+Example usage::
+
+    python benchmarks/processpool.py --events 200000 --workers 1 2 4
+
+"""
+from __future__ import print_function
+import argparse
+import json
+import sys
+import time
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.processpool as processpool
+from rewind.client.testing import FakeRewind
+
+
+def decode(eventid, eventdata):
+    """Decode an event and return the field of interest, if wanted."""
+    document = json.loads(bytes(eventdata).decode('utf-8'))
+    if document['user'] % 100 == 0:
+        return document['user']
+
+
+def _event(i):
+    """Return the data of the `i`th event."""
+    return json.dumps({'user': i, 'action': 'login', 'tags': ['a'] * 20,
+                       'payload': {'x': i * 0.5, 'y': [i] * 10}}).encode()
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000,
+                        help='the number of events to replay.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='the process pool sizes to measure.')
+    args = parser.parse_args(argv)
+
+    context = zmq.Context(1)
+    server = FakeRewind(context, 'inproc://processpool-benchmark')
+    server.load(_event(i) for i in range(args.events))
+    server.start()
+    socket = context.socket(zmq.REQ)
+    socket.connect('inproc://processpool-benchmark')
+    try:
+        print('{0:<16} {1:>10} {2:>12}'.format('replay', 'wall (s)',
+                                               'events/s'))
+        start = time.time()
+        found = [result for result in
+                 (decode(eventid, eventdata) for eventid, eventdata
+                  in clients.query_events(socket)) if result is not None]
+        wall = time.time() - start
+        print('{0:<16} {1:>10.3f} {2:>12.0f}'.format('in process', wall,
+                                                     args.events / wall))
+        for workers in args.workers:
+            with processpool.ProcessPoolReplay(decode,
+                                               workers=workers) as pool:
+                start = time.time()
+                assert list(pool.replay(socket)) == found
+                wall = time.time() - start
+            print('{0:<16} {1:>10.3f} {2:>12.0f}'.format(
+                '{0} workers'.format(workers), wall, args.events / wall))
+    finally:
+        socket.close()
+        server.stop()
+        context.term()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
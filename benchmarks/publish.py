@@ -0,0 +1,90 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare publishing throughput of single and pipelined publishing.
+
+Requires a running Rewind instance. Example usage::
+
+    rewind --query-bind-endpoint tcp://127.0.0.1:8090 &
+    python benchmarks/publish.py --query-endpoint tcp://127.0.0.1:8090
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.batch as batch
+
+
+def bench_single(context, endpoint, events):
+    """Publish `events` one by one using `publish_event`.
+
+    Returns the number of seconds it took.
+
+    """
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    try:
+        start = time.time()
+        for event in events:
+            clients.publish_event(socket, event)
+        return time.time() - start
+    finally:
+        socket.close()
+
+
+def bench_pipelined(context, endpoint, events, window):
+    """Publish `events` using `publish_events` over a DEALER socket.
+
+    Returns the number of seconds it took.
+
+    """
+    socket = context.socket(zmq.DEALER)
+    socket.connect(endpoint)
+    try:
+        start = time.time()
+        batch.publish_events(socket, events, window)
+        return time.time() - start
+    finally:
+        socket.close()
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--query-endpoint', default='tcp://127.0.0.1:8090',
+                        help='the query endpoint of a running Rewind.')
+    parser.add_argument('--events', type=int, default=10000,
+                        help='the number of events to publish per run.')
+    parser.add_argument('--size', type=int, default=100,
+                        help='the size of each event in bytes.')
+    parser.add_argument('--window', type=int, default=100,
+                        help='the number of in flight pipelined events.')
+    args = parser.parse_args(argv)
+
+    events = [b'x' * args.size] * args.events
+    context = zmq.Context(1)
+    try:
+        single = bench_single(context, args.query_endpoint, events)
+        pipelined = bench_pipelined(context, args.query_endpoint, events,
+                                    args.window)
+    finally:
+        context.term()
+
+    print("publish_event:  {0:10.0f} events/s".format(args.events / single))
+    print("publish_events: {0:10.0f} events/s (window={1})".format(
+        args.events / pipelined, args.window))
+    print("speedup:        {0:10.2f}x".format(single / pipelined))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Benchmark suite measuring the client against a fake Rewind.
+
+Measures throughput and latency percentiles of publishing, pipelined
+publishing, query replay and streamed consumption for a number of event sizes
+over inproc://, ipc:// and tcp:// transports. For ipc and tcp, the fake Rewind
+(see `rewind.client.testing`) runs in a separate process. For inproc, it has
+to run in a thread of the benchmarking process.
+
+Results are printed as a table and written as JSON so that they can be
+compared between runs. Example usage::
+
+    python benchmarks/suite.py --sizes 10 1000 --output results.json
+
+"""
+from __future__ import print_function
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.batch as batch
+import rewind.client.instrumentation as instrumentation
+import rewind.client.subscriber as subscriber
+from rewind.client.testing import FakeRewind
+
+
+TRANSPORTS = ('inproc', 'ipc', 'tcp')
+BENCHMARKS = ('publish', 'publish_pipelined', 'query', 'stream')
+
+_TIMESTAMP = struct.Struct('=d')
+
+
+def _endpoints(transport, tmpdir, port):
+    """Return the tuple `(query endpoint, stream endpoint)` for a transport."""
+    if transport == 'inproc':
+        return 'inproc://bench-query', 'inproc://bench-stream'
+    elif transport == 'ipc':
+        return ('ipc://' + os.path.join(tmpdir, 'query'),
+                'ipc://' + os.path.join(tmpdir, 'stream'))
+    else:
+        return ('tcp://127.0.0.1:{0}'.format(port),
+                'tcp://127.0.0.1:{0}'.format(port + 1))
+
+
+@contextlib.contextmanager
+def _fake_rewind(context, transport, query_endpoint, stream_endpoint):
+    """Run a fresh fake Rewind for the duration of the context."""
+    if transport == 'inproc':
+        server = FakeRewind(context, query_endpoint, stream_endpoint)
+        server.start()
+        try:
+            yield
+        finally:
+            server.stop()
+        return
+
+    process = subprocess.Popen([sys.executable, '-m', 'rewind.client.testing',
+                                '--query-endpoint', query_endpoint,
+                                '--stream-endpoint', stream_endpoint],
+                               stdout=subprocess.PIPE)
+    try:
+        # Wait for the sockets to be bound.
+        process.stdout.readline()
+        yield
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _percentile(sortedvalues, fraction):
+    """Return a percentile of a sorted list of values, or None if empty."""
+    if not sortedvalues:
+        return None
+    index = int(round(fraction * (len(sortedvalues) - 1)))
+    return sortedvalues[index]
+
+
+def _summarize(nevents, seconds, latencies):
+    """Return a result dictionary for a benchmark run."""
+    latencies = sorted(latencies)
+    p50 = _percentile(latencies, 0.5)
+    p99 = _percentile(latencies, 0.99)
+    return {
+        'events': nevents,
+        'seconds': seconds,
+        'events_per_sec': nevents / seconds if seconds else None,
+        'p50_ms': p50 * 1000 if p50 is not None else None,
+        'p99_ms': p99 * 1000 if p99 is not None else None,
+    }
+
+
+def _payload(size):
+    """Return an event of `size` bytes starting with the current time."""
+    stamp = _TIMESTAMP.pack(time.time())
+    return stamp + b'x' * max(0, size - len(stamp))
+
+
+def bench_publish(context, endpoints, nevents, size):
+    """Publish events one at a time, measuring every round trip."""
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoints[0])
+    try:
+        event = _payload(size)
+        latencies = []
+        start = time.time()
+        for _ in range(nevents):
+            sent = time.time()
+            clients.publish_event(socket, event)
+            latencies.append(time.time() - sent)
+        return _summarize(nevents, time.time() - start, latencies)
+    finally:
+        socket.close()
+
+
+def bench_publish_pipelined(context, endpoints, nevents, size):
+    """Publish events pipelined over a DEALER socket."""
+    socket = context.socket(zmq.DEALER)
+    socket.connect(endpoints[0])
+    try:
+        event = _payload(size)
+        start = time.time()
+        batch.publish_events(socket, (event for _ in range(nevents)))
+        return _summarize(nevents, time.time() - start, [])
+    finally:
+        socket.close()
+
+
+class _BatchLatencies(instrumentation.Instrumentation):
+
+    """Records the latency of every query batch."""
+
+    enabled = True
+
+    def __init__(self):
+        """Constructor."""
+        self.latencies = []
+
+    def query_batch(self, start, end, nevents, nbytes):
+        """Record the latency of a query batch."""
+        self.latencies.append(end - start)
+
+
+def bench_query(context, endpoints, nevents, size):
+    """Replay all events, measuring the latency of every batch."""
+    bench_publish_pipelined(context, endpoints, nevents, size)
+
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoints[0])
+    recorder = _BatchLatencies()
+    instrumentation.set_instrumentation(recorder)
+    try:
+        start = time.time()
+        nreplayed = sum(1 for _ in clients.query_events(socket))
+        seconds = time.time() - start
+    finally:
+        instrumentation.set_instrumentation(None)
+        socket.close()
+    assert nreplayed == nevents, (nreplayed, nevents)
+    return _summarize(nreplayed, seconds, recorder.latencies)
+
+
+def bench_stream(context, endpoints, nevents, size):
+    """Consume streamed events, measuring the publish to receive latency."""
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoints[0])
+    try:
+        lastid = None
+        for lastid, _ in clients.query_events(socket):
+            pass
+    finally:
+        socket.close()
+
+    sub = subscriber.Subscriber(context, endpoints[1], endpoints[0], lastid,
+                                profile='high-throughput')
+    # Give the subscription time to propagate.
+    time.sleep(0.5)
+
+    publisher = threading.Thread(target=bench_publish_pipelined,
+                                 args=(context, endpoints, nevents, size))
+    try:
+        latencies = []
+        start = time.time()
+        publisher.start()
+        events = iter(sub)
+        for _ in range(nevents):
+            _, eventdata = next(events)
+            sent, = _TIMESTAMP.unpack_from(eventdata)
+            latencies.append(time.time() - sent)
+        seconds = time.time() - start
+        publisher.join()
+    finally:
+        sub.close()
+    return _summarize(nevents, seconds, latencies)
+
+
+def run(transports, sizes, benchmarks, nevents, port):
+    """Run the benchmarks.
+
+    Returns a list of result dictionaries.
+
+    """
+    results = []
+    tmpdir = tempfile.mkdtemp()
+    context = zmq.Context(1)
+    try:
+        for transport in transports:
+            endpoints = _endpoints(transport, tmpdir, port)
+            for size in sizes:
+                for name in benchmarks:
+                    bench = globals()['bench_' + name]
+                    with _fake_rewind(context, transport, *endpoints):
+                        result = bench(context, endpoints, nevents, size)
+                    result.update(transport=transport, size=size,
+                                  benchmark=name)
+                    results.append(result)
+                    _print_result(result)
+    finally:
+        context.term()
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def _print_result(result):
+    """Print a benchmark result as a table row."""
+    def fmt(value, spec):
+        return '-' if value is None else format(value, spec)
+    print('{0:>8} {1:>8} {2:>18} {3:>12} {4:>10} {5:>10}'.format(
+        result['transport'], result['size'], result['benchmark'],
+        fmt(result['events_per_sec'], '.0f'), fmt(result['p50_ms'], '.3f'),
+        fmt(result['p99_ms'], '.3f')))
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    """Entry point of the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transports', nargs='+', choices=TRANSPORTS,
+                        default=list(TRANSPORTS),
+                        help='the transports to benchmark.')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS,
+                        default=list(BENCHMARKS),
+                        help='the benchmarks to run.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 1000, 100000],
+                        help='the event sizes, in bytes, to benchmark.')
+    parser.add_argument('--events', type=int, default=5000,
+                        help='the number of events per benchmark.')
+    parser.add_argument('--port', type=int, default=18090,
+                        help='the first of two TCP ports to use.')
+    parser.add_argument('--output', default='benchmark-results.json',
+                        help='the file to write JSON results to.')
+    args = parser.parse_args(argv)
+
+    print('{0:>8} {1:>8} {2:>18} {3:>12} {4:>10} {5:>10}'.format(
+        'transport', 'size', 'benchmark', 'events/s', 'p50 (ms)',
+        'p99 (ms)'))
+    results = run(args.transports, args.sizes, args.benchmarks, args.events,
+                  args.port)
+
+    document = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'pyzmq': zmq.pyzmq_version(),
+        'libzmq': zmq.zmq_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
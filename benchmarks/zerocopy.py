@@ -0,0 +1,109 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compare allocations and throughput of copying and zero-copy queries.
+
+For each event size, events are published to Rewind and then replayed twice:
+once with `copy=True` (the default) and once with `copy=False`. Requires a
+running Rewind instance and Python >= 3.4 for `tracemalloc`. Example usage::
+
+    rewind --query-bind-endpoint tcp://127.0.0.1:8090 &
+    python benchmarks/zerocopy.py --sizes 100 10000 100000
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+import time
+import tracemalloc
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.batch as batch
+
+
+def populate(context, endpoint, nevents, size):
+    """Publish `nevents` events of `size` bytes each to Rewind.
+
+    Returns the id of the event published right before them, or None.
+
+    """
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    try:
+        lastid = None
+        for lastid, _ in clients.query_events(socket):
+            pass
+    finally:
+        socket.close()
+
+    socket = context.socket(zmq.DEALER)
+    socket.connect(endpoint)
+    try:
+        batch.publish_events(socket, (b'x' * size for _ in range(nevents)))
+    finally:
+        socket.close()
+    return lastid
+
+
+def replay(context, endpoint, from_, copy):
+    """Replay events after `from_`, touching every event's data.
+
+    Returns the tuple `(nevents, seconds, peak allocated bytes)`.
+
+    """
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    try:
+        tracemalloc.start()
+        start = time.time()
+        nevents = 0
+        nbytes = 0
+        for _, eventdata in clients.query_events(socket, from_, copy=copy):
+            nevents += 1
+            nbytes += len(eventdata)
+        seconds = time.time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return nevents, seconds, peak
+    finally:
+        socket.close()
+
+
+def main(argv=None):
+    """Entry point of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--query-endpoint', default='tcp://127.0.0.1:8090',
+                        help='the query endpoint of a running Rewind.')
+    parser.add_argument('--events', type=int, default=2000,
+                        help='the number of events to publish per size.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 10000, 100000],
+                        help='the event sizes, in bytes, to benchmark.')
+    args = parser.parse_args(argv)
+
+    context = zmq.Context(1)
+    try:
+        print("{0:>8} {1:>6} {2:>14} {3:>16}".format("size", "copy",
+                                                     "events/s",
+                                                     "peak alloc (kB)"))
+        for size in args.sizes:
+            from_ = populate(context, args.query_endpoint, args.events, size)
+            for copy in (True, False):
+                nevents, seconds, peak = replay(context, args.query_endpoint,
+                                                from_, copy)
+                assert nevents == args.events, nevents
+                print("{0:8d} {1:>6} {2:14.0f} {3:16.1f}".format(
+                    size, str(copy), nevents / seconds, peak / 1024.0))
+    finally:
+        context.term()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,15 +5,77 @@
 # This program is distributed under the MIT License. See the file LICENSE.txt
 # for details.
 
-"""Network clients used to communicate with the Rewind server."""
-import logging
+"""Network clients used to communicate with the Rewind server.
+
+ZeroMQ is not imported until it is first needed, which keeps importing this
+module cheap for short-lived processes that might never talk to Rewind.
 
-import zmq
+"""
+import importlib
+import logging
+import threading
+import time
 
+from rewind.client import instrumentation
 
 logger = logging.getLogger(__name__)
 
 
+class _LazyModule(object):
+
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        """Constructor.
+
+        Parameters:
+        name -- the name of the module, which must also be the name of the
+                global variable holding the stand-in.
+
+        """
+        self._name = name
+
+    def __getattr__(self, attr):
+        """Import the module, replace the stand-in and get the attribute."""
+        module = importlib.import_module(self._name)
+        globals()[self._name] = module
+        return getattr(module, attr)
+
+
+zmq = _LazyModule('zmq')
+
+
+class Statistics(object):
+
+    """Counters of noteworthy things happening in the client.
+
+    Attributes:
+    hwm_fallbacks -- the number of times a streamed event revealed that
+                     events had been dropped, usually because the high
+                     watermark of the stream socket was reached, and a query
+                     was needed to catch up.
+
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters to zero."""
+        self.hwm_fallbacks = 0
+
+    def count_hwm_fallback(self):
+        """Count a high watermark fallback."""
+        with self._lock:
+            self.hwm_fallbacks += 1
+
+
+# Statistics for all the sockets of this process.
+statistics = Statistics()
+
+
 class QueryException(Exception):
 
     """Raised when rewind server returns an error.
@@ -25,45 +87,80 @@ class QueryException(Exception):
     pass
 
 
-def query_events(socket, from_=None, to=None):
+class TimeoutException(Exception):
+
+    """Raised when Rewind did not reply within the given timeout.
+
+    The REQ socket used is left waiting for the reply and can not be used for
+    further requests. Close it, preferably with a zero linger, and connect a
+    new one. `rewind.client.pool.RewindPool` does this automatically.
+
+    """
+
+    pass
+
+
+def query_events(socket, from_=None, to=None, copy=True, timeout=None):
     """Yield a queried range of events.
 
     Parameters:
-    socket -- ZeroMQ socket to use. It must be previously connected to
-              a Rewind instance and of type REQ.
-    from_  -- the (optional) event id for the (chronologically) earliest end
-              of the range. It is exclusive. If not specified, or None, all
-              events from beginning of time are queried for.
-    to     -- the (optional) event id for the (chronologically) latest end of
-              the range. It is exclusive. If not specified, or None, all
-              events up to the latest event seen are queried for.
+    socket  -- ZeroMQ socket to use. It must be previously connected to
+               a Rewind instance and of type REQ.
+    from_   -- the (optional) event id for the (chronologically) earliest end
+               of the range. It is exclusive. If not specified, or None, all
+               events from beginning of time are queried for.
+    to      -- the (optional) event id for the (chronologically) latest end of
+               the range. It is inclusive. If not specified, or None, all
+               events up to the latest event seen are queried for.
+    copy    -- whether event data should be copied into `bytes` objects. If
+               False, event data is yielded as read-only `memoryview`s of the
+               received ZeroMQ frames. This saves a copy per event and pays
+               off for large events. Event ids are always `bytes`.
+    timeout -- the (optional) maximum number of seconds to wait for each
+               batch of events. If not specified, or None, waits forever.
 
     Raises `QueryException` if a query failed. Usually this is raised because a
-    given `from_` or `to` does not exist in the event store.
+    given `from_` or `to` does not exist in the event store. Raises
+    `TimeoutException` if Rewind did not reply in time.
 
     This function returns nothing, but yields events that are returned.
 
     """
     assert from_ is None or isinstance(from_, bytes)
     assert to is None or isinstance(to, bytes)
+    query = _real_query if copy else _real_query_nocopy
+    instr = instrumentation.current
+    if instr.enabled:
+        querystart = time.time()
+        nevents = 0
     first_msg = True
     done = False
     while not done:
         # _real_query(...) are giving us events in small batches
-        done, events = _real_query(socket, from_, to)
+        if instr.enabled:
+            batchstart = time.time()
+            done, events = query(socket, from_, to, timeout)
+            instr.query_batch(batchstart, time.time(), len(events),
+                              sum(len(eventdata) for _, eventdata in events))
+            nevents += len(events)
+        else:
+            done, events = query(socket, from_, to, timeout)
         for eventid, eventdata in events:
             if first_msg:
                 assert eventid != from_, "First message ID wrong"
                 first_msg = False
             from_ = eventid
             yield (eventid, eventdata)
+    if instr.enabled:
+        instr.query(querystart, time.time(), nevents)
 
 
-def _real_query(socket, from_, to):
+def _real_query(socket, from_, to, timeout=None):
     """Make the actual query for events.
 
     Since the Rewind streams events in batches, this method might not
-    receive all requested events.
+    receive all requested events. Raises `TimeoutException` if no reply was
+    received within `timeout` seconds, unless it is None.
 
     Returns the tuple `(done, events)` where
      * `done` is a boolean whether the limited query result reached the
@@ -78,6 +175,7 @@ def _real_query(socket, from_, to):
     socket.send(b'QUERY', zmq.SNDMORE)
     socket.send(from_ if from_ else b'', zmq.SNDMORE)
     socket.send(to if to else b'')
+    _wait_for_reply(socket, timeout)
 
     more = True
     done = False
@@ -106,11 +204,147 @@ def _real_query(socket, from_, to):
     return done, events
 
 
-def _get_single_streamed_event(streamsock):
+def _real_query_multipart(socket, from_, to, timeout=None):
+    """Make the actual query for events, receiving the reply in one go.
+
+    Behaves like `_real_query`, but receives the whole reply using a single
+    `recv_multipart()` call instead of one `recv()` per frame. This is cheaper
+    and holds on to the GIL for a shorter time, which matters when querying in
+    a background thread.
+
+    """
+    assert from_ is None or isinstance(from_, bytes), type(from_)
+    assert to is None or isinstance(to, bytes), type(to)
+    socket.send_multipart([b'QUERY', from_ if from_ else b'',
+                           to if to else b''])
+    _wait_for_reply(socket, timeout)
+    return _parse_query_reply(socket.recv_multipart())
+
+
+def _real_query_nocopy(socket, from_, to, timeout=None):
+    """Make the actual query for events without copying event data.
+
+    Behaves like `_real_query_multipart`, but each `eventdata` is a read-only
+    `memoryview` of the received frame rather than a byte string.
+
+    """
+    assert from_ is None or isinstance(from_, bytes), type(from_)
+    assert to is None or isinstance(to, bytes), type(to)
+    socket.send_multipart([b'QUERY', from_ if from_ else b'',
+                           to if to else b''])
+    _wait_for_reply(socket, timeout)
+    frames = socket.recv_multipart(copy=False)
+    done = _pop_query_terminator(frames, lambda frame: frame.bytes)
+    events = [(idframe.bytes, dataframe.buffer)
+              for idframe, dataframe in zip(frames[0::2], frames[1::2])]
+    return done, events
+
+
+def _query_batches(socket, from_, to, timeout=None):
+    """Query for a range of events, yielding the frames of every batch.
+
+    Keeps querying for the events following the last received one until
+    Rewind replies with `END`. Raises `QueryException` if a query failed,
+    and `TimeoutException` if no reply was received within `timeout`
+    seconds, unless it is None.
+
+    This function returns nothing, but yields a non-empty list of
+    `zmq.Frame`s per batch, alternating event ids and event data.
+
+    """
+    assert from_ is None or isinstance(from_, bytes), type(from_)
+    assert to is None or isinstance(to, bytes), type(to)
+    done = False
+    while not done:
+        socket.send_multipart([b'QUERY', from_ if from_ else b'',
+                               to if to else b''])
+        _wait_for_reply(socket, timeout)
+        frames = _recv_frames(socket)
+        done = _pop_query_terminator(frames, lambda frame: frame.bytes)
+        if frames:
+            from_ = frames[-2].bytes
+            yield frames
+
+
+def _wait_for_reply(socket, timeout):
+    """Wait for a reply to arrive on a socket.
+
+    Parameters:
+    socket  -- the socket a request has been sent on.
+    timeout -- the maximum number of seconds to wait, or None to not wait at
+               all but leave it to the following blocking receive.
+
+    Raises `TimeoutException` if no reply arrived in time.
+
+    """
+    if timeout is None:
+        return
+    if not socket.poll(int(timeout * 1000), zmq.POLLIN):
+        raise TimeoutException("No reply within {0} seconds.".format(timeout))
+
+
+def _recv_frames(socket):
+    """Receive all frames of a multipart message as `zmq.Frame`s.
+
+    Checking `Frame.more` is considerably cheaper than the `RCVMORE` socket
+    option lookup `recv_multipart` does for every frame.
+
+    """
+    frames = []
+    recv = socket.recv
+    while True:
+        frame = recv(copy=False)
+        frames.append(frame)
+        if not frame.more:
+            return frames
+
+
+def _parse_query_reply(frames):
+    """Parse a complete multipart query reply.
+
+    Parameters:
+    frames -- a list of the received frames.
+
+    Returns the tuple `(done, events)`. See `_real_query` for details.
+
+    """
+    done = _pop_query_terminator(frames)
+    events = list(zip(frames[0::2], frames[1::2]))
+    return done, events
+
+
+def _pop_query_terminator(frames, tobytes=bytes):
+    """Remove any terminating frame from a complete multipart query reply.
+
+    Parameters:
+    frames  -- a list of the received frames. Modified in place.
+    tobytes -- function converting a frame to a byte string.
+
+    Returns whether the reply ended with `END`. Raises `QueryException` if the
+    reply was an error.
+
+    """
+    if len(frames) % 2 == 0:
+        return False
+
+    # Event frames come in pairs, so an odd frame out is a terminator.
+    terminator = tobytes(frames.pop())
+    if terminator == b"END":
+        return True
+    elif terminator.startswith(b"ERROR"):
+        assert not frames, frames
+        raise QueryException("Could not query: {0}".format(terminator))
+    else:
+        assert False, "Unknown terminating frame: {0}".format(terminator)
+
+
+def _get_single_streamed_event(streamsock, copy=True):
     """Retrieve a streamed event off a socket.
 
     Parameters:
     streamsock -- the stream socket to be reading from.
+    copy       -- whether `eventdata` should be copied into a byte string
+                  rather than being a `memoryview` of the received frame.
 
     Returns a tuple consisting of:
         eventid     -- the ID of the streamed event
@@ -119,6 +353,12 @@ def _get_single_streamed_event(streamsock):
         eventdata   -- the (serialized) data for the event.
 
     """
+    if not copy:
+        frames = streamsock.recv_multipart(copy=False)
+        assert len(frames) == 3, len(frames)
+        eventid, lasteventid, eventdata = frames
+        return eventid.bytes, lasteventid.bytes, eventdata.buffer
+
     eventid = streamsock.recv()
     assert streamsock.getsockopt(zmq.RCVMORE)
     lasteventid = streamsock.recv()
@@ -128,11 +368,13 @@ def _get_single_streamed_event(streamsock):
     return eventid, lasteventid, eventdata
 
 
-def yield_events_after(streamsock, reqsock, lasteventid=None):
+def yield_events_after(streamsock, reqsock, lasteventid=None, copy=True):
     """Generator that yields all the missed out events.
 
     Parameters:
     lasteventid -- the event id of the last seen event.
+    copy        -- whether event data should be copied into byte strings. See
+                   `query_events`.
 
     TODO: Handle when there is no lasteventid.
 
@@ -140,7 +382,8 @@ def yield_events_after(streamsock, reqsock, lasteventid=None):
     assert lasteventid is None or isinstance(lasteventid, bytes)
     funclogger = logger.getChild('yield_events_after')
 
-    cureventid, preveventid, evdata = _get_single_streamed_event(streamsock)
+    cureventid, preveventid, evdata = _get_single_streamed_event(streamsock,
+                                                                 copy)
 
     if preveventid != lasteventid and preveventid != b'':
         # Making sure we did not reach high watermark inbetween here.
@@ -148,27 +391,44 @@ def yield_events_after(streamsock, reqsock, lasteventid=None):
         msg = ('Seem to have reached high watermark. Doing manually querying'
                ' to catch up.')
         funclogger.info(msg)
+        statistics.count_hwm_fallback()
 
+        catchupstart = time.time()
+        nevents = 0
         for qeventid, qeventdata in query_events(reqsock, lasteventid,
-                                                 preveventid):
+                                                 preveventid, copy):
             # Note that this for loop's last event will be preveventid since
             # its last element is inclusive.
+            nevents += 1
             yield qeventid, qeventdata
+        instrumentation.current.catchup(catchupstart, time.time(), nevents)
 
     yield cureventid, evdata
 
 
-def publish_event(socket, event):
+def publish_event(socket, event, timeout=None):
     """Publish a new event to Rewind.
 
     Parameters:
-    socket -- a ZeroMQ REQ socket connected to a Rewind instance.
-    event  -- event to be published. Is instance of bytes.
+    socket  -- a ZeroMQ REQ socket connected to a Rewind instance.
+    event   -- event to be published. Is instance of bytes.
+    timeout -- the (optional) maximum number of seconds to wait for Rewind to
+               acknowledge the event. If not specified, or None, waits
+               forever.
+
+    Raises `TimeoutException` if the event was not acknowledged in time. The
+    event might still have been published.
 
     """
     assert isinstance(event, bytes), type(event)
+    instr = instrumentation.current
+    if instr.enabled:
+        start = time.time()
     socket.send(b'PUBLISH', zmq.SNDMORE)
     socket.send(event)
+    _wait_for_reply(socket, timeout)
     response = socket.recv()
     assert response == b'PUBLISHED'
     assert not socket.getsockopt(zmq.RCVMORE)
+    if instr.enabled:
+        instr.publish(start, time.time(), len(event))
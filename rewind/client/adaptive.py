@@ -0,0 +1,201 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Querying with a batch size adapted to the events and the connection.
+
+Rewind answers a query in batches of a size of its own choosing, and every
+batch costs a round trip. `query_events` in this module asks for batches of
+a given size by appending a batch size hint to its `QUERY` requests::
+
+    QUERY <from> <to> <batch size hint>
+
+A `BatchSizeController` picks the hint. It grows the hint additively as long
+as doing so does not lower the observed throughput in events per second, and
+halves it when throughput drops or a batch exceeds the memory cap. The hint
+never asks for more event data than the memory cap allows, judging by the
+average size of the events seen so far::
+
+    controller = BatchSizeController(max_bytes=8 * 1024 * 1024, hints=True)
+    for eventid, eventdata in adaptive.query_events(socket,
+                                                    controller=controller):
+        ...
+
+Reusing a controller between queries carries what it has learnt over.
+
+Hints are only sent if enabled using `hints=True`, and only servers known to
+accept them should be queried with hints enabled. Rewind itself does not
+accept a fourth `QUERY` frame, and its query loop fails on one. Without
+hints, queries are answered in batches of the size picked by the server.
+Servers that accept the hint but send smaller batches cap the hint.
+
+"""
+import logging
+import time
+
+from rewind.client import _pop_query_terminator
+from rewind.client import _recv_frames
+from rewind.client import _wait_for_reply
+from rewind.client import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class BatchSizeController(object):
+
+    """Adapts a batch size hint to observed throughput, AIMD style.
+
+    Attributes:
+    supported -- whether the server accepts batch size hints, which are
+                 only sent if it does. See `hints` of the constructor.
+
+    """
+
+    def __init__(self, initial=100, minimum=10, maximum=10000,
+                 max_bytes=16 * 1024 * 1024, step=None, backoff=0.5,
+                 tolerance=0.9, hints=False):
+        """Constructor.
+
+        Parameters:
+        initial   -- the first batch size hint.
+        minimum   -- the smallest batch size hint.
+        maximum   -- the largest batch size hint.
+        max_bytes -- the memory cap; the most event data a batch should hold.
+        step      -- the number of events to grow the hint by. Defaults to
+                     `initial`.
+        backoff   -- the factor to shrink the hint by.
+        tolerance -- how large a fraction of the throughput of the previous
+                     batch a batch must reach for the hint to grow.
+        hints     -- whether to send batch size hints. Only enable for servers
+                     known to accept them.
+
+        """
+        assert 1 <= minimum <= initial <= maximum
+        assert 0 < backoff < 1
+        self._size = initial
+        self._minimum = minimum
+        self._maximum = maximum
+        self._max_bytes = max_bytes
+        self._step = step or initial
+        self._backoff = backoff
+        self._tolerance = tolerance
+
+        self._rate = None
+        self._eventsize = None
+        self.supported = hints
+
+    @property
+    def hint(self):
+        """The batch size to ask for next."""
+        if self._eventsize:
+            fitting = int(self._max_bytes // self._eventsize)
+            return max(self._minimum, min(self._size, fitting))
+        return self._size
+
+    def observe(self, nevents, nbytes, seconds, done):
+        """Adapt the hint to a received batch.
+
+        Parameters:
+        nevents -- the number of events in the batch.
+        nbytes  -- the total size of the event data in the batch.
+        seconds -- the time from sending the query to receiving the batch.
+        done    -- whether the batch ended the query.
+
+        """
+        if not nevents or not self.supported:
+            return
+        asked = self.hint
+        self._eventsize = float(nbytes) / nevents
+        if done:
+            # The last batch is cut short by the end of the range and says
+            # nothing about the batch size.
+            return
+        if nevents < asked:
+            # The server caps, or ignores, the hint. Asking for more than it
+            # sends is pointless.
+            self._size = max(self._minimum, nevents)
+            self._rate = None
+            return
+
+        rate = nevents / max(seconds, 1e-9)
+        if nbytes > self._max_bytes:
+            self._shrink()
+        elif self._rate is None or rate >= self._rate * self._tolerance:
+            self._size = min(self._maximum, self._size + self._step)
+        else:
+            self._shrink()
+        self._rate = rate
+
+    def _shrink(self):
+        """Multiplicatively decrease the hint."""
+        self._size = max(self._minimum, int(self._size * self._backoff))
+
+
+def query_events(socket, from_=None, to=None, copy=True, timeout=None,
+                 controller=None):
+    """Yield a queried range of events, in batches of an adaptive size.
+
+    Parameters:
+    socket     -- ZeroMQ socket to use. It must be previously connected to a
+                  Rewind instance and of type REQ.
+    from_      -- see `rewind.client.query_events`.
+    to         -- see `rewind.client.query_events`.
+    copy       -- see `rewind.client.query_events`.
+    timeout    -- see `rewind.client.query_events`.
+    controller -- the (optional) `BatchSizeController` to pick batch sizes.
+                  A new one is created if not given.
+
+    Raises `QueryException` if a query failed, and `TimeoutException` if
+    Rewind did not reply in time.
+
+    This function returns nothing, but yields events that are returned.
+
+    """
+    assert from_ is None or isinstance(from_, bytes)
+    assert to is None or isinstance(to, bytes)
+    if controller is None:
+        controller = BatchSizeController()
+    instr = instrumentation.current
+    if instr.enabled:
+        querystart = time.time()
+        nevents = 0
+    done = False
+    while not done:
+        batchstart = time.time()
+        done, events, nbytes = _query_hinted(socket, from_, to, copy, timeout,
+                                             controller)
+        batchend = time.time()
+        controller.observe(len(events), nbytes, batchend - batchstart, done)
+        if instr.enabled:
+            instr.query_batch(batchstart, batchend, len(events), nbytes)
+            nevents += len(events)
+        if events:
+            from_ = events[-1][0]
+        for event in events:
+            yield event
+    if instr.enabled:
+        instr.query(querystart, time.time(), nevents)
+
+
+def _query_hinted(socket, from_, to, copy, timeout, controller):
+    """Query for a batch of events, hinting its size if supported.
+
+    Returns the tuple `(done, events, nbytes)` where `nbytes` is the total
+    size of the event data. See `rewind.client._real_query` for `done` and
+    `events`.
+
+    """
+    request = [b'QUERY', from_ if from_ else b'', to if to else b'']
+    if controller.supported:
+        request.append(str(controller.hint).encode())
+    socket.send_multipart(request)
+    _wait_for_reply(socket, timeout)
+    frames = _recv_frames(socket)
+    done = _pop_query_terminator(frames, lambda frame: frame.bytes)
+    events = [(idframe.bytes, dataframe.bytes if copy else dataframe.buffer)
+              for idframe, dataframe in zip(frames[0::2], frames[1::2])]
+    nbytes = sum(len(dataframe) for dataframe in frames[1::2])
+    return done, events, nbytes
@@ -0,0 +1,132 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Asyncio flavoured network clients used to communicate with Rewind.
+
+The functions in this module mirror the ones in `rewind.client`, but never
+block the calling thread. They must be given sockets created from a
+`zmq.asyncio.Context` so that a single event loop can serve many sockets.
+
+This module requires Python >= 3.6 and a pyzmq version shipping
+`zmq.asyncio`.
+
+"""
+import logging
+
+from rewind.client import _parse_query_reply
+
+
+logger = logging.getLogger(__name__)
+
+
+async def query_events(socket, from_=None, to=None):
+    """Asynchronously yield a queried range of events.
+
+    Parameters:
+    socket -- asyncio ZeroMQ socket to use. It must be previously connected to
+              a Rewind instance and of type REQ.
+    from_  -- the (optional) event id for the (chronologically) earliest end
+              of the range. It is exclusive. If not specified, or None, all
+              events from beginning of time are queried for.
+    to     -- the (optional) event id for the (chronologically) latest end of
+              the range. It is inclusive. If not specified, or None, all
+              events up to the latest event seen are queried for.
+
+    Raises `QueryException` if a query failed.
+
+    See `rewind.client.query_events` for more information.
+
+    """
+    assert from_ is None or isinstance(from_, bytes)
+    assert to is None or isinstance(to, bytes)
+    first_msg = True
+    done = False
+    while not done:
+        done, events = await _real_query(socket, from_, to)
+        for eventid, eventdata in events:
+            if first_msg:
+                assert eventid != from_, "First message ID wrong"
+                first_msg = False
+            from_ = eventid
+            yield (eventid, eventdata)
+
+
+async def _real_query(socket, from_, to):
+    """Make the actual query for events.
+
+    Returns the tuple `(done, events)`. See `rewind.client._real_query` for
+    more information.
+
+    """
+    assert from_ is None or isinstance(from_, bytes), type(from_)
+    assert to is None or isinstance(to, bytes), type(to)
+    await socket.send_multipart([b'QUERY', from_ if from_ else b'',
+                                 to if to else b''])
+
+    return _parse_query_reply(await socket.recv_multipart())
+
+
+async def _get_single_streamed_event(streamsock):
+    """Retrieve a streamed event off a socket.
+
+    Returns a tuple consisting of `(eventid, lasteventid, eventdata)`. See
+    `rewind.client._get_single_streamed_event` for more information.
+
+    """
+    frames = await streamsock.recv_multipart()
+    assert len(frames) == 3, frames
+    eventid, lasteventid, eventdata = frames
+    return eventid, lasteventid, eventdata
+
+
+async def yield_events_after(streamsock, reqsock, lasteventid=None):
+    """Asynchronous generator that yields all the missed out events.
+
+    Parameters:
+    streamsock  -- asyncio ZeroMQ SUB socket connected to the streaming
+                   endpoint of a Rewind instance.
+    reqsock     -- asyncio ZeroMQ REQ socket connected to the query endpoint
+                   of the same Rewind instance.
+    lasteventid -- the event id of the last seen event.
+
+    See `rewind.client.yield_events_after` for more information.
+
+    """
+    assert lasteventid is None or isinstance(lasteventid, bytes)
+    funclogger = logger.getChild('yield_events_after')
+
+    cureventid, preveventid, evdata = await _get_single_streamed_event(
+        streamsock)
+
+    if preveventid != lasteventid and preveventid != b'':
+        # Making sure we did not reach high watermark inbetween here.
+
+        msg = ('Seem to have reached high watermark. Doing manually querying'
+               ' to catch up.')
+        funclogger.info(msg)
+
+        async for qeventid, qeventdata in query_events(reqsock, lasteventid,
+                                                       preveventid):
+            # Note that this for loop's last event will be preveventid since
+            # its last element is inclusive.
+            yield qeventid, qeventdata
+
+    yield cureventid, evdata
+
+
+async def publish_event(socket, event):
+    """Publish a new event to Rewind.
+
+    Parameters:
+    socket -- an asyncio ZeroMQ REQ socket connected to a Rewind instance.
+    event  -- event to be published. Is instance of bytes.
+
+    """
+    assert isinstance(event, bytes), type(event)
+    await socket.send_multipart([b'PUBLISH', event])
+    response = await socket.recv_multipart()
+    assert response == [b'PUBLISHED'], response
@@ -0,0 +1,178 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Pipelined publishing of many events over a single connection.
+
+`rewind.client.publish_event` waits for Rewind to acknowledge every event
+before the next one can be sent, capping throughput at one event per network
+round trip. The publisher in this module instead talks to Rewind over a
+ZeroMQ DEALER socket, which lets it keep a bounded number of events in flight
+while acknowledgements trickle back.
+
+"""
+import collections
+
+import zmq
+
+from rewind.client import _wait_for_reply
+
+
+class PublishException(Exception):
+
+    """Raised when Rewind did not acknowledge one or more published events.
+
+    The `failures` attribute is a list of `(seqno, event, response)` tuples,
+    one for each event that was not acknowledged with `PUBLISHED`.
+
+    """
+
+    def __init__(self, failures):
+        """Constructor.
+
+        Parameters:
+        failures -- a list of `(seqno, event, response)` tuples.
+
+        """
+        msg = "{0} event(s) could not be published".format(len(failures))
+        super(PublishException, self).__init__(msg)
+        self.failures = failures
+
+
+class BatchPublisher(object):
+
+    """Publishes events to Rewind without waiting for each acknowledgement.
+
+    Every published event is given a sequence number, starting at zero. Rewind
+    acknowledges events in the order they were sent, so acknowledgements are
+    matched up against the oldest event still in flight. At most `window`
+    events are left unacknowledged; publishing beyond that blocks until the
+    oldest acknowledgement has been received.
+
+    Events that Rewind responded to with something else than `PUBLISHED` are
+    collected and returned by `flush()`.
+
+    """
+
+    def __init__(self, socket, window=100, timeout=None):
+        """Constructor.
+
+        Parameters:
+        socket  -- ZeroMQ socket to use. It must be of type DEALER and
+                   connected to exactly one Rewind instance.
+                   Acknowledgements can't be matched to events if the socket
+                   load balances between multiple instances.
+        window  -- the maximum number of unacknowledged events allowed in
+                   flight.
+        timeout -- the (optional) maximum number of seconds to wait for each
+                   acknowledgement. If not specified, or None, waits forever.
+                   Waiting longer raises `rewind.client.TimeoutException`,
+                   after which the publisher and its socket should be
+                   discarded.
+
+        """
+        assert window > 0, window
+        self._socket = socket
+        self._window = window
+        self._timeout = timeout
+        self._inflight = collections.deque()
+        self._failures = []
+        self._seqno = 0
+
+    @property
+    def sent(self):
+        """The number of events sent so far."""
+        return self._seqno
+
+    @property
+    def inflight(self):
+        """The number of events awaiting acknowledgement."""
+        return len(self._inflight)
+
+    def publish(self, event):
+        """Send an event to Rewind without waiting for it to be acknowledged.
+
+        Parameters:
+        event -- event to be published. Is instance of bytes.
+
+        Returns the sequence number given to the event.
+
+        """
+        assert isinstance(event, bytes), type(event)
+        while len(self._inflight) >= self._window:
+            self._recv_ack()
+
+        # The empty frame is the envelope delimiter that a REQ socket would
+        # otherwise have added for us.
+        self._socket.send(b'', zmq.SNDMORE)
+        self._socket.send(b'PUBLISH', zmq.SNDMORE)
+        self._socket.send(event)
+
+        seqno = self._seqno
+        self._seqno += 1
+        self._inflight.append((seqno, event))
+        return seqno
+
+    def flush(self):
+        """Wait for all events in flight to be acknowledged.
+
+        Returns a list of `(seqno, event, response)` tuples for every event
+        that failed since the last call to `flush()`.
+
+        """
+        while self._inflight:
+            self._recv_ack()
+        failures, self._failures = self._failures, []
+        return failures
+
+    def _recv_ack(self):
+        """Receive the acknowledgement of the oldest event in flight."""
+        _wait_for_reply(self._socket, self._timeout)
+        delimiter, response = self._socket.recv_multipart()
+        assert delimiter == b'', delimiter
+
+        seqno, event = self._inflight.popleft()
+        if response != b'PUBLISHED':
+            self._failures.append((seqno, event, response))
+
+    def __enter__(self):
+        """Enter the runtime context of the publisher."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Wait for outstanding acknowledgements.
+
+        Raises `PublishException` if any event failed to be published, unless
+        the context is exited because of another exception.
+
+        """
+        if exc_type is not None:
+            return
+        failures = self.flush()
+        if failures:
+            raise PublishException(failures)
+
+
+def publish_events(socket, events, window=100):
+    """Publish many events to Rewind, pipelining them over one connection.
+
+    Parameters:
+    socket -- ZeroMQ socket to use. It must be of type DEALER and connected to
+              exactly one Rewind instance.
+    events -- an iterable of events to be published. Each event is an instance
+              of bytes.
+    window -- the maximum number of unacknowledged events allowed in flight.
+
+    Raises `PublishException` if Rewind failed to acknowledge any of the
+    events. All other events have been published by then.
+
+    Returns the number of events published.
+
+    """
+    with BatchPublisher(socket, window) as publisher:
+        for event in events:
+            publisher.publish(event)
+    return publisher.sent
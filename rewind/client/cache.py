@@ -0,0 +1,469 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Local on-disk cache of queried events.
+
+Rebuilding projections usually means replaying the whole history from Rewind.
+The `SegmentCache` keeps a contiguous, chronologically ordered run of events
+in append-only segment files on local disk. `CachingQuerier` serves queries
+from the cache where possible and only asks Rewind for events newer than the
+last cached one.
+
+A segment file starts with a header holding the id of the event preceding the
+segment's first event, followed by records of the form::
+
+    <4 byte id length><4 byte data length><event id><event data>
+
+with lengths in network byte order. Segments are memory-mapped when read.
+When the cache outgrows its size cap, the oldest segments are evicted.
+
+"""
+import logging
+import mmap
+import os
+import struct
+
+from rewind.client import query_events
+from rewind.client.index import EventIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+_MAGIC = b'RWC1'
+_HEADER = struct.Struct('>i')
+_RECORD = struct.Struct('>II')
+_SEGMENT_SUFFIX = '.seg'
+
+# Index values pack the segment sequence number above the record offset.
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+
+class _Segment(object):
+
+    """A single segment file of the cache."""
+
+    def __init__(self, path, seqno, base):
+        """Constructor.
+
+        Parameters:
+        path  -- the path to the segment file.
+        seqno -- the sequence number of the segment.
+        base  -- the id of the event preceding the first event of this
+                 segment, or None if the segment starts at the beginning of
+                 history.
+
+        """
+        self.path = path
+        self.seqno = seqno
+        self.base = base
+        self.size = 0
+        self.lastid = None
+
+    @staticmethod
+    def create(path, seqno, base):
+        """Create a new, empty segment file."""
+        segment = _Segment(path, seqno, base)
+        with open(path, 'wb') as f:
+            f.write(segment._encode_header())
+        segment.size = os.path.getsize(path)
+        return segment
+
+    @staticmethod
+    def load(path, seqno):
+        """Open an existing segment file.
+
+        Returns None if the file is not a valid segment.
+
+        """
+        with open(path, 'rb') as f:
+            magic = f.read(len(_MAGIC))
+            rawlen = f.read(_HEADER.size)
+            if magic != _MAGIC or len(rawlen) != _HEADER.size:
+                return None
+            baselen, = _HEADER.unpack(rawlen)
+            base = None if baselen < 0 else f.read(baselen)
+        segment = _Segment(path, seqno, base)
+        segment.size = os.path.getsize(path)
+        return segment
+
+    @property
+    def header_size(self):
+        """The size of the segment header in bytes."""
+        baselen = 0 if self.base is None else len(self.base)
+        return len(_MAGIC) + _HEADER.size + baselen
+
+    def _encode_header(self):
+        """Return the header of this segment."""
+        if self.base is None:
+            return _MAGIC + _HEADER.pack(-1)
+        return _MAGIC + _HEADER.pack(len(self.base)) + self.base
+
+    def record_id(self, offset):
+        """Return the event id of the record at `offset`, or None."""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            header = f.read(_RECORD.size)
+            if len(header) != _RECORD.size:
+                return None
+            idlen, _ = _RECORD.unpack(header)
+            return f.read(idlen)
+
+    def records(self, offset=None):
+        """Yield `(offset, eventid, eventdata)` of every record in the segment.
+
+        Parameters:
+        offset -- the offset of the first record to yield. Defaults to the
+                  first record of the segment.
+
+        A truncated record at the end of the file, left behind by a crash, is
+        silently ignored.
+
+        """
+        if offset is None:
+            offset = self.header_size
+        if self.size <= offset:
+            return
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = min(self.size, len(mapped))
+            while offset + _RECORD.size <= end:
+                idlen, datalen = _RECORD.unpack_from(mapped, offset)
+                start = offset + _RECORD.size
+                if start + idlen + datalen > end:
+                    break
+                eventid = mapped[start:start + idlen]
+                eventdata = mapped[start + idlen:start + idlen + datalen]
+                yield offset, eventid, eventdata
+                offset = start + idlen + datalen
+        finally:
+            mapped.close()
+
+
+class SegmentCache(object):
+
+    """An append-only, size capped, on-disk cache of events.
+
+    The cache holds a contiguous run of events. `base` is the id of the event
+    preceding the first cached event and `last` the id of the last cached
+    event. Events can only be appended right after `last`.
+
+    The cache is not thread-safe and must not be shared between processes.
+
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, segment_bytes=1 << 26):
+        """Constructor.
+
+        Opens the cache in `directory`, creating the directory if needed.
+        Events cached by earlier runs are picked up.
+
+        Parameters:
+        directory     -- the directory holding the segment files.
+        max_bytes     -- the size cap of the cache. Oldest segments are
+                         evicted when the cache grows beyond it.
+        segment_bytes -- the size at which a new segment is started.
+
+        """
+        assert segment_bytes <= max_bytes, (segment_bytes, max_bytes)
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+        self._segments = []
+        # Segments by sequence number. Invalid segments are skipped when
+        # loading, so sequence numbers are not necessarily contiguous.
+        self._seqnos = {}
+        self._index = EventIndex()
+        self._writer = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._load()
+
+    def _load(self):
+        """Load the existing segments and build the index."""
+        seqnos = sorted(int(filename[:-len(_SEGMENT_SUFFIX)])
+                        for filename in os.listdir(self._directory)
+                        if filename.endswith(_SEGMENT_SUFFIX))
+        for seqno in seqnos:
+            path = self._segment_path(seqno)
+            segment = _Segment.load(path, seqno)
+            if segment is None:
+                logger.warning("Ignoring invalid cache segment %s.", path)
+                continue
+            if self._segments and segment.base != self._segments[-1].lastid:
+                # A segment not following up on the previous one means we
+                # can't tell what happened in between. Start over.
+                logger.warning("Cache segment %s does not follow the previous"
+                               " one. Clearing cache.", path)
+                self.clear()
+                return
+
+            end = segment.header_size
+            for offset, eventid, eventdata in segment.records():
+                self._index.add(eventid, seqno << _OFFSET_BITS | offset)
+                segment.lastid = eventid
+                end = offset + _RECORD.size + len(eventid) + len(eventdata)
+            if end < segment.size:
+                logger.warning("Truncating partially written record in cache"
+                               " segment %s.", path)
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+                segment.size = end
+            if segment.lastid is None:
+                segment.lastid = segment.base
+            self._segments.append(segment)
+            self._seqnos[seqno] = segment
+
+    def _segment_path(self, seqno):
+        """Return the path of the segment with sequence number `seqno`."""
+        filename = '{0:010d}{1}'.format(seqno, _SEGMENT_SUFFIX)
+        return os.path.join(self._directory, filename)
+
+    @property
+    def empty(self):
+        """Whether the cache holds no events."""
+        return not len(self._index)
+
+    @property
+    def base(self):
+        """The id of the event preceding the first cached event.
+
+        None if the cached events start at the beginning of history, or if the
+        cache is empty.
+
+        """
+        return self._segments[0].base if self._segments else None
+
+    @property
+    def last(self):
+        """The id of the last cached event, or None if the cache is empty."""
+        return self._segments[-1].lastid if self._segments else None
+
+    @property
+    def size(self):
+        """The total size of all segment files in bytes."""
+        return sum(segment.size for segment in self._segments)
+
+    def __contains__(self, eventid):
+        """Return whether `eventid` is cached."""
+        return self._locate(eventid) is not None
+
+    def _locate(self, eventid):
+        """Return the tuple `(segment, offset)` of a cached event, or None."""
+        value = self._index.get(eventid)
+        if value is None:
+            return None
+        segment = self._seqnos.get(value >> _OFFSET_BITS)
+        if segment is None:
+            return None
+        offset = value & _OFFSET_MASK
+
+        # The index only stores digests of ids. Make sure it wasn't fooled.
+        self.flush()
+        if segment.record_id(offset) != eventid:
+            return None
+        return segment, offset
+
+    def __len__(self):
+        """Return the number of cached events."""
+        return len(self._index)
+
+    def covers(self, from_):
+        """Return whether the events after `from_` can be served by the cache.
+
+        That is the case if `from_` is the id of a cached event or the id of
+        the event preceding the first cached one.
+
+        """
+        if self.empty:
+            return False
+        return from_ == self.base or from_ in self
+
+    def append(self, eventid, eventdata, previd):
+        """Append an event to the cache.
+
+        Parameters:
+        eventid   -- the id of the event.
+        eventdata -- the data of the event.
+        previd    -- the id of the event preceding this one, or None if this
+                     is the very first event. Must be equal to `last` unless
+                     the cache is empty.
+
+        """
+        assert isinstance(eventid, bytes), type(eventid)
+        if self.empty:
+            self.clear()
+        else:
+            assert previd == self.last, "Cache must be contiguous"
+
+        if not self._segments:
+            self._roll(previd)
+        elif self._segments[-1].size >= self._segment_bytes:
+            self._roll(previd)
+
+        segment = self._segments[-1]
+        if self._writer is None:
+            self._writer = open(segment.path, 'ab')
+        offset = segment.size
+        assert offset <= _OFFSET_MASK, "Segment too large to be indexed"
+        self._writer.write(_RECORD.pack(len(eventid), len(eventdata)))
+        self._writer.write(eventid)
+        self._writer.write(eventdata)
+
+        segment.size += _RECORD.size + len(eventid) + len(eventdata)
+        segment.lastid = eventid
+        self._index.add(eventid, segment.seqno << _OFFSET_BITS | offset)
+
+    def _roll(self, base):
+        """Start a new segment and evict old ones if needed."""
+        self._close_writer()
+        seqno = self._segments[-1].seqno + 1 if self._segments else 0
+        segment = _Segment.create(self._segment_path(seqno), seqno, base)
+        self._segments.append(segment)
+        self._seqnos[seqno] = segment
+        self._writer = open(segment.path, 'ab')
+
+        while len(self._segments) > 1 and self.size > self._max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove the oldest segment."""
+        segment = self._segments.pop(0)
+        del self._seqnos[segment.seqno]
+        self._index.prune((segment.seqno + 1) << _OFFSET_BITS)
+        os.remove(segment.path)
+        logger.debug("Evicted cache segment %s.", segment.path)
+
+    def iter_after(self, from_, to=None):
+        """Yield cached events after `from_`.
+
+        Parameters:
+        from_ -- the exclusive event id to start at. `covers(from_)` must be
+                 True.
+        to    -- the (optional) inclusive event id to stop at.
+
+        Yields `(eventid, eventdata)` tuples.
+
+        """
+        assert self.covers(from_), from_
+        self.flush()
+
+        if from_ == self.base:
+            segments = list(self._segments)
+            offset = None
+        else:
+            first, offset = self._locate(from_)
+            segments = self._segments[self._segments.index(first):]
+
+        skip = offset is not None
+        for segment in segments:
+            for _, eventid, eventdata in segment.records(offset):
+                if skip:
+                    skip = False
+                    continue
+                yield eventid, eventdata
+                if eventid == to:
+                    return
+            offset = None
+
+    def flush(self):
+        """Flush appended events to the operating system."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def _close_writer(self):
+        """Close the file object of the segment currently appended to."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def clear(self):
+        """Remove all cached events."""
+        self._close_writer()
+        for filename in os.listdir(self._directory):
+            if filename.endswith(_SEGMENT_SUFFIX):
+                os.remove(os.path.join(self._directory, filename))
+        self._segments = []
+        self._seqnos = {}
+        self._index.clear()
+
+    def close(self):
+        """Flush and close the cache."""
+        self._close_writer()
+
+
+class CachingQuerier(object):
+
+    """Queries events from a local cache first and from Rewind second.
+
+    Queries starting at an event in the cache are served from disk up until
+    the last cached event. Remaining events are queried from Rewind and
+    appended to the cache along the way. Queries from the beginning of
+    history first fetch any evicted events preceding the cache from Rewind.
+    Queries starting elsewhere are passed straight through to Rewind.
+
+    """
+
+    def __init__(self, cache, socket):
+        """Constructor.
+
+        Parameters:
+        cache  -- the `SegmentCache` to use.
+        socket -- ZeroMQ socket to use. It must be previously connected to
+                  a Rewind instance and of type REQ.
+
+        """
+        self._cache = cache
+        self._socket = socket
+
+    def query_events(self, from_=None, to=None):
+        """Yield a queried range of events.
+
+        Parameters:
+        from_ -- the (optional) event id for the (chronologically) earliest
+                 end of the range. It is exclusive.
+        to    -- the (optional) event id for the (chronologically) latest end
+                 of the range. It is inclusive.
+
+        Raises `QueryException` if a query to Rewind failed.
+
+        See `rewind.client.query_events` for more information.
+
+        """
+        cache = self._cache
+        if from_ is None and not cache.empty and cache.base is not None:
+            # The beginning of history has been evicted from the cache. Query
+            # it from Rewind up until the first cached event.
+            for eventid, eventdata in query_events(self._socket, None,
+                                                   cache.base):
+                yield eventid, eventdata
+                if eventid == to:
+                    return
+            from_ = cache.base
+
+        if cache.covers(from_):
+            for eventid, eventdata in cache.iter_after(from_, to):
+                yield eventid, eventdata
+                if eventid == to:
+                    return
+            from_ = cache.last
+
+        if cache.empty or from_ == cache.last:
+            try:
+                for eventid, eventdata in query_events(self._socket, from_,
+                                                       to):
+                    cache.append(eventid, eventdata, from_)
+                    from_ = eventid
+                    yield eventid, eventdata
+            finally:
+                cache.flush()
+        else:
+            for event in query_events(self._socket, from_, to):
+                yield event
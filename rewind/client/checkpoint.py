@@ -0,0 +1,269 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Persisting the last processed event id of consumers.
+
+A `Checkpointer` remembers the id of the last event a consumer has processed
+and writes it to a `CheckpointStore` in groups, so that the store is not
+synced to disk for every single event. The wrappers in this module resume
+from, and record, the checkpoint automatically::
+
+    store = SQLiteCheckpointStore('checkpoints.db')
+    with Checkpointer(store, 'projection') as checkpointer:
+        for eventid, eventdata in query_events(socket, checkpointer):
+            process(eventdata)
+
+A `rewind.client.subscriber.Subscriber` is resumed the same way by giving it
+`checkpointer.lasteventid` and iterating over `checkpointed(subscriber,
+checkpointer)`.
+
+An event is recorded as processed once the next event has been asked for.
+After a crash, at most the events processed since the last write are
+processed again; none are skipped.
+
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from rewind.client import query_events as _query_events
+from rewind.client.subscriber import follow_stream as _follow_stream
+
+
+def _sync_directory(directory):
+    """Sync a directory so that files created or renamed in it persist."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CheckpointStore(object):
+
+    """Stores the last processed event id per consumer name."""
+
+    def load(self, name):
+        """Return the stored event id of a consumer, or None."""
+        raise NotImplementedError()
+
+    def save(self, name, eventid):
+        """Durably store the event id of a consumer."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Release any resources held by the store."""
+        pass
+
+
+class FileCheckpointStore(CheckpointStore):
+
+    """Stores every checkpoint in a file of its own.
+
+    A checkpoint is written to a temporary file that is synced to disk and
+    then renamed over the previous one, so a crash never leaves a partially
+    written checkpoint behind. An empty checkpoint file, as left by a crash
+    of a less careful writer, is treated as no checkpoint at all.
+
+    """
+
+    def __init__(self, directory):
+        """Constructor.
+
+        Parameters:
+        directory -- the directory to store checkpoint files in. Created if
+                     it does not exist.
+
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+
+    def _path(self, name):
+        """Return the path of the checkpoint file of a consumer."""
+        assert name and os.sep not in name and not name.startswith('.')
+        return os.path.join(self._directory, name + '.checkpoint')
+
+    def load(self, name):
+        """Return the stored event id of a consumer, or None."""
+        try:
+            with open(self._path(name), 'rb') as f:
+                eventid = f.read()
+        except IOError:
+            return None
+        # Event ids are never empty.
+        return eventid or None
+
+    def save(self, name, eventid):
+        """Durably store the event id of a consumer."""
+        assert isinstance(eventid, bytes)
+        path = self._path(name)
+        tmppath = path + '.tmp'
+        with open(tmppath, 'wb') as f:
+            f.write(eventid)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmppath, path)
+        _sync_directory(self._directory)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+
+    """Stores checkpoints in a table of an SQLite database.
+
+    Useful when many consumers are checkpointed, or when checkpoints should
+    be stored in the same database as the state they were processed into.
+
+    """
+
+    def __init__(self, path, table='rewind_checkpoints'):
+        """Constructor.
+
+        Parameters:
+        path  -- the path of the SQLite database. Created if it does not
+                 exist.
+        table -- the name of the table to store checkpoints in. Created if it
+                 does not exist.
+
+        """
+        assert table.replace('_', '').isalnum(), table
+        self._table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS {0} (name TEXT PRIMARY KEY,'
+                ' eventid BLOB NOT NULL, updated REAL NOT NULL)'.format(table))
+
+    def load(self, name):
+        """Return the stored event id of a consumer, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT eventid FROM {0} WHERE name = ?'.format(self._table),
+                (name,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def save(self, name, eventid):
+        """Durably store the event id of a consumer."""
+        assert isinstance(eventid, bytes)
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO {0} (name, eventid, updated)'
+                    ' VALUES (?, ?, ?)'.format(self._table),
+                    (name, sqlite3.Binary(eventid), time.time()))
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class Checkpointer(object):
+
+    """Tracks the last processed event id of a consumer.
+
+    Recorded event ids are written to the store once `every` events have been
+    recorded, or `interval` seconds have passed, since the last write.
+    Whatever is recorded when the checkpointer is flushed, or exits its
+    runtime context, is written too.
+
+    """
+
+    def __init__(self, store, name, every=1000, interval=1.0):
+        """Constructor.
+
+        Parameters:
+        store    -- the `CheckpointStore` to write to.
+        name     -- the name of the consumer.
+        every    -- the number of recorded events after which to write.
+        interval -- the number of seconds after which to write, checked when
+                    recording an event. None to only write every `every`
+                    events.
+
+        """
+        assert every >= 1
+        self._store = store
+        self._name = name
+        self._every = every
+        self._interval = interval
+
+        self.lasteventid = store.load(name)
+        self._unsaved = 0
+        self._lastsave = time.time()
+
+    @property
+    def name(self):
+        """The name of the consumer."""
+        return self._name
+
+    def record(self, eventid):
+        """Record an event as processed, writing to the store if due."""
+        self.lasteventid = eventid
+        self._unsaved += 1
+        if self._unsaved >= self._every:
+            self.flush()
+        elif (self._interval is not None and
+                time.time() - self._lastsave >= self._interval):
+            self.flush()
+
+    def flush(self):
+        """Write the last recorded event id to the store, if not already."""
+        if self._unsaved:
+            self._store.save(self._name, self.lasteventid)
+            self._unsaved = 0
+        self._lastsave = time.time()
+
+    def __enter__(self):
+        """Enter the runtime context of the checkpointer."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Write the last recorded event id to the store."""
+        self.flush()
+
+
+def checkpointed(events, checkpointer):
+    """Yield events, recording each once the next one is asked for.
+
+    Parameters:
+    events       -- an iterable of `(eventid, eventdata)` tuples.
+    checkpointer -- the `Checkpointer` to record event ids with.
+
+    """
+    for eventid, eventdata in events:
+        yield eventid, eventdata
+        checkpointer.record(eventid)
+
+
+def query_events(socket, checkpointer, to=None, copy=True, timeout=None):
+    """Yield events after the checkpoint, recording them as processed.
+
+    See `rewind.client.query_events` for parameters. The range starts after
+    the checkpointed event id, or at the beginning of time if there is none.
+
+    """
+    events = _query_events(socket, checkpointer.lasteventid, to, copy,
+                           timeout)
+    for event in checkpointed(events, checkpointer):
+        yield event
+    checkpointer.flush()
+
+
+def follow_stream(streamsock, reqsock, checkpointer, copy=True):
+    """Endlessly yield events after the checkpoint, recording them.
+
+    See `rewind.client.subscriber.follow_stream` for parameters. Events
+    missed since the checkpoint are queried for before streamed ones.
+
+    """
+    events = _follow_stream(streamsock, reqsock, checkpointer.lasteventid,
+                            copy)
+    return checkpointed(events, checkpointer)
@@ -0,0 +1,116 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Command line tools publishing and querying events.
+
+Installed as the `rewind-publish` and `rewind-query` console scripts. They
+are meant for cron jobs and shell scripts, so they start fast: nothing but
+`rewind.client` and ZeroMQ is imported. Example usage::
+
+    rewind-publish --query-endpoint tcp://127.0.0.1:8090 '{"type": "ping"}'
+    echo -n 'event' | rewind-publish
+    rewind-query --from 4c4f6ec8-... --ids
+
+Both exit with status 1 if Rewind did not reply within `--timeout` seconds,
+and `rewind-query` with status 2 if the query failed.
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+
+import rewind.client as clients
+
+
+_DEFAULT_ENDPOINT = 'tcp://127.0.0.1:8090'
+
+
+def _parser(description):
+    """Return an argument parser with the options common to all tools."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--query-endpoint', default=_DEFAULT_ENDPOINT,
+                        help='the query endpoint of Rewind. Defaults to'
+                             ' {0}.'.format(_DEFAULT_ENDPOINT))
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='the number of seconds to wait for Rewind to'
+                             ' reply. Defaults to 10.')
+    return parser
+
+
+def _connect(endpoint):
+    """Return a ZeroMQ context and a REQ socket connected to Rewind."""
+    import zmq
+    context = zmq.Context(1)
+    socket = context.socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.connect(endpoint)
+    return context, socket
+
+
+def _binary(stream):
+    """Return the binary buffer of a text stream, if it has one."""
+    return getattr(stream, 'buffer', stream)
+
+
+def publish_main(argv=None):
+    """Publish events given as arguments, or read from standard input."""
+    parser = _parser(publish_main.__doc__)
+    parser.add_argument('events', nargs='*', metavar='EVENT',
+                        help='the data of an event to publish. If none are'
+                             ' given, standard input is published as a'
+                             ' single event.')
+    args = parser.parse_args(argv)
+    if args.events:
+        events = [event.encode('utf-8') for event in args.events]
+    else:
+        events = [_binary(sys.stdin).read()]
+
+    context, socket = _connect(args.query_endpoint)
+    try:
+        for event in events:
+            clients.publish_event(socket, event, timeout=args.timeout)
+    except clients.TimeoutException as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        socket.close()
+        context.term()
+    return 0
+
+
+def query_main(argv=None):
+    """Write queried events to standard output, one per line."""
+    parser = _parser(query_main.__doc__)
+    parser.add_argument('--from', dest='from_', default=None,
+                        help='the id of the event to query events after.')
+    parser.add_argument('--to', default=None,
+                        help='the id of the last event to query.')
+    parser.add_argument('--ids', action='store_true',
+                        help='prefix every event with its id and a tab.')
+    args = parser.parse_args(argv)
+    from_ = args.from_.encode('utf-8') if args.from_ else None
+    to = args.to.encode('utf-8') if args.to else None
+
+    output = _binary(sys.stdout)
+    context, socket = _connect(args.query_endpoint)
+    try:
+        for eventid, eventdata in clients.query_events(socket, from_, to,
+                                                       timeout=args.timeout):
+            if args.ids:
+                output.write(eventid + b'\t')
+            output.write(eventdata + b'\n')
+    except clients.TimeoutException as e:
+        print(e, file=sys.stderr)
+        return 1
+    except clients.QueryException as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        output.flush()
+        socket.close()
+        context.term()
+    return 0
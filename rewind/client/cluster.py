@@ -0,0 +1,253 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""A client talking to a primary Rewind and any number of read replicas.
+
+`ClusterClient` sends every published event to the primary and spreads
+queries over all nodes. Each node keeps an exponentially weighted moving
+average of its reply latency, and nodes are picked with a probability
+inversely proportional to it, so slow nodes get less traffic. A node that
+times out or fails is avoided for a while, and queries that were halfway
+through are resumed on another node after the last event yielded::
+
+    client = ClusterClient(context, 'tcp://primary:8090',
+                           ['tcp://replica1:8090', 'tcp://replica2:8090'])
+    client.publish_event(b'event')
+    for eventid, eventdata in client.query_events():
+        ...
+
+All nodes are expected to hold the same events under the same event ids.
+
+"""
+import logging
+import random
+import threading
+import time
+
+import zmq
+
+from rewind.client import TimeoutException
+from rewind.client.pool import RewindPool
+
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyNodes(Exception):
+
+    """Raised when a request failed on every node tried."""
+
+    pass
+
+
+class _Node(object):
+
+    """A Rewind instance and what is known about its health."""
+
+    def __init__(self, pool, latency):
+        """Constructor.
+
+        Parameters:
+        pool    -- the `RewindPool` of sockets connected to the node.
+        latency -- the initial latency estimate, in seconds.
+
+        """
+        self.pool = pool
+        self.latency = latency
+        self.failures = 0
+        self.down_until = 0
+
+    @property
+    def endpoint(self):
+        """The query endpoint of the node."""
+        return self.pool.endpoint
+
+    def is_up(self, now):
+        """Return whether the node should be sent requests."""
+        return self.down_until <= now
+
+
+class ClusterClient(object):
+
+    """Publishes to a primary Rewind and queries a set of replicas.
+
+    Thread-safe; sockets are pooled per node using `RewindPool`.
+
+    """
+
+    # Errors that make a node be considered unhealthy.
+    _NODE_ERRORS = (TimeoutException, zmq.ZMQError)
+
+    def __init__(self, context, primary, replicas=(), timeout=5.0,
+                 read_from_primary=True, maxsize=4, profile='default',
+                 smoothing=0.2, cooldown=10.0):
+        """Constructor.
+
+        Parameters:
+        context           -- the ZeroMQ context to create sockets from.
+        primary           -- the query endpoint of the Rewind instance that
+                             events are published to.
+        replicas          -- query endpoints of Rewind instances holding
+                             copies of the primary's events.
+        timeout           -- the maximum number of seconds to wait for a
+                             reply before failing over.
+        read_from_primary -- whether queries may also be sent to the
+                             primary.
+        maxsize           -- the maximum number of sockets per node.
+        profile           -- the name of the socket option profile to use.
+                             See `rewind.client.sockets`.
+        smoothing         -- the weight of a new latency measurement in the
+                             moving average, between 0 and 1.
+        cooldown          -- the number of seconds a failed node is avoided.
+
+        """
+        assert 0 < smoothing <= 1
+        self._timeout = timeout
+        self._smoothing = smoothing
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+        def node(endpoint):
+            return _Node(RewindPool(context, endpoint, maxsize, profile),
+                         timeout / 10.0)
+        self._primary = node(primary)
+        self._readers = [node(endpoint) for endpoint in replicas]
+        if read_from_primary or not self._readers:
+            self._readers.append(self._primary)
+
+    def health(self):
+        """Return the health of every node.
+
+        Returns a dictionary from endpoint to a dictionary holding the
+        `latency` moving average, the number of consecutive `failures` and
+        whether the node is currently considered `up`.
+
+        """
+        now = time.time()
+        nodes = set(self._readers + [self._primary])
+        with self._lock:
+            return dict((node.endpoint, {'latency': node.latency,
+                                         'failures': node.failures,
+                                         'up': node.is_up(now)})
+                        for node in nodes)
+
+    def publish_event(self, event):
+        """Publish an event to the primary.
+
+        Publishing is never failed over since a timed out event might still
+        have been published. Raises `rewind.client.TimeoutException` if the
+        primary did not acknowledge the event in time.
+
+        """
+        node = self._primary
+        start = time.time()
+        try:
+            node.pool.publish_event(event, self._timeout)
+        except self._NODE_ERRORS:
+            self._failed(node)
+            raise
+        self._succeeded(node, time.time() - start)
+
+    def query_events(self, from_=None, to=None, copy=True):
+        """Yield a queried range of events, failing over between nodes.
+
+        See `rewind.client.query_events` for parameters. A node that fails
+        is not tried again by the same query. Raises `NoHealthyNodes` if
+        every node failed.
+
+        """
+        tried = []
+        while True:
+            node = self._pick(tried)
+            if node is None:
+                raise NoHealthyNodes("Query failed on all of {0}.".format(
+                    ', '.join(node.endpoint for node in tried)))
+            tried.append(node)
+
+            start = time.time()
+            measured = False
+            events = node.pool.query_events(from_, to, copy, self._timeout)
+            try:
+                for eventid, eventdata in events:
+                    if not measured:
+                        self._succeeded(node, time.time() - start)
+                        measured = True
+                    from_ = eventid
+                    yield eventid, eventdata
+            except self._NODE_ERRORS:
+                logger.getChild('query_events').warning(
+                    'Query failed on %s. Failing over.', node.endpoint,
+                    exc_info=True)
+                self._failed(node)
+                continue
+            finally:
+                events.close()
+
+            if not measured:
+                self._succeeded(node, time.time() - start)
+            return
+
+    def close(self, linger=None):
+        """Close all sockets.
+
+        Parameters:
+        linger -- see `zmq.Socket.close`.
+
+        """
+        for node in set(self._readers + [self._primary]):
+            node.pool.close(linger)
+
+    def __enter__(self):
+        """Enter the runtime context of the client."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the client."""
+        self.close()
+
+    def _pick(self, exclude):
+        """Pick a node to query, weighted by the inverse of its latency.
+
+        Parameters:
+        exclude -- nodes that must not be picked.
+
+        Returns None if there is no node left. Nodes that are down are only
+        picked if all remaining nodes are down.
+
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [node for node in self._readers
+                          if node not in exclude]
+            if not candidates:
+                return None
+            up = [node for node in candidates if node.is_up(now)]
+            if not up:
+                return min(candidates, key=lambda node: node.down_until)
+
+            weights = [1.0 / max(node.latency, 1e-6) for node in up]
+            point = self._random.random() * sum(weights)
+            for node, weight in zip(up, weights):
+                point -= weight
+                if point < 0:
+                    return node
+            return up[-1]
+
+    def _succeeded(self, node, latency):
+        """Record a successful reply from a node."""
+        with self._lock:
+            node.latency += self._smoothing * (latency - node.latency)
+            node.failures = 0
+            node.down_until = 0
+
+    def _failed(self, node):
+        """Record that a node failed to reply."""
+        with self._lock:
+            node.failures += 1
+            node.latency += self._smoothing * (self._timeout - node.latency)
+            node.down_until = time.time() + self._cooldown
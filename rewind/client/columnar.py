@@ -0,0 +1,180 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Querying for events in columnar batches.
+
+`query_event_batches` yields every batch of events received from Rewind as an
+`EventBatch`, which stores all event ids and all event data of the batch
+concatenated into two byte strings, each with an array of offsets. Building
+a batch costs no Python objects per event, and a batch can be handed to
+NumPy or Arrow without iterating over its events::
+
+    for batch in query_event_batches(socket):
+        table = batch.to_arrow()
+
+Neither NumPy nor Arrow is a dependency of this package. They are imported
+when converting to them.
+
+"""
+from array import array
+from itertools import accumulate
+
+from rewind.client import _query_batches
+
+
+# Signed 64-bit offsets, as used by NumPy's int64 and Arrow's large_binary.
+_OFFSET_TYPECODE = 'q'
+
+
+def _offsets(frames):
+    """Return an array of the offsets of frames concatenated."""
+    offsets = array(_OFFSET_TYPECODE, [0])
+    offsets.extend(accumulate(map(len, frames)))
+    return offsets
+
+
+class EventBatch(object):
+
+    """A batch of events stored column by column.
+
+    Attributes:
+    ids          -- all event ids concatenated into a byte string.
+    id_offsets   -- an `array.array` of len(batch) + 1 offsets. Event id `i`
+                    is `ids[id_offsets[i]:id_offsets[i + 1]]`.
+    data         -- all event data concatenated into a byte string.
+    data_offsets -- an `array.array` of len(batch) + 1 offsets into `data`.
+
+    """
+
+    __slots__ = ('ids', 'id_offsets', 'data', 'data_offsets')
+
+    def __init__(self, ids, id_offsets, data, data_offsets):
+        """Constructor.
+
+        See the class documentation for parameters.
+
+        """
+        assert len(id_offsets) == len(data_offsets)
+        self.ids = ids
+        self.id_offsets = id_offsets
+        self.data = data
+        self.data_offsets = data_offsets
+
+    @classmethod
+    def from_frames(cls, idframes, dataframes):
+        """Create a batch from received frames, copying each once.
+
+        Parameters:
+        idframes   -- a sequence of bytes-like event ids.
+        dataframes -- a sequence of bytes-like event data, as many as there
+                      are event ids.
+
+        """
+        assert len(idframes) == len(dataframes)
+        return cls(b''.join(idframes), _offsets(idframes),
+                   b''.join(dataframes), _offsets(dataframes))
+
+    @classmethod
+    def from_events(cls, events):
+        """Create a batch from an iterable of `(eventid, eventdata)` tuples."""
+        events = list(events)
+        return cls.from_frames([eventid for eventid, _ in events],
+                               [eventdata for _, eventdata in events])
+
+    def __len__(self):
+        """Return the number of events in the batch."""
+        return len(self.id_offsets) - 1
+
+    @property
+    def nbytes(self):
+        """The total size of all event data in the batch."""
+        return len(self.data)
+
+    @property
+    def first_id(self):
+        """The id of the first event in the batch, or None if empty."""
+        return self.eventid(0) if len(self) else None
+
+    @property
+    def last_id(self):
+        """The id of the last event in the batch, or None if empty."""
+        return self.eventid(len(self) - 1) if len(self) else None
+
+    def eventid(self, i):
+        """Return the id of the `i`th event as a byte string."""
+        return self.ids[self.id_offsets[i]:self.id_offsets[i + 1]]
+
+    def eventdata(self, i):
+        """Return the data of the `i`th event as a `memoryview`."""
+        return memoryview(self.data)[self.data_offsets[i]:
+                                     self.data_offsets[i + 1]]
+
+    def __iter__(self):
+        """Yield `(eventid, eventdata)` tuples, event data as memoryviews.
+
+        Creates Python objects per event. Prefer the columns, or the NumPy
+        and Arrow conversions, for bulk processing.
+
+        """
+        ids, idoffsets = self.ids, self.id_offsets
+        data, dataoffsets = memoryview(self.data), self.data_offsets
+        for i in range(len(self)):
+            yield (ids[idoffsets[i]:idoffsets[i + 1]],
+                   data[dataoffsets[i]:dataoffsets[i + 1]])
+
+    def to_numpy(self):
+        """Return the columns as NumPy arrays, without copying them.
+
+        Returns the tuple `(ids, id_offsets, data, data_offsets)` where `ids`
+        and `data` are read-only `uint8` arrays and the offsets are `int64`
+        arrays. Requires NumPy.
+
+        """
+        import numpy
+        return (numpy.frombuffer(self.ids, numpy.uint8),
+                numpy.frombuffer(self.id_offsets, numpy.int64),
+                numpy.frombuffer(self.data, numpy.uint8),
+                numpy.frombuffer(self.data_offsets, numpy.int64))
+
+    def to_arrow(self):
+        """Return the batch as an Arrow table, without copying it.
+
+        The table has the `large_binary` columns `eventid` and `eventdata`.
+        Requires pyarrow.
+
+        """
+        import pyarrow
+
+        def column(values, offsets):
+            return pyarrow.Array.from_buffers(
+                pyarrow.large_binary(), len(self),
+                [None, pyarrow.py_buffer(offsets), pyarrow.py_buffer(values)])
+        return pyarrow.Table.from_arrays(
+            [column(self.ids, self.id_offsets),
+             column(self.data, self.data_offsets)],
+            names=['eventid', 'eventdata'])
+
+
+def query_event_batches(socket, from_=None, to=None, timeout=None):
+    """Yield a queried range of events, one `EventBatch` per reply.
+
+    Parameters:
+    socket  -- ZeroMQ socket to use. It must be previously connected to a
+               Rewind instance and of type REQ.
+    from_   -- see `rewind.client.query_events`.
+    to      -- see `rewind.client.query_events`.
+    timeout -- see `rewind.client.query_events`.
+
+    Raises `QueryException` if a query failed.
+
+    This function returns nothing, but yields non-empty `EventBatch`es.
+
+    """
+    assert from_ is None or isinstance(from_, bytes)
+    assert to is None or isinstance(to, bytes)
+    for frames in _query_batches(socket, from_, to, timeout):
+        yield EventBatch.from_frames(frames[0::2], frames[1::2])
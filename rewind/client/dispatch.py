@@ -0,0 +1,475 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Feeding a single stream of events to many handlers in parallel.
+
+A `Dispatcher` consumes events once, for example from a
+`rewind.client.subscriber.Subscriber`, and hands every event to every
+registered handler. Each handler runs in a worker of its own, a thread or a
+process, and receives the events in order through a bounded queue. When a
+handler falls behind and its queue fills up, the dispatcher waits for it::
+
+    dispatcher = Dispatcher()
+    dispatcher.register('users', update_users)
+    dispatcher.register('search', index_event, process=True)
+    with Subscriber(context, stream_endpoint, query_endpoint) as events:
+        dispatcher.run(events)
+
+Thread workers are handed the received event data as is. For process
+workers, event data is written once to a ring buffer in shared memory that
+all process workers read from, so only event ids and offsets are pickled.
+Process handlers are called with a `memoryview` that is only valid during the
+call, and must be picklable module level functions. Process workers are not
+forked from the dispatching process by default, since forking a process that
+runs other threads, such as ZeroMQ's I/O threads, can deadlock the child.
+
+`lag()` tells how far behind every handler is.
+
+"""
+import logging
+import multiprocessing
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    # Python >= 3
+    import queue
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checking whether workers have failed while waiting.
+_POLL_INTERVAL = 0.05
+
+
+def _default_mpcontext():
+    """Return a `multiprocessing` context that does not fork this process."""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class HandlerFailed(Exception):
+
+    """Raised when dispatching to a handler that has raised an exception."""
+
+    def __init__(self, name, error):
+        """Constructor.
+
+        Parameters:
+        name  -- the name of the handler.
+        error -- a description of the exception raised by the handler.
+
+        """
+        super(HandlerFailed, self).__init__("Handler {0} failed: {1}".format(
+            name, error))
+        self.name = name
+        self.error = error
+
+
+class _ThreadWorker(threading.Thread):
+
+    """Calls a handler with events from a queue in a thread."""
+
+    def __init__(self, name, handler, maxqueue):
+        """Constructor.
+
+        Parameters:
+        name     -- the name of the handler.
+        handler  -- function called with `(eventid, eventdata)`.
+        maxqueue -- the maximum number of queued events.
+
+        """
+        super(_ThreadWorker, self).__init__(name='dispatch-' + name)
+        self.daemon = True
+        self.handlername = name
+        self._handler = handler
+        self._queue = queue.Queue(maxqueue)
+        self.dispatched = 0
+        self.processed = 0
+        self.lagseconds = 0.0
+        self.error = None
+        self._abandoned = threading.Event()
+
+    def run(self):
+        """Handle events until told to stop."""
+        while True:
+            item = self._queue.get()
+            if item is None or self._abandoned.is_set():
+                return
+            eventid, eventdata, dispatched = item
+            try:
+                self._handler(eventid, eventdata)
+            except Exception as e:
+                logger.getChild('worker').exception('Handler %s failed.',
+                                                    self.handlername)
+                self.error = repr(e)
+                return
+            self.lagseconds = time.time() - dispatched
+            self.processed += 1
+
+    @property
+    def failed(self):
+        """Whether the handler has raised an exception."""
+        return self.error is not None
+
+    def put(self, eventid, eventdata, dispatched):
+        """Queue an event, waiting while the queue is full."""
+        item = (eventid, eventdata, dispatched)
+        while True:
+            if self.failed:
+                raise HandlerFailed(self.handlername, self.error)
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                pass
+        self.dispatched += 1
+
+    def stop(self, timeout=None):
+        """Let the worker finish its queue, then stop it.
+
+        A worker that has not finished within `timeout` seconds, unless it is
+        None, is told to stop after the event it is handling, leaving the
+        rest of its queue. Threads can not be killed, so a handler that never
+        returns keeps its (daemon) thread.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.failed and self.is_alive():
+            try:
+                self._queue.put(None, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if deadline is not None and time.time() >= deadline:
+                    break
+        self.join(None if deadline is None
+                  else max(0, deadline - time.time()))
+        if self.is_alive():
+            self._abandoned.set()
+
+
+class _SharedRing(object):
+
+    """A ring buffer in shared memory that event data is written to.
+
+    Positions are logical, growing forever. Data never wraps around the end
+    of the buffer; what does not fit before the end is written at the start.
+
+    """
+
+    def __init__(self, capacity):
+        """Constructor.
+
+        Parameters:
+        capacity -- the size of the ring in bytes.
+
+        """
+        from multiprocessing import shared_memory
+        self._shm = shared_memory.SharedMemory(create=True, size=capacity)
+        self.name = self._shm.name
+        self.capacity = capacity
+        self._head = 0
+
+    def write(self, data, readers):
+        """Write data to the ring, waiting for readers to make room.
+
+        Parameters:
+        data    -- the bytes-like data to write.
+        readers -- the `_ProcessWorker`s that read from the ring.
+
+        Returns the logical position the data was written to.
+
+        """
+        length = len(data)
+        if length > self.capacity:
+            raise ValueError("Event of {0} bytes does not fit in a shared"
+                             " ring of {1} bytes.".format(length,
+                                                          self.capacity))
+        start = self._head
+        if start % self.capacity + length > self.capacity:
+            start += self.capacity - start % self.capacity
+        while start + length - min(reader.consumed for reader in readers) > \
+                self.capacity:
+            for reader in readers:
+                reader.check()
+            time.sleep(0.001)
+
+        position = start % self.capacity
+        self._shm.buf[position:position + length] = data
+        self._head = start + length
+        return start
+
+    def close(self):
+        """Release the shared memory."""
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _attach_shared_memory(name):
+    """Attach to existing shared memory without taking ownership of it."""
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached shared memory with the resource
+        # tracker, which worker processes share with the process creating
+        # the memory. Registering it twice is harmless; unregistering it
+        # here would undo the registration of the creator.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _process_worker_main(name, handler, items, ringname, capacity, consumed,
+                         processed, lagseconds, failed):
+    """Call a handler with events from a queue and a shared ring."""
+    shm = _attach_shared_memory(ringname)
+    buf = shm.buf
+    try:
+        while True:
+            item = items.get()
+            if item is None:
+                return
+            eventid, start, length, dispatched = item
+            position = start % capacity
+            eventdata = buf[position:position + length]
+            try:
+                handler(eventid, eventdata)
+            finally:
+                eventdata.release()
+            consumed.value = start + length
+            processed.value += 1
+            lagseconds.value = time.time() - dispatched
+    except Exception:
+        logger.getChild('worker').exception('Handler %s failed.', name)
+        failed.value = 1
+    finally:
+        buf.release()
+        shm.close()
+
+
+class _ProcessWorker(object):
+
+    """Calls a handler with events from a shared ring in a process."""
+
+    def __init__(self, mpcontext, name, handler, maxqueue, ring):
+        """Constructor.
+
+        Parameters:
+        mpcontext -- the multiprocessing context to create the process with.
+        name      -- the name of the handler.
+        handler   -- picklable function called with `(eventid, eventdata)`.
+        maxqueue  -- the maximum number of queued events.
+        ring      -- the `_SharedRing` event data is written to.
+
+        """
+        self.handlername = name
+        self._items = mpcontext.Queue(maxqueue)
+        self._consumed = mpcontext.RawValue('q', 0)
+        self._processed = mpcontext.RawValue('q', 0)
+        self._lagseconds = mpcontext.RawValue('d', 0.0)
+        self._failed = mpcontext.RawValue('b', 0)
+        self.dispatched = 0
+        self._process = mpcontext.Process(
+            target=_process_worker_main, name='dispatch-' + name,
+            args=(name, handler, self._items, ring.name, ring.capacity,
+                  self._consumed, self._processed, self._lagseconds,
+                  self._failed))
+        self._process.daemon = True
+        self._process.start()
+
+    @property
+    def consumed(self):
+        """The logical ring position up to which data has been handled."""
+        return self._consumed.value
+
+    @property
+    def processed(self):
+        """The number of events handled."""
+        return self._processed.value
+
+    @property
+    def lagseconds(self):
+        """The time the last handled event spent queued and handled."""
+        return self._lagseconds.value
+
+    @property
+    def failed(self):
+        """Whether the handler has raised an exception or the process died."""
+        return bool(self._failed.value) or not self._process.is_alive()
+
+    def check(self):
+        """Raise `HandlerFailed` if the worker has failed."""
+        if self.failed:
+            raise HandlerFailed(self.handlername,
+                                "process exited with code {0}".format(
+                                    self._process.exitcode))
+
+    def put(self, eventid, start, length, dispatched):
+        """Queue an event, waiting while the queue is full."""
+        item = (eventid, start, length, dispatched)
+        while True:
+            self.check()
+            try:
+                self._items.put(item, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                pass
+        self.dispatched += 1
+
+    def stop(self, timeout=None):
+        """Let the worker finish its queue, then stop it.
+
+        A worker that has failed, or has not finished within `timeout`
+        seconds, unless it is None, is terminated.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.failed:
+            try:
+                self._items.put(None, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if deadline is not None and time.time() >= deadline:
+                    break
+        while self._process.is_alive() and not self.failed:
+            if deadline is not None and time.time() >= deadline:
+                break
+            self._process.join(_POLL_INTERVAL)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._items.close()
+
+
+class Dispatcher(object):
+
+    """Hands every event to a number of handlers running in parallel."""
+
+    def __init__(self, maxqueue=1000, ring_bytes=64 * 1024 * 1024,
+                 mpcontext=None):
+        """Constructor.
+
+        Parameters:
+        maxqueue   -- the maximum number of events queued per handler before
+                      dispatching waits for it.
+        ring_bytes -- the size of the shared memory ring used to hand event
+                      data to process workers. Bounds the total size of
+                      events queued for process workers, and the size of a
+                      single event.
+        mpcontext  -- the (optional) `multiprocessing` context to start
+                      process workers with. Defaults to the forkserver start
+                      method where available, else spawn.
+
+        """
+        self._maxqueue = maxqueue
+        self._ring_bytes = ring_bytes
+        self._mpcontext = mpcontext or _default_mpcontext()
+        self._threads = []
+        self._processes = []
+        self._ring = None
+        self._stopping = False
+
+    def register(self, name, handler, process=False):
+        """Register a handler and start its worker.
+
+        Handlers only receive events dispatched after they were registered.
+
+        Parameters:
+        name    -- a unique name of the handler, used in `lag()`.
+        handler -- function called with `(eventid, eventdata)` for every
+                   event, in order.
+        process -- whether to call the handler in a process of its own
+                   rather than in a thread. Requires Python >= 3.8.
+
+        """
+        assert name not in self.lag(), name
+        if not process:
+            worker = _ThreadWorker(name, handler, self._maxqueue)
+            worker.start()
+            self._threads.append(worker)
+            return
+        if self._ring is None:
+            self._ring = _SharedRing(self._ring_bytes)
+        self._processes.append(_ProcessWorker(self._mpcontext, name, handler,
+                                              self._maxqueue, self._ring))
+
+    def dispatch(self, eventid, eventdata):
+        """Hand an event to every handler.
+
+        Waits while the queue of any handler is full. Raises `HandlerFailed`
+        if a handler has failed.
+
+        """
+        dispatched = time.time()
+        for worker in self._threads:
+            worker.put(eventid, eventdata, dispatched)
+        if self._processes:
+            start = self._ring.write(eventdata, self._processes)
+            for worker in self._processes:
+                worker.put(eventid, start, len(eventdata), dispatched)
+
+    def run(self, events):
+        """Dispatch events until exhausted or `stop()` is called.
+
+        Parameters:
+        events -- an iterable of `(eventid, eventdata)` tuples.
+
+        """
+        self._stopping = False
+        for eventid, eventdata in events:
+            self.dispatch(eventid, eventdata)
+            if self._stopping:
+                break
+
+    def stop(self):
+        """Make `run()` return after dispatching the current event."""
+        self._stopping = True
+
+    def lag(self):
+        """Return how far behind every handler is.
+
+        Returns a dictionary from handler name to a dictionary holding the
+        number of events `dispatched` to, `processed` by and still `pending`
+        for the handler, the `seconds` the last processed event waited in the
+        queue and was handled for, and whether the handler has `failed`.
+
+        """
+        return dict((worker.handlername, {
+            'dispatched': worker.dispatched,
+            'processed': worker.processed,
+            'pending': worker.dispatched - worker.processed,
+            'seconds': worker.lagseconds,
+            'failed': worker.failed,
+        }) for worker in self._threads + self._processes)
+
+    def close(self, timeout=None):
+        """Wait for all handlers to finish their queues and stop them.
+
+        Parameters:
+        timeout -- the (optional) maximum number of seconds to wait for each
+                   worker. Process workers still running after it, or that
+                   have failed, are terminated. Thread workers stop after
+                   the event they are handling.
+
+        """
+        for worker in self._threads + self._processes:
+            worker.stop(timeout)
+        self._threads = []
+        self._processes = []
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def __enter__(self):
+        """Enter the runtime context of the dispatcher."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the dispatcher."""
+        self.close()
@@ -0,0 +1,122 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Querying for the few events matching a predicate on their raw data.
+
+Rewind has no server side filtering, so every event in a queried range is
+sent to the client. `query_events` in this module at least makes rejected
+events cheap: each batch is received as ZeroMQ frames and the predicate is
+applied to the raw event data before any event id is copied or any
+`(eventid, eventdata)` tuple is built. With `copy=False`, rejected event data
+is never even copied out of its frame::
+
+    aggregate = filtering.prefix(b'user-42:')
+    for eventid, eventdata in filtering.query_events(socket, aggregate):
+        ...
+
+Predicates are called with the raw event data, which is a byte string, or a
+`memoryview` if `copy=False`. The predicate factories in this module handle
+both.
+
+"""
+import re
+
+from rewind.client import _query_batches
+
+
+def prefix(*prefixes):
+    """Return a predicate matching event data starting with any prefix."""
+    assert prefixes
+    assert all(isinstance(p, bytes) for p in prefixes)
+    maxlength = max(len(p) for p in prefixes)
+
+    def predicate(eventdata):
+        if isinstance(eventdata, bytes):
+            return eventdata.startswith(prefixes)
+        return bytes(eventdata[:maxlength]).startswith(prefixes)
+    return predicate
+
+
+def at(offset, value):
+    """Return a predicate matching event data having a value at an offset.
+
+    Useful for fixed layout headers, for example an aggregate id in the first
+    16 bytes of every event.
+
+    Parameters:
+    offset -- the position of the value in the event data.
+    value  -- the byte string to match.
+
+    """
+    assert isinstance(value, bytes)
+    end = offset + len(value)
+
+    def predicate(eventdata):
+        return eventdata[offset:end] == value
+    return predicate
+
+
+def matches(pattern):
+    """Return a predicate matching event data using a regular expression.
+
+    Parameters:
+    pattern -- a bytes pattern, or compiled bytes regular expression, that is
+               matched at the start of the event data.
+
+    """
+    match = re.compile(pattern).match
+
+    def predicate(eventdata):
+        return match(eventdata) is not None
+    return predicate
+
+
+def query_events(socket, predicate, from_=None, to=None, copy=True,
+                 timeout=None, project=None):
+    """Yield the events of a queried range that match a predicate.
+
+    Parameters:
+    socket    -- ZeroMQ socket to use. It must be previously connected to a
+                 Rewind instance and of type REQ.
+    predicate -- function called with the raw data of each event, returning
+                 whether the event should be yielded.
+    from_     -- see `rewind.client.query_events`.
+    to        -- see `rewind.client.query_events`.
+    copy      -- see `rewind.client.query_events`.
+    timeout   -- see `rewind.client.query_events`.
+    project   -- an (optional) function called with the data of every
+                 matching event, returning what to yield in its place. For
+                 example `lambda eventdata: eventdata[16:]` to strip a
+                 header.
+
+    Raises `QueryException` if a query failed.
+
+    This function returns nothing, but yields `(eventid, eventdata)` tuples of
+    the matching events.
+
+    """
+    assert from_ is None or isinstance(from_, bytes)
+    assert to is None or isinstance(to, bytes)
+    for frames in _query_batches(socket, from_, to, timeout):
+        events = _filter(frames, predicate, copy)
+        if project is None:
+            for event in events:
+                yield event
+        else:
+            for eventid, eventdata in events:
+                yield eventid, project(eventdata)
+
+
+def _filter(frames, predicate, copy):
+    """Return the events of a batch of frames matching a predicate."""
+    events = []
+    append = events.append
+    for idframe, dataframe in zip(frames[0::2], frames[1::2]):
+        eventdata = dataframe.bytes if copy else dataframe.buffer
+        if predicate(eventdata):
+            append((idframe.bytes, eventdata))
+    return events
@@ -0,0 +1,176 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Compact in-memory index of event ids.
+
+Event ids are opaque byte strings, so answering "where does event X start?"
+or "have we seen event X?" would otherwise take a linear scan, or a Python
+dictionary costing well over a hundred bytes per event. `EventIndex` is an
+open addressing hash table kept in two `array`s: one of 64 bit digests of the
+event ids and one of 64 bit values, such as file offsets or sequence numbers.
+
+Since only digests are stored, a lookup may in theory return a false positive.
+The probability is roughly `n**2 / 2**65` for `n` indexed events. Callers
+that must be certain, like `rewind.client.cache`, verify the id found at the
+returned location.
+
+"""
+import array
+
+
+_DIGEST_MASK = (1 << 64) - 1
+
+# Digest value marking an empty slot.
+_EMPTY = 0
+
+_MIN_CAPACITY = 1 << 10
+
+# The table grows once it is more than this full.
+_MAX_LOAD = 0.6
+
+
+def _digest(eventid):
+    """Return a non-zero 64 bit digest of an event id.
+
+    Python's own (SipHash based) hash of bytes is both fast and well
+    distributed. Since it is salted per process the index must never be
+    persisted as is.
+
+    """
+    return (hash(eventid) & _DIGEST_MASK) or 1
+
+
+class EventIndex(object):
+
+    """Maps event ids to unsigned 64 bit integers.
+
+    Uses about 16 bytes of memory per slot, with slots kept at most 60% full.
+    Lookups and insertions take constant time on average.
+
+    """
+
+    def __init__(self, capacity=_MIN_CAPACITY):
+        """Constructor.
+
+        Parameters:
+        capacity -- the initial number of slots. Rounded up to a power of two.
+
+        """
+        size = _MIN_CAPACITY
+        while size < capacity:
+            size <<= 1
+        self._allocate(size)
+        self._count = 0
+        self._seqno = 0
+
+    def _allocate(self, size):
+        """Replace the table with an empty one with `size` slots."""
+        self._digests = array.array('Q', [_EMPTY]) * size
+        self._values = array.array('Q', [0]) * size
+        self._mask = size - 1
+
+    def _slot(self, digest):
+        """Return the slot that holds, or would hold, `digest`."""
+        digests = self._digests
+        mask = self._mask
+        slot = digest & mask
+        while True:
+            current = digests[slot]
+            if current == digest or current == _EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def __len__(self):
+        """Return the number of indexed event ids."""
+        return self._count
+
+    def __contains__(self, eventid):
+        """Return whether `eventid` has been indexed."""
+        return self._digests[self._slot(_digest(eventid))] != _EMPTY
+
+    def get(self, eventid, default=None):
+        """Return the value of `eventid`, or `default` if not indexed."""
+        slot = self._slot(_digest(eventid))
+        if self._digests[slot] == _EMPTY:
+            return default
+        return self._values[slot]
+
+    def __getitem__(self, eventid):
+        """Return the value of `eventid`. Raises `KeyError` if not indexed."""
+        slot = self._slot(_digest(eventid))
+        if self._digests[slot] == _EMPTY:
+            raise KeyError(eventid)
+        return self._values[slot]
+
+    def add(self, eventid, value):
+        """Index `eventid`, mapping it to `value`.
+
+        Parameters:
+        eventid -- the event id. Instance of bytes.
+        value   -- an unsigned 64 bit integer.
+
+        """
+        assert isinstance(eventid, bytes), type(eventid)
+        self._insert(_digest(eventid), value)
+
+    def _insert(self, digest, value):
+        """Insert a digest into the table, growing it if needed."""
+        slot = self._slot(digest)
+        if self._digests[slot] == _EMPTY:
+            if self._count + 1 > _MAX_LOAD * len(self._digests):
+                self._rebuild(len(self._digests) << 1)
+                slot = self._slot(digest)
+            self._digests[slot] = digest
+            self._count += 1
+        self._values[slot] = value
+
+    def _rebuild(self, size, keep=None):
+        """Rehash all entries into a table of `size` slots.
+
+        Parameters:
+        size -- the number of slots of the new table.
+        keep -- an optional function given a value that returns whether the
+                entry should be kept.
+
+        """
+        digests, values = self._digests, self._values
+        self._allocate(size)
+        self._count = 0
+        for digest, value in zip(digests, values):
+            if digest != _EMPTY and (keep is None or keep(value)):
+                slot = self._slot(digest)
+                self._digests[slot] = digest
+                self._values[slot] = value
+                self._count += 1
+
+    def prune(self, minvalue):
+        """Remove all entries with a value less than `minvalue`."""
+        self._rebuild(len(self._digests), lambda value: value >= minvalue)
+
+    def clear(self):
+        """Remove all entries."""
+        self._allocate(_MIN_CAPACITY)
+        self._count = 0
+
+    def track(self, events):
+        """Index events as they are being consumed.
+
+        Each event id is mapped to a sequence number, counting every event
+        ever tracked by this index.
+
+        Parameters:
+        events -- an iterable of `(eventid, eventdata)` tuples, for example
+                  the result of `rewind.client.query_events` or
+                  `rewind.client.yield_events_after`.
+
+        Yields the events unmodified.
+
+        """
+        for event in events:
+            self._insert(_digest(event[0]), self._seqno)
+            self._seqno += 1
+            yield event
@@ -0,0 +1,282 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Metrics and tracing hooks for the client.
+
+The functions in `rewind.client` report what they are doing to the currently
+installed `Instrumentation`. The default one is disabled, costing a single
+attribute check per query batch, publish and catch-up. To collect metrics,
+install an instance of a subclass using `set_instrumentation()`::
+
+    metrics = PrometheusInstrumentation()
+    set_instrumentation(metrics)
+    ...
+    print(metrics.render())
+
+All times handed to the hooks are in seconds since the epoch, as returned by
+`time.time()`.
+
+"""
+import bisect
+import threading
+
+
+class Instrumentation(object):
+
+    """Receives measurements from the client. Does nothing by default.
+
+    Subclasses override the hooks they are interested in and set `enabled`
+    to True. Hooks may be called concurrently from multiple threads.
+
+    """
+
+    # Whether the client should bother measuring at all.
+    enabled = False
+
+    def query_batch(self, start, end, nevents, nbytes):
+        """Called for every batch of events received by `query_events`.
+
+        Parameters:
+        start   -- when the query for the batch was sent.
+        end     -- when the whole batch had been received.
+        nevents -- the number of events in the batch.
+        nbytes  -- the total size of the event data in the batch.
+
+        """
+        pass
+
+    def query(self, start, end, nevents):
+        """Called when `query_events` has yielded all its events.
+
+        Parameters:
+        start   -- when the first batch was queried for.
+        end     -- when the last event had been consumed.
+        nevents -- the total number of events yielded.
+
+        """
+        pass
+
+    def publish(self, start, end, nbytes):
+        """Called for every event published by `publish_event`.
+
+        Parameters:
+        start  -- when the event was sent.
+        end    -- when Rewind had acknowledged it.
+        nbytes -- the size of the event.
+
+        """
+        pass
+
+    def catchup(self, start, end, nevents):
+        """Called when a streamed event required querying to catch up.
+
+        Parameters:
+        start   -- when the gap was detected.
+        end     -- when the last missed event had been consumed.
+        nevents -- the number of missed events that were queried for.
+
+        """
+        pass
+
+
+# The currently installed instrumentation.
+current = Instrumentation()
+
+
+def set_instrumentation(instrumentation):
+    """Install an instrumentation, replacing the current one.
+
+    Parameters:
+    instrumentation -- an `Instrumentation` instance, or None to uninstall
+                       the current one.
+
+    """
+    global current
+    current = instrumentation if instrumentation else Instrumentation()
+
+
+def get_instrumentation():
+    """Return the currently installed instrumentation."""
+    return current
+
+
+class _Histogram(object):
+
+    """A Prometheus style histogram with cumulative buckets."""
+
+    def __init__(self, buckets):
+        """Constructor.
+
+        Parameters:
+        buckets -- the sorted upper bounds of the buckets.
+
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Record a value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name):
+        """Return the histogram in Prometheus text format lines."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('{0}_bucket{{le="{1!r}"}} {2}'.format(
+                name, float(bound), cumulative))
+        lines.append('{0}_bucket{{le="+Inf"}} {1}'.format(name, self.count))
+        lines.append('{0}_sum {1!r}'.format(name, float(self.sum)))
+        lines.append('{0}_count {1}'.format(name, self.count))
+        return lines
+
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_SIZE_BUCKETS = (1, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PrometheusInstrumentation(Instrumentation):
+
+    """Collects counters and histograms exportable in Prometheus text format.
+
+    Call `render()` to get the current values, for example from an HTTP
+    handler serving `/metrics`.
+
+    """
+
+    enabled = True
+
+    def __init__(self, prefix='rewind_client', latency_buckets=None,
+                 size_buckets=None):
+        """Constructor.
+
+        Parameters:
+        prefix          -- the prefix of all metric names.
+        latency_buckets -- the upper bounds, in seconds, of latency
+                           histogram buckets.
+        size_buckets    -- the upper bounds of the batch size histogram
+                           buckets.
+
+        """
+        latency_buckets = latency_buckets or _LATENCY_BUCKETS
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {
+            'query_events_total': 0,
+            'query_bytes_total': 0,
+            'queries_total': 0,
+            'published_events_total': 0,
+            'published_bytes_total': 0,
+            'catchups_total': 0,
+            'catchup_events_total': 0,
+        }
+        self._histograms = {
+            'query_batch_seconds': _Histogram(latency_buckets),
+            'query_batch_events': _Histogram(size_buckets or _SIZE_BUCKETS),
+            'publish_seconds': _Histogram(latency_buckets),
+            'catchup_seconds': _Histogram(latency_buckets),
+        }
+
+    def query_batch(self, start, end, nevents, nbytes):
+        """Count a received query batch."""
+        with self._lock:
+            self._counters['query_events_total'] += nevents
+            self._counters['query_bytes_total'] += nbytes
+            self._histograms['query_batch_seconds'].observe(end - start)
+            self._histograms['query_batch_events'].observe(nevents)
+
+    def query(self, start, end, nevents):
+        """Count a completed query."""
+        with self._lock:
+            self._counters['queries_total'] += 1
+
+    def publish(self, start, end, nbytes):
+        """Count a published event."""
+        with self._lock:
+            self._counters['published_events_total'] += 1
+            self._counters['published_bytes_total'] += nbytes
+            self._histograms['publish_seconds'].observe(end - start)
+
+    def catchup(self, start, end, nevents):
+        """Count a catch-up."""
+        with self._lock:
+            self._counters['catchups_total'] += 1
+            self._counters['catchup_events_total'] += nevents
+            self._histograms['catchup_seconds'].observe(end - start)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                fullname = '{0}_{1}'.format(self._prefix, name)
+                lines.append('# TYPE {0} counter'.format(fullname))
+                lines.append('{0} {1}'.format(fullname, value))
+            for name, histogram in sorted(self._histograms.items()):
+                fullname = '{0}_{1}'.format(self._prefix, name)
+                lines.append('# TYPE {0} histogram'.format(fullname))
+                lines.extend(histogram.render(fullname))
+        return '\n'.join(lines) + '\n'
+
+
+def _nanoseconds(seconds):
+    """Convert seconds since the epoch to integer nanoseconds."""
+    return int(seconds * 1e9)
+
+
+class TracingInstrumentation(Instrumentation):
+
+    """Records every measurement as a span using an OpenTelemetry tracer.
+
+    Works with any tracer having the `start_span(name, start_time=...,
+    attributes=...)` method returning spans with an `end(end_time=...)`
+    method, taking times in nanoseconds. The OpenTelemetry API is not a
+    dependency of this package.
+
+    """
+
+    enabled = True
+
+    def __init__(self, tracer):
+        """Constructor.
+
+        Parameters:
+        tracer -- the tracer to create spans with. For example
+                  `opentelemetry.trace.get_tracer(__name__)`.
+
+        """
+        self._tracer = tracer
+
+    def _span(self, name, start, end, attributes):
+        """Record a span that has already ended."""
+        span = self._tracer.start_span(name,
+                                       start_time=_nanoseconds(start),
+                                       attributes=attributes)
+        span.end(end_time=_nanoseconds(end))
+
+    def query_batch(self, start, end, nevents, nbytes):
+        """Record a span for a received query batch."""
+        self._span('rewind.query_batch', start, end,
+                   {'rewind.events': nevents, 'rewind.bytes': nbytes})
+
+    def query(self, start, end, nevents):
+        """Record a span for a completed query."""
+        self._span('rewind.query', start, end, {'rewind.events': nevents})
+
+    def publish(self, start, end, nbytes):
+        """Record a span for a published event."""
+        self._span('rewind.publish', start, end, {'rewind.bytes': nbytes})
+
+    def catchup(self, start, end, nevents):
+        """Record a span for a catch-up."""
+        self._span('rewind.catchup', start, end, {'rewind.events': nevents})
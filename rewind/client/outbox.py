@@ -0,0 +1,453 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Publishing through a durable local outbox.
+
+`rewind.client.publish_event` waits for Rewind, so a producer stalls while
+Rewind is slow or unreachable. An `Outbox` instead appends events to a
+write-ahead log on local disk and returns right away. A background thread
+drains the log to Rewind in pipelined batches, retrying for as long as
+Rewind is unreachable::
+
+    with Outbox(context, 'tcp://127.0.0.1:8090', '/var/lib/app/outbox') as ob:
+        ob.publish(event)
+
+Events are published in the order they were appended, also across restarts.
+Delivery is at least once: events that were sent but whose acknowledgement
+was not recorded before a crash or an outage are sent again.
+
+The log is a series of preallocated, memory mapped segment files. Appending
+is a copy into memory; the log is synced to disk in groups, every
+`sync_interval` seconds, by another background thread. `sync()` waits for
+everything appended so far to be on disk. The position up to which events
+have been acknowledged is stored in a cursor file next to the segments, and
+segments are deleted once every event in them has been acknowledged.
+
+Every record in a segment consists of a header, holding a record type, the
+length of the event and its CRC-32 checksum, followed by the event. A record
+that is torn by a crash fails its checksum, ending the log.
+
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import zmq
+
+from rewind.client import TimeoutException
+from rewind.client.batch import BatchPublisher
+from rewind.client.checkpoint import _sync_directory
+from rewind.client.checkpoint import FileCheckpointStore
+
+logger = logging.getLogger(__name__)
+
+# Record header: type, event length and CRC-32 of the event.
+_HEADER = struct.Struct('<BII')
+
+# Record types. Segments are zero filled, so an end record is what follows
+# the last record written.
+_END = 0
+_EVENT = 1
+_ROLL = 2
+
+# Seconds between checking whether the background threads have died while
+# waiting.
+_POLL_INTERVAL = 0.1
+
+_CURSOR_NAME = 'outbox'
+_SEGMENT_SUFFIX = '.wal'
+
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+def _segment_name(number):
+    """Return the file name of a segment."""
+    return '{0:016d}{1}'.format(number, _SEGMENT_SUFFIX)
+
+
+def _read_record(buf, offset):
+    """Read the record at an offset of a segment.
+
+    Returns the tuple `(type, event, next offset)`. The type is `_END` for a
+    missing or torn record, and `_ROLL` at the end of the segment.
+
+    """
+    if offset + _HEADER.size > len(buf):
+        return _ROLL, None, None
+    rtype, length, crc = _HEADER.unpack_from(buf, offset)
+    if rtype != _EVENT:
+        return (rtype if rtype == _ROLL else _END), None, None
+    start = offset + _HEADER.size
+    if start + length > len(buf):
+        return _END, None, None
+    event = buf[start:start + length]
+    if zlib.crc32(event) & 0xffffffff != crc:
+        return _END, None, None
+    return _EVENT, event, start + length
+
+
+class Outbox(object):
+
+    """Publishes events through a write-ahead log on local disk."""
+
+    def __init__(self, context, endpoint, directory,
+                 segment_bytes=64 * 1024 * 1024, window=100, batch_size=1000,
+                 sync_interval=0.05, timeout=5.0, retry_interval=1.0):
+        """Constructor. Recovers the log and starts the background threads.
+
+        Parameters:
+        context        -- the ZeroMQ context to create sockets from.
+        endpoint       -- the query endpoint of the Rewind instance.
+        directory      -- the directory to keep the log in. Created if it
+                          does not exist. Must not be shared with another
+                          outbox.
+        segment_bytes  -- the size of every segment file. Bounds the size of
+                          a single event.
+        window         -- the maximum number of events in flight to Rewind.
+        batch_size     -- the maximum number of events sent before the
+                          cursor is stored.
+        sync_interval  -- the number of seconds between syncing appended
+                          events to disk.
+        timeout        -- the number of seconds to wait for Rewind to
+                          acknowledge an event before reconnecting.
+        retry_interval -- the number of seconds to wait before reconnecting.
+
+        """
+        assert segment_bytes > 2 * _HEADER.size
+        self._context = context
+        self._endpoint = endpoint
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._window = window
+        self._batch_size = batch_size
+        self._sync_interval = sync_interval
+        self._timeout = timeout
+        self._retry_interval = retry_interval
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closing = threading.Event()
+        self._closed = False
+        self._maps = {}
+        self._dirty = set()
+        self._obsolete = set()
+        self._appended = 0
+        self._synced = 0
+        self._flushed = 0
+        self.failed = 0
+
+        self._store = FileCheckpointStore(directory)
+        self._recover()
+
+        self._flusher = threading.Thread(target=self._flush_loop,
+                                         name='rewind-outbox-flusher')
+        self._committer = threading.Thread(target=self._commit_loop,
+                                           name='rewind-outbox-committer')
+        for thread in (self._flusher, self._committer):
+            thread.daemon = True
+            thread.start()
+
+    @property
+    def pending(self):
+        """The number of appended events not yet acknowledged by Rewind."""
+        with self._lock:
+            return self._appended - self._flushed
+
+    def publish(self, event):
+        """Append an event to the outbox, to be published in the background.
+
+        Returns without waiting for the event to be synced to disk or
+        published. See `sync()`.
+
+        Parameters:
+        event -- event to be published. Is instance of bytes.
+
+        """
+        assert isinstance(event, bytes), type(event)
+        size = _HEADER.size + len(event)
+        if size + _HEADER.size > self._segment_bytes:
+            raise ValueError("Event of {0} bytes does not fit in a segment of"
+                             " {1} bytes.".format(len(event),
+                                                  self._segment_bytes))
+        header = _HEADER.pack(_EVENT, len(event),
+                              zlib.crc32(event) & 0xffffffff)
+        with self._lock:
+            assert not self._closed, "Outbox is closed."
+            segment, offset = self._head
+            if offset + size + _HEADER.size > self._segment_bytes:
+                segment, offset = self._roll()
+            buf = self._maps[segment]
+            start = offset + _HEADER.size
+            buf[start:start + len(event)] = event
+            buf[offset:start] = header
+            self._head = (segment, start + len(event))
+            self._dirty.add(segment)
+            self._appended += 1
+            self._changed.notify_all()
+
+    def sync(self, timeout=None):
+        """Wait for all events appended so far to be synced to disk.
+
+        Returns whether they were synced within `timeout` seconds, unless it
+        is None. Returns False if the outbox is closed meanwhile.
+
+        """
+        with self._lock:
+            target = self._appended
+            return self._wait(lambda: self._synced >= target, timeout)
+
+    def drain(self, timeout=None):
+        """Wait for all events appended so far to be acknowledged by Rewind.
+
+        Returns whether they were acknowledged within `timeout` seconds,
+        unless it is None. Returns False if the outbox is closed meanwhile,
+        or failed.
+
+        """
+        with self._lock:
+            target = self._appended
+            return self._wait(lambda: self._flushed >= target, timeout)
+
+    def _wait(self, predicate, timeout):
+        """Wait for a predicate to become true. Requires the lock.
+
+        Returns False if it did not within `timeout` seconds, unless it is
+        None, or will not since the outbox is closed or a background thread
+        has died.
+
+        """
+        deadline = None if timeout is None else _monotonic() + timeout
+        while not predicate():
+            if (self._closed or not self._flusher.is_alive() or
+                    not self._committer.is_alive()):
+                return False
+            wait = _POLL_INTERVAL
+            if deadline is not None:
+                remaining = deadline - _monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            # A dying thread does not notify, hence the polling.
+            self._changed.wait(wait)
+        return True
+
+    def close(self):
+        """Stop publishing, sync the log to disk and close it.
+
+        Events not yet acknowledged are published when the outbox is opened
+        again.
+
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._changed.notify_all()
+        self._closing.set()
+        self._flusher.join()
+        self._committer.join()
+        for buf in self._maps.values():
+            buf.close()
+        self._maps = {}
+        self._store.close()
+
+    def __enter__(self):
+        """Enter the runtime context of the outbox."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the outbox."""
+        self.close()
+
+    def _path(self, segment):
+        """Return the path of a segment file."""
+        return os.path.join(self._directory, _segment_name(segment))
+
+    def _open_segment(self, segment, create=False):
+        """Memory map a segment file, preallocating it if created."""
+        path = self._path(segment)
+        with open(path, 'w+b' if create else 'r+b') as f:
+            if create or not os.fstat(f.fileno()).st_size:
+                # Zero filled, so it holds nothing but an end record.
+                f.truncate(self._segment_bytes)
+            self._maps[segment] = mmap.mmap(f.fileno(), 0)
+        if create:
+            _sync_directory(self._directory)
+
+    def _roll(self):
+        """Continue the log in a new segment. Requires the lock."""
+        segment, offset = self._head
+        if offset + _HEADER.size <= self._segment_bytes:
+            self._maps[segment][offset:offset + _HEADER.size] = \
+                _HEADER.pack(_ROLL, 0, 0)
+            self._dirty.add(segment)
+        self._open_segment(segment + 1, create=True)
+        self._head = (segment + 1, 0)
+        return self._head
+
+    def _recover(self):
+        """Find the cursor and the end of the log, and count the events."""
+        segments = sorted(int(name[:-len(_SEGMENT_SUFFIX)])
+                          for name in os.listdir(self._directory)
+                          if name.endswith(_SEGMENT_SUFFIX))
+        cursor = self._store.load(_CURSOR_NAME)
+        if cursor is not None:
+            segment, offset = cursor.split(b':')
+            cursor = (int(segment), int(offset))
+        elif segments:
+            cursor = (segments[0], 0)
+        else:
+            cursor = (0, 0)
+        for segment in segments:
+            if segment < cursor[0]:
+                # Left behind by a crash before it was deleted.
+                os.remove(self._path(segment))
+            else:
+                self._open_segment(segment)
+        created = cursor[0] not in self._maps
+        if created:
+            self._open_segment(cursor[0], create=True)
+
+        # Events following a torn record are not trusted either.
+        segment, offset = cursor
+        count = 0
+        while True:
+            rtype, _, nextoffset = _read_record(self._maps[segment], offset)
+            if rtype == _EVENT:
+                count += 1
+                offset = nextoffset
+            elif rtype == _ROLL and segment + 1 in self._maps:
+                segment, offset = segment + 1, 0
+            else:
+                break
+        for later in [s for s in self._maps if s > segment]:
+            self._maps.pop(later).close()
+            os.remove(self._path(later))
+
+        self._cursor = cursor
+        self._head = (segment, offset)
+        self._appended = self._synced = count
+        logger.info('Recovered outbox with %d unpublished events.', count)
+        if not created:
+            # Never append after a possibly torn record.
+            self._roll()
+
+    def _read_batch(self):
+        """Wait for and return events following the cursor.
+
+        Returns the tuple `(events, cursor after them)`, or None if closing.
+
+        """
+        with self._lock:
+            while self._cursor == self._head and not self._closed:
+                self._changed.wait()
+            if self._closed:
+                return None
+            segment, offset = self._cursor
+            head = self._head
+            maps = dict(self._maps)
+        # Records before the head are never modified, so they can be read
+        # without holding the lock.
+        events = []
+        while (segment, offset) != head and len(events) < self._batch_size:
+            rtype, event, nextoffset = _read_record(maps[segment], offset)
+            if rtype == _ROLL:
+                segment, offset = segment + 1, 0
+                continue
+            assert rtype == _EVENT, (segment, offset)
+            events.append(event)
+            offset = nextoffset
+        return events, (segment, offset)
+
+    def _connect(self):
+        """Return a DEALER socket connected to Rewind."""
+        socket = self._context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.SNDTIMEO, int(self._timeout * 1000))
+        socket.connect(self._endpoint)
+        return socket
+
+    def _flush_loop(self):
+        """Publish the events of the log until closed."""
+        funclogger = logger.getChild('flusher')
+        socket = None
+        try:
+            while True:
+                batch = self._read_batch()
+                if batch is None:
+                    return
+                events, cursor = batch
+                if socket is None:
+                    socket = self._connect()
+                try:
+                    failures = self._publish(socket, events)
+                except (TimeoutException, zmq.Again):
+                    if self._closing.is_set():
+                        return
+                    funclogger.warning('Rewind did not acknowledge events'
+                                       ' in time. Reconnecting.')
+                    socket.close()
+                    socket = None
+                    self._closing.wait(self._retry_interval)
+                    continue
+                for seqno, event, response in failures:
+                    funclogger.error('Rewind refused event: %r', response)
+                self._advance(cursor, len(events), len(failures))
+        except Exception:
+            funclogger.exception('Outbox flusher failed.')
+            raise
+        finally:
+            if socket is not None:
+                socket.close()
+
+    def _publish(self, socket, events):
+        """Publish events, returning the ones refused by Rewind."""
+        publisher = BatchPublisher(socket, self._window, self._timeout)
+        for event in events:
+            if self._closing.is_set():
+                raise TimeoutException("Outbox closed.")
+            publisher.publish(event)
+        return publisher.flush()
+
+    def _advance(self, cursor, nevents, nfailed):
+        """Store a new cursor and delete the segments before it."""
+        self._store.save(_CURSOR_NAME,
+                         '{0}:{1}'.format(*cursor).encode('ascii'))
+        with self._lock:
+            self._cursor = cursor
+            self._flushed += nevents
+            self.failed += nfailed
+            # Deleted by the committer, which might be syncing them now.
+            self._obsolete.update(segment for segment in self._maps
+                                  if segment < cursor[0])
+            self._changed.notify_all()
+
+    def _commit_loop(self):
+        """Sync appended events to disk in groups until closed."""
+        while True:
+            closing = self._closing.wait(self._sync_interval)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                target = self._appended
+                maps = [self._maps[segment] for segment in dirty]
+                removed = [(segment, self._maps.pop(segment))
+                           for segment in self._obsolete]
+                self._obsolete = set()
+            for buf in maps:
+                buf.flush()
+            for segment, buf in removed:
+                buf.close()
+                os.remove(self._path(segment))
+            with self._lock:
+                self._synced = max(self._synced, target)
+                self._changed.notify_all()
+            if closing:
+                return
@@ -0,0 +1,185 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Replaying history over multiple connections in parallel.
+
+A replay using `rewind.client.query_events` is strictly sequential since each
+batch is queried from the last event id of the previous one. If a few event
+ids along the history are known beforehand, for example checkpoints from
+earlier runs, the history can be split up into ranges that are queried
+concurrently over separate sockets.
+
+"""
+import threading
+try:
+    # Python < 3
+    import Queue as queue
+except ImportError:
+    # Python >= 3
+    import queue
+
+import zmq
+
+from rewind.client import _real_query_multipart
+
+
+# How often, in seconds, a blocked worker checks whether the consumer has gone
+# away.
+_STOP_POLL_INTERVAL = 0.1
+
+
+def split_ranges(boundaries):
+    """Split history into `(from_, to)` ranges at the given event ids.
+
+    Parameters:
+    boundaries -- a chronologically ordered sequence of event ids.
+
+    Returns a list of `len(boundaries) + 1` ranges that, queried one after
+    another, cover the whole history exactly once. The first range starts at
+    the beginning of time and the last one ends at the latest event.
+
+    """
+    starts = [None] + list(boundaries)
+    ends = list(boundaries) + [None]
+    return list(zip(starts, ends))
+
+
+class _RangeWorker(threading.Thread):
+
+    """Thread that queries ranges of events over its own socket."""
+
+    def __init__(self, context, endpoint, ranges, outputs, stopped):
+        """Constructor.
+
+        Parameters:
+        context  -- the ZeroMQ context to create the socket from.
+        endpoint -- the query endpoint of the Rewind instance.
+        ranges   -- a queue of `(index, from_, to)` ranges left to query.
+        outputs  -- a function that given a range index returns the queue
+                    that its batches should be put on.
+        stopped  -- an event that is set when the consumer has gone away.
+
+        """
+        super(_RangeWorker, self).__init__(name="rewind-parallel-query")
+        self.daemon = True
+        self._context = context
+        self._endpoint = endpoint
+        self._ranges = ranges
+        self._outputs = outputs
+        self._stopped = stopped
+
+    def run(self):
+        """Query ranges until there are no ranges left."""
+        socket = self._context.socket(zmq.REQ)
+        socket.connect(self._endpoint)
+        try:
+            while not self._stopped.is_set():
+                try:
+                    index, from_, to = self._ranges.get_nowait()
+                except queue.Empty:
+                    return
+                self._query_range(socket, index, from_, to)
+        finally:
+            socket.close(0)
+
+    def _query_range(self, socket, index, from_, to):
+        """Query a single range, putting its batches on its output queue."""
+        output = self._outputs(index)
+        done = False
+        while not done and not self._stopped.is_set():
+            try:
+                done, events = _real_query_multipart(socket, from_, to)
+            except Exception as e:
+                self._put(output, (index, True, e))
+                return
+            if events:
+                from_ = events[-1][0]
+            self._put(output, (index, done, events))
+
+    def _put(self, output, item):
+        """Put an item on an output queue unless asked to stop."""
+        while not self._stopped.is_set():
+            try:
+                output.put(item, timeout=_STOP_POLL_INTERVAL)
+            except queue.Full:
+                continue
+            else:
+                return
+
+
+def parallel_query(context, endpoint, boundaries, workers=4, ordered=True,
+                   depth=2):
+    """Yield all events, querying ranges of the history in parallel.
+
+    Parameters:
+    context    -- the ZeroMQ context to create sockets from.
+    endpoint   -- the query endpoint of the Rewind instance to query.
+    boundaries -- a chronologically ordered sequence of event ids that the
+                  history is split up at. See `split_ranges`.
+    workers    -- the number of ranges queried concurrently, each over its
+                  own REQ socket.
+    ordered    -- whether events should be yielded in chronological order.
+                  If False, events are yielded batch by batch as soon as any
+                  worker has received them.
+    depth      -- the number of batches buffered per range (ordered) or per
+                  worker (unordered). Bounds the memory used.
+
+    Raises `QueryException` if a query failed, usually because one of the
+    boundaries does not exist in the event store.
+
+    This function returns nothing, but yields `(eventid, eventdata)` tuples.
+
+    """
+    assert workers > 0, workers
+    assert depth > 0, depth
+    ranges = split_ranges(boundaries)
+
+    todo = queue.Queue()
+    for index, (from_, to) in enumerate(ranges):
+        todo.put((index, from_, to))
+
+    if ordered:
+        # Each range gets a queue of its own. Ranges are handed out in order,
+        # so the range the consumer is waiting for is always being worked on.
+        outputs = [queue.Queue(maxsize=depth) for _ in ranges]
+        get_output = outputs.__getitem__
+    else:
+        shared = queue.Queue(maxsize=depth * workers)
+
+        def get_output(index):
+            return shared
+
+    stopped = threading.Event()
+    threads = [_RangeWorker(context, endpoint, todo, get_output, stopped)
+               for _ in range(min(workers, len(ranges)))]
+    for thread in threads:
+        thread.start()
+
+    try:
+        if ordered:
+            for output in outputs:
+                done = False
+                while not done:
+                    _, done, events = output.get()
+                    if isinstance(events, Exception):
+                        raise events
+                    for event in events:
+                        yield event
+        else:
+            remaining = len(ranges)
+            while remaining:
+                _, done, events = shared.get()
+                if isinstance(events, Exception):
+                    raise events
+                if done:
+                    remaining -= 1
+                for event in events:
+                    yield event
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,291 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""A pool of query sockets shared between threads.
+
+ZeroMQ sockets must not be used by multiple threads at the same time, and a
+REQ socket has to alternate strictly between sending and receiving. Instead of
+connecting a new socket for every request, threads can check out a connected
+socket from a `RewindPool` and hand it back when done::
+
+    pool = RewindPool(context, 'tcp://localhost:8090')
+    with pool.connection() as socket:
+        rewind.client.publish_event(socket, b'event')
+
+A socket is considered broken, and is closed rather than handed back to the
+pool, if an exception is raised while it is checked out or if it still has an
+unread reply. This way a `QueryException` or a timeout halfway through a
+conversation does not poison the pool.
+
+"""
+import contextlib
+import logging
+import threading
+import time
+
+import zmq
+
+from rewind.client import publish_event
+from rewind.client import query_events
+from rewind.client.sockets import connect_query
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+
+    """Raised when no socket could be checked out in time."""
+
+    pass
+
+
+class PoolStatistics(object):
+
+    """Counters describing how a pool has been used.
+
+    Attributes:
+    checkouts        -- the number of sockets checked out.
+    waits            -- the number of checkouts that had to wait for another
+                        thread to hand back a socket.
+    wait_seconds     -- the total time spent waiting for sockets.
+    max_wait_seconds -- the longest time spent waiting for a socket.
+    created          -- the number of sockets created.
+    recycled         -- the number of broken sockets that were closed
+                        instead of returned to the pool.
+
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.reset()
+
+    def reset(self):
+        """Reset all counters to zero."""
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.created = 0
+        self.recycled = 0
+
+    @property
+    def average_wait_seconds(self):
+        """The average time a checkout spent waiting for a socket."""
+        return self.wait_seconds / self.checkouts if self.checkouts else 0.0
+
+
+class RewindPool(object):
+
+    """A thread-safe pool of sockets connected to the query endpoint.
+
+    Sockets are created lazily, up to `maxsize` of them. When all of them are
+    checked out, further checkouts wait for a socket to be handed back.
+
+    """
+
+    def __init__(self, context, endpoint, maxsize=8, profile='default',
+                 socket_type=zmq.REQ):
+        """Constructor.
+
+        Parameters:
+        context     -- the ZeroMQ context to create sockets from.
+        endpoint    -- the query endpoint of a Rewind instance.
+        maxsize     -- the maximum number of sockets, checked out or not.
+        profile     -- the name of the socket option profile to use. See
+                       `rewind.client.sockets`.
+        socket_type -- the ZeroMQ socket type. REQ by default.
+
+        """
+        assert isinstance(maxsize, int) and maxsize > 0
+        self._context = context
+        self._endpoint = endpoint
+        self._maxsize = maxsize
+        self._profile = profile
+        self._socket_type = socket_type
+
+        self._condition = threading.Condition(threading.Lock())
+        self._idle = []
+        self._nsockets = 0
+        self._closed = False
+        self.statistics = PoolStatistics()
+
+    @property
+    def endpoint(self):
+        """The endpoint the sockets of the pool are connected to."""
+        return self._endpoint
+
+    @property
+    def size(self):
+        """The number of sockets currently created by the pool."""
+        return self._nsockets
+
+    @property
+    def idle(self):
+        """The number of sockets waiting to be checked out."""
+        return len(self._idle)
+
+    def checkout(self, timeout=None):
+        """Check out a socket, waiting for one if the pool is exhausted.
+
+        Parameters:
+        timeout -- the maximum number of seconds to wait for a socket. None
+                   means waiting forever.
+
+        Returns a connected socket that must be handed back using `checkin`.
+        Raises `PoolTimeout` if no socket became available in time.
+
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The pool has been closed.")
+            waited = None
+            if not self._idle and self._nsockets >= self._maxsize:
+                waitstart = time.time()
+                deadline = None if timeout is None else waitstart + timeout
+                while not self._idle and self._nsockets >= self._maxsize:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise PoolTimeout("Timed out waiting for a"
+                                              " socket.")
+                    self._condition.wait(remaining)
+                    if self._closed:
+                        raise RuntimeError("The pool has been closed.")
+                waited = time.time() - waitstart
+
+            stats = self.statistics
+            stats.checkouts += 1
+            if waited is not None:
+                stats.waits += 1
+                stats.wait_seconds += waited
+                stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+            if self._idle:
+                return self._idle.pop()
+            self._nsockets += 1
+            stats.created += 1
+
+        try:
+            return connect_query(self._context, self._endpoint,
+                                 self._profile, self._socket_type)
+        except:
+            self._forget()
+            raise
+
+    def checkin(self, socket, broken=False):
+        """Hand back a checked out socket.
+
+        Parameters:
+        socket -- a socket previously returned by `checkout`.
+        broken -- whether the socket has been left in an unknown state, for
+                  example because an exception was raised halfway through a
+                  request. Broken sockets are closed and replaced by new
+                  ones when needed.
+
+        """
+        if not broken and not self._is_healthy(socket):
+            broken = True
+        if broken:
+            logger.getChild('checkin').info('Recycling broken socket.')
+            if not socket.closed:
+                socket.close(0)
+            with self._condition:
+                self.statistics.recycled += 1
+            self._forget()
+            return
+
+        with self._condition:
+            if self._closed:
+                socket.close(0)
+                self._nsockets -= 1
+                return
+            self._idle.append(socket)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """Context manager checking out a socket and handing it back.
+
+        The socket is considered broken if the block raises an exception.
+
+        Parameters:
+        timeout -- see `checkout`.
+
+        """
+        socket = self.checkout(timeout)
+        try:
+            yield socket
+        except:
+            self.checkin(socket, broken=True)
+            raise
+        self.checkin(socket)
+
+    def query_events(self, from_=None, to=None, copy=True, timeout=None):
+        """Query Rewind using a pooled socket.
+
+        The socket is checked out until all events have been yielded. See
+        `rewind.client.query_events` for parameters. A query that is not
+        iterated to its end, or that timed out, leaves the socket halfway
+        through a conversation, so it is recycled.
+
+        """
+        with self.connection() as socket:
+            for event in query_events(socket, from_, to, copy, timeout):
+                yield event
+
+    def publish_event(self, event, timeout=None):
+        """Publish an event using a pooled socket.
+
+        See `rewind.client.publish_event`.
+
+        """
+        with self.connection() as socket:
+            publish_event(socket, event, timeout)
+
+    def close(self, linger=None):
+        """Close all idle sockets and refuse further checkouts.
+
+        Sockets currently checked out are closed when handed back.
+
+        Parameters:
+        linger -- see `zmq.Socket.close`.
+
+        """
+        with self._condition:
+            self._closed = True
+            for socket in self._idle:
+                socket.close(linger)
+            self._nsockets -= len(self._idle)
+            self._idle = []
+            self._condition.notify_all()
+
+    def __enter__(self):
+        """Enter the runtime context of the pool."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the pool."""
+        self.close()
+
+    def _forget(self):
+        """Make room for a new socket after one has been discarded."""
+        with self._condition:
+            self._nsockets -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _is_healthy(socket):
+        """Return whether a socket can be handed out again.
+
+        A socket with an unread reply is halfway through a conversation.
+
+        """
+        if socket.closed:
+            return False
+        return not socket.getsockopt(zmq.EVENTS) & zmq.POLLIN
@@ -0,0 +1,130 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Querying that overlaps network I/O with processing of events.
+
+`rewind.client.query_events` does not ask Rewind for the next batch of events
+until the caller has consumed the current batch. The query functions in this
+module instead fetch batches in a background thread as soon as the last event
+id of the previous batch is known, keeping up to a fixed number of batches
+buffered in memory.
+
+"""
+import threading
+try:
+    # Python < 3
+    import Queue as queue
+except ImportError:
+    # Python >= 3
+    import queue
+
+from rewind.client import _real_query_multipart
+
+
+# How often, in seconds, a blocked fetcher thread checks whether the consumer
+# has gone away.
+_STOP_POLL_INTERVAL = 0.1
+
+
+class _BatchFetcher(threading.Thread):
+
+    """Thread that queries batches of events and buffers them in a queue.
+
+    The fetcher owns the socket while running. It only checks whether it
+    should stop between two batches so that the REQ socket is never left
+    waiting for a reply.
+
+    """
+
+    def __init__(self, socket, from_, to, depth):
+        """Constructor.
+
+        Parameters:
+        socket -- ZeroMQ REQ socket connected to a Rewind instance.
+        from_  -- the exclusive event id to start querying from, or None.
+        to     -- the inclusive event id to stop querying at, or None.
+        depth  -- the maximum number of batches to buffer.
+
+        """
+        super(_BatchFetcher, self).__init__(name="rewind-prefetch")
+        self.daemon = True
+        self.batches = queue.Queue(maxsize=depth)
+        self._socket = socket
+        self._from = from_
+        self._to = to
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Ask the thread to stop and wait for it to do so."""
+        self._stopped.set()
+        self.join()
+
+    def run(self):
+        """Fetch batches until all events have been queried."""
+        done = False
+        while not done and not self._stopped.is_set():
+            try:
+                done, events = _real_query_multipart(self._socket,
+                                                     self._from, self._to)
+            except Exception as e:
+                self._put((True, e))
+                return
+            if events:
+                self._from = events[-1][0]
+            self._put((done, events))
+
+    def _put(self, item):
+        """Put an item in the batch queue unless asked to stop."""
+        while not self._stopped.is_set():
+            try:
+                self.batches.put(item, timeout=_STOP_POLL_INTERVAL)
+            except queue.Full:
+                continue
+            else:
+                return
+
+
+def query_events(socket, from_=None, to=None, depth=2):
+    """Yield a queried range of events, prefetching batches in the background.
+
+    Parameters:
+    socket -- ZeroMQ socket to use. It must be previously connected to
+              a Rewind instance and of type REQ. It must not be used by
+              anyone else until the generator has been exhausted or closed.
+    from_  -- the (optional) event id for the (chronologically) earliest end
+              of the range. It is exclusive.
+    to     -- the (optional) event id for the (chronologically) latest end of
+              the range. It is inclusive.
+    depth  -- the maximum number of batches that are fetched ahead of the
+              consumer. Bounds the memory used to roughly `depth + 1`
+              batches.
+
+    Raises `QueryException` if a query failed.
+
+    See `rewind.client.query_events` for more information.
+
+    """
+    assert from_ is None or isinstance(from_, bytes)
+    assert to is None or isinstance(to, bytes)
+    assert depth > 0, depth
+
+    fetcher = _BatchFetcher(socket, from_, to, depth)
+    fetcher.start()
+    try:
+        first_msg = True
+        done = False
+        while not done:
+            done, events = fetcher.batches.get()
+            if isinstance(events, Exception):
+                raise events
+            for eventid, eventdata in events:
+                if first_msg:
+                    assert eventid != from_, "First message ID wrong"
+                    first_msg = False
+                yield (eventid, eventdata)
+    finally:
+        fetcher.stop()
@@ -0,0 +1,344 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Replaying events with a handler running in a pool of processes.
+
+Decoding and handling replayed events is usually CPU bound Python, which the
+GIL confines to a single core. A `ProcessPoolReplay` keeps the querying in
+the calling process and hands every received batch of events to one of a
+number of worker processes that call a handler for each event::
+
+    def decode(eventid, eventdata):
+        return json.loads(bytes(eventdata).decode())['user']
+
+    with ProcessPoolReplay(decode) as pool:
+        for user in pool.replay(socket):
+            ...
+
+Batches are written into slots of shared memory in the columnar layout of
+`rewind.client.columnar.EventBatch`, so only slot numbers and sizes are
+pickled, never events. What the handler returns is pickled back, except for
+None, which is left out. Results are yielded in the order of the events
+unless `ordered` is False.
+
+The handler must be a picklable module level function. It is called with
+the event data as a `memoryview` that is only valid during the call. Worker
+processes are not forked by default; see `rewind.client.dispatch`.
+Requires Python >= 3.8.
+
+"""
+import logging
+import multiprocessing
+import pickle
+import time
+from array import array
+
+from rewind.client import _query_batches
+from rewind.client.dispatch import _attach_shared_memory
+from rewind.client.dispatch import _default_mpcontext
+from rewind.client.dispatch import HandlerFailed
+
+try:
+    import Queue as queue
+except ImportError:
+    # Python >= 3
+    import queue
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checking whether workers have died while waiting.
+_POLL_INTERVAL = 0.1
+
+# Bytes per offset; offsets are stored as signed 64-bit integers.
+_OFFSET_SIZE = array('q').itemsize
+
+
+def _slot_size(idframes, dataframes):
+    """Return the number of bytes a batch of frames takes up in a slot."""
+    return (2 * (len(idframes) + 1) * _OFFSET_SIZE +
+            sum(len(frame) for frame in idframes) +
+            sum(len(frame) for frame in dataframes))
+
+
+def _chunks(idframes, dataframes, capacity):
+    """Split a batch of frames into chunks that each fit in a slot.
+
+    Yields `(idframes, dataframes)` tuples. Raises `ValueError` if a single
+    event does not fit.
+
+    """
+    if _slot_size(idframes, dataframes) <= capacity:
+        yield idframes, dataframes
+        return
+    start = 0
+    size = 2 * _OFFSET_SIZE
+    for i, (idframe, dataframe) in enumerate(zip(idframes, dataframes)):
+        eventsize = 2 * _OFFSET_SIZE + len(idframe) + len(dataframe)
+        if size + eventsize > capacity:
+            if i == start:
+                raise ValueError("Event of {0} bytes does not fit in a slot"
+                                 " of {1} bytes.".format(eventsize, capacity))
+            yield idframes[start:i], dataframes[start:i]
+            start = i
+            size = 2 * _OFFSET_SIZE
+        size += eventsize
+    yield idframes[start:], dataframes[start:]
+
+
+def _write_slot(buf, idframes, dataframes):
+    """Write a batch of frames into a slot.
+
+    The slot holds the id offsets, the data offsets, the concatenated ids and
+    the concatenated data, in that order. See `_read_slot`.
+
+    Returns the tuple `(nevents, idsbytes, databytes)` needed to read it.
+
+    """
+    ids = b''.join(idframes)
+    data = b''.join(dataframes)
+    nevents = len(idframes)
+    offsets = array('q', [0])
+    for frame in idframes:
+        offsets.append(offsets[-1] + len(frame))
+    offsets.append(0)
+    for frame in dataframes:
+        offsets.append(offsets[-1] + len(frame))
+    position = 0
+    for chunk in (offsets.tobytes(), ids, data):
+        buf[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return nevents, len(ids), len(data)
+
+
+def _read_slot(buf, nevents, idsbytes, databytes):
+    """Yield the `(eventid, eventdata)` tuples written to a slot.
+
+    Event ids are byte strings and event data are `memoryview`s of the slot.
+
+    """
+    noffsets = nevents + 1
+    offsets = buf[:2 * noffsets * _OFFSET_SIZE].cast('q')
+    position = 2 * noffsets * _OFFSET_SIZE
+    ids = bytes(buf[position:position + idsbytes])
+    data = buf[position + idsbytes:position + idsbytes + databytes]
+    try:
+        for i in range(nevents):
+            dataoffset = noffsets + i
+            yield (ids[offsets[i]:offsets[i + 1]],
+                   data[offsets[dataoffset]:offsets[dataoffset + 1]])
+    finally:
+        offsets.release()
+        data.release()
+
+
+def _worker_main(handler, slotnames, tasks, results):
+    """Call a handler with the events of the batches in shared memory."""
+    slots = [_attach_shared_memory(name) for name in slotnames]
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            sequence, slot, nevents, idsbytes, databytes = task
+            buf = slots[slot].buf
+            try:
+                output = []
+                for eventid, eventdata in _read_slot(buf, nevents, idsbytes,
+                                                     databytes):
+                    try:
+                        result = handler(eventid, eventdata)
+                    finally:
+                        eventdata.release()
+                    if result is not None:
+                        output.append(result)
+            except Exception as e:
+                logger.getChild('worker').exception('Handler failed.')
+                results.put((sequence, slot, e if _picklable(e) else
+                             RuntimeError(repr(e))))
+                return
+            results.put((sequence, slot, output))
+    finally:
+        for shm in slots:
+            shm.close()
+
+
+def _picklable(obj):
+    """Return whether an object can be pickled."""
+    try:
+        pickle.dumps(obj)
+    except Exception:
+        return False
+    return True
+
+
+class ProcessPoolReplay(object):
+
+    """Replays events to a handler running in a pool of processes."""
+
+    def __init__(self, handler, workers=None, ordered=True,
+                 slot_bytes=4 * 1024 * 1024, slots=None, mpcontext=None):
+        """Constructor. Starts the worker processes.
+
+        Parameters:
+        handler    -- picklable function called with `(eventid, eventdata)`
+                      for every event. Its return values are yielded by
+                      `replay()`.
+        workers    -- the number of worker processes. Defaults to the
+                      number of CPUs.
+        ordered    -- whether results should be yielded in the order of the
+                      events. If False, the results of a batch are yielded as
+                      soon as it has been handled.
+        slot_bytes -- the size of each slot of shared memory. Bounds the size
+                      of a single event.
+        slots      -- the number of slots, bounding the number of batches in
+                      flight. Defaults to twice the number of workers.
+        mpcontext  -- the (optional) `multiprocessing` context to start the
+                      workers with. Defaults to the forkserver start method
+                      where available, else spawn.
+
+        """
+        from multiprocessing import shared_memory
+        mpcontext = mpcontext or _default_mpcontext()
+        workers = workers or multiprocessing.cpu_count()
+        slots = slots or 2 * workers
+        assert slots >= workers, (slots, workers)
+        self._handlername = getattr(handler, '__name__', repr(handler))
+        self._ordered = ordered
+        self._slot_bytes = slot_bytes
+
+        self._slots = [shared_memory.SharedMemory(create=True,
+                                                  size=slot_bytes)
+                       for _ in range(slots)]
+        self._tasks = mpcontext.Queue()
+        self._results = mpcontext.Queue()
+        self._processes = [
+            mpcontext.Process(target=_worker_main,
+                              name='rewind-replay-{0}'.format(i),
+                              args=(handler, [shm.name for shm in self._slots],
+                                    self._tasks, self._results))
+            for i in range(workers)]
+        for process in self._processes:
+            process.daemon = True
+            process.start()
+
+        self._free = list(range(slots))
+        self._sequence = 0
+        self._nextyield = 0
+
+    def replay(self, socket, from_=None, to=None, timeout=None):
+        """Replay a queried range of events, yielding the handler results.
+
+        Parameters:
+        socket  -- ZeroMQ socket to use. It must be previously connected to
+                   a Rewind instance and of type REQ.
+        from_   -- see `rewind.client.query_events`.
+        to      -- see `rewind.client.query_events`.
+        timeout -- see `rewind.client.query_events`.
+
+        Raises `QueryException` if a query failed, `TimeoutException` if
+        Rewind did not reply in time and `HandlerFailed` if the handler
+        raised an exception, which fails the pool for good.
+
+        """
+        assert from_ is None or isinstance(from_, bytes)
+        assert to is None or isinstance(to, bytes)
+        while len(self._free) < len(self._slots):
+            # Discard what an abandoned replay left in flight.
+            self._collect({})
+        # The results of sequence numbers from `nextyield` on, by number.
+        finished = {}
+        self._nextyield = self._sequence
+        for frames in _query_batches(socket, from_, to, timeout):
+            for idframes, dataframes in _chunks(frames[0::2], frames[1::2],
+                                                self._slot_bytes):
+                while not self._can_submit():
+                    for result in self._collect(finished):
+                        yield result
+                self._submit(idframes, dataframes)
+        while len(self._free) < len(self._slots):
+            for result in self._collect(finished):
+                yield result
+
+    def _can_submit(self):
+        """Return whether another batch can be handed to the workers."""
+        if not self._free:
+            return False
+        # Bound the results waiting for an earlier batch to be handled.
+        return (not self._ordered or
+                self._sequence - self._nextyield < 2 * len(self._slots))
+
+    def _submit(self, idframes, dataframes):
+        """Write a batch to a free slot and hand it to the workers."""
+        slot = self._free.pop()
+        sizes = _write_slot(self._slots[slot].buf, idframes, dataframes)
+        self._tasks.put((self._sequence, slot) + sizes)
+        self._sequence += 1
+
+    def _collect(self, finished):
+        """Wait for a handled batch, returning the results now in turn."""
+        while True:
+            try:
+                sequence, slot, output = self._results.get(
+                    timeout=_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                self._check()
+        self._free.append(slot)
+        if isinstance(output, Exception):
+            raise HandlerFailed(self._handlername, repr(output))
+        if not self._ordered:
+            self._nextyield += 1
+            return output
+
+        finished[sequence] = output
+        results = []
+        while self._nextyield in finished:
+            results.extend(finished.pop(self._nextyield))
+            self._nextyield += 1
+        return results
+
+    def _check(self):
+        """Raise `HandlerFailed` if a worker process has died."""
+        for process in self._processes:
+            if not process.is_alive():
+                raise HandlerFailed(self._handlername,
+                                    "process exited with code {0}".format(
+                                        process.exitcode))
+
+    def close(self, timeout=5.0):
+        """Stop the worker processes and release the shared memory.
+
+        Parameters:
+        timeout -- the maximum number of seconds to wait for the worker
+                   processes to exit. Those still running are terminated.
+
+        """
+        for process in self._processes:
+            if process.is_alive():
+                self._tasks.put(None)
+        deadline = time.time() + timeout
+        for process in self._processes:
+            process.join(max(0, deadline - time.time()))
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        self._tasks.close()
+        self._results.close()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+
+    def __enter__(self):
+        """Enter the runtime context of the pool."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the pool."""
+        self.close()
@@ -0,0 +1,464 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Serialization and compression of events.
+
+Rewind stores events as opaque byte strings. The functions in this module
+wrap the ones in `rewind.client` to publish and receive arbitrary objects
+instead, using an `EventCodec`::
+
+    codec = EventCodec('msgpack', compression='zstd')
+    publish_event(socket, codec, {'type': 'UserCreated', 'id': 5})
+    for eventid, event in query_events(socket):
+        if event.codec == 'msgpack':
+            print(event.value)
+
+Every encoded event starts with a seven byte header: the magic bytes 0xFF
+(which never starts valid UTF-8 text) and 'RWC', the version of the header
+format, the id of the serializer and the id of the compression. Events can
+therefore always be decoded without knowing which codec encoded them, and
+data published without a codec is passed through untouched.
+
+Deserializing pickles runs arbitrary code, so events encoded using 'pickle'
+are only decoded if explicitly allowed::
+
+    decode(data, allowed=['json', 'pickle'])
+
+Received events are wrapped in `LazyEvent`s that are only decompressed and
+deserialized when their `value` is accessed, so skipping an event costs
+nothing.
+
+Built-in serializers are 'raw' (byte strings), 'json', 'pickle' and, if the
+`msgpack` package is installed, 'msgpack'. Built-in compressions are 'zlib'
+and, if the `zstandard` or `lz4` packages are installed, 'zstd' and 'lz4'.
+
+"""
+import json
+import pickle
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+import rewind.client as clients
+
+
+_MAGIC = b'\xffRWC'
+_VERSION = 1
+_HEADER_LENGTH = len(_MAGIC) + 3
+
+# Serializers that are not decoded unless explicitly allowed.
+_UNSAFE = frozenset(['pickle'])
+
+
+class CodecException(Exception):
+
+    """Raised when an event can not be encoded or decoded."""
+
+    pass
+
+
+class Serializer(object):
+
+    """Converts objects to and from byte strings.
+
+    Subclasses set `id`, a number between 0 and 255 unique among serializers,
+    and `name`, and are registered using `register_serializer`.
+
+    """
+
+    id = None
+    name = None
+
+    def dumps(self, obj):
+        """Return the byte string representation of an object."""
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """Return the object represented by a bytes-like object."""
+        raise NotImplementedError()
+
+
+class Compression(object):
+
+    """Compresses and decompresses byte strings.
+
+    Subclasses set `id`, a number between 1 and 255 unique among
+    compressions, and `name`, and are registered using
+    `register_compression`.
+
+    """
+
+    id = None
+    name = None
+
+    def compress(self, data):
+        """Return compressed data."""
+        raise NotImplementedError()
+
+    def decompress(self, data):
+        """Return decompressed data given a bytes-like object."""
+        raise NotImplementedError()
+
+
+class _RawSerializer(Serializer):
+
+    """Passes byte strings through."""
+
+    id = 0
+    name = 'raw'
+
+    def dumps(self, obj):
+        """Return a byte string unchanged."""
+        assert isinstance(obj, bytes), type(obj)
+        return obj
+
+    def loads(self, data):
+        """Return the data as a byte string."""
+        return bytes(data)
+
+
+class _JSONSerializer(Serializer):
+
+    """Serializes to compact UTF-8 encoded JSON."""
+
+    id = 1
+    name = 'json'
+
+    def dumps(self, obj):
+        """Return an object as JSON."""
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        """Parse JSON."""
+        return json.loads(bytes(data).decode('utf-8'))
+
+
+class _PickleSerializer(Serializer):
+
+    """Serializes using pickle. Never decode untrusted events."""
+
+    id = 2
+    name = 'pickle'
+
+    def dumps(self, obj):
+        """Return an object pickled."""
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        """Unpickle an object."""
+        return pickle.loads(bytes(data))
+
+
+class _MsgpackSerializer(Serializer):
+
+    """Serializes using MessagePack. Requires the `msgpack` package."""
+
+    id = 3
+    name = 'msgpack'
+
+    def dumps(self, obj):
+        """Return an object packed."""
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        """Unpack an object."""
+        return msgpack.unpackb(data, raw=False)
+
+
+class _ZlibCompression(Compression):
+
+    """Compresses using zlib from the standard library."""
+
+    id = 1
+    name = 'zlib'
+
+    def compress(self, data):
+        """Compress data."""
+        return zlib.compress(data, 6)
+
+    def decompress(self, data):
+        """Decompress data."""
+        return zlib.decompress(data)
+
+
+class _ZstdCompression(Compression):
+
+    """Compresses using Zstandard. Requires the `zstandard` package."""
+
+    id = 2
+    name = 'zstd'
+
+    def compress(self, data):
+        """Compress data."""
+        return zstandard.ZstdCompressor().compress(data)
+
+    def decompress(self, data):
+        """Decompress data."""
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+class _LZ4Compression(Compression):
+
+    """Compresses using LZ4 frames. Requires the `lz4` package."""
+
+    id = 3
+    name = 'lz4'
+
+    def compress(self, data):
+        """Compress data."""
+        return lz4frame.compress(data)
+
+    def decompress(self, data):
+        """Decompress data."""
+        return lz4frame.decompress(data)
+
+
+_serializers = {}
+_compressions = {}
+
+
+def register_serializer(serializer):
+    """Make a serializer available to codecs and decoding.
+
+    Parameters:
+    serializer -- a `Serializer` instance.
+
+    """
+    assert isinstance(serializer, Serializer)
+    assert 0 <= serializer.id <= 255, serializer.id
+    _serializers[serializer.id] = serializer
+    _serializers[serializer.name] = serializer
+
+
+def register_compression(compression):
+    """Make a compression available to codecs and decoding.
+
+    Parameters:
+    compression -- a `Compression` instance.
+
+    """
+    assert isinstance(compression, Compression)
+    assert 0 < compression.id <= 255, compression.id
+    _compressions[compression.id] = compression
+    _compressions[compression.name] = compression
+
+
+register_serializer(_RawSerializer())
+register_serializer(_JSONSerializer())
+register_serializer(_PickleSerializer())
+if msgpack is not None:
+    register_serializer(_MsgpackSerializer())
+register_compression(_ZlibCompression())
+if zstandard is not None:
+    register_compression(_ZstdCompression())
+if lz4frame is not None:
+    register_compression(_LZ4Compression())
+
+
+class EventCodec(object):
+
+    """Encodes objects into events using a serializer and a compression."""
+
+    def __init__(self, serializer='json', compression=None,
+                 min_compress_size=256, allowed=None):
+        """Constructor.
+
+        Parameters:
+        serializer        -- the name of a registered serializer.
+        compression       -- the (optional) name of a registered
+                             compression.
+        min_compress_size -- the size, in bytes, below which serialized
+                             events are not compressed since it rarely pays
+                             off.
+        allowed           -- the (optional) names of the serializers `decode`
+                             accepts. See `decode`.
+
+        Raises `CodecException` if a serializer or compression is unknown,
+        for example because the package it needs is not installed.
+
+        """
+        if serializer not in _serializers:
+            raise CodecException("Unknown or unavailable serializer:"
+                                 " {0}".format(serializer))
+        if compression is not None and compression not in _compressions:
+            raise CodecException("Unknown or unavailable compression:"
+                                 " {0}".format(compression))
+        self._serializer = _serializers[serializer]
+        self._compression = (_compressions[compression] if compression
+                             else None)
+        self._min_compress_size = min_compress_size
+        self._allowed = allowed
+
+    def encode(self, obj):
+        """Return an object encoded into event data, including header."""
+        data = self._serializer.dumps(obj)
+        compressionid = 0
+        if (self._compression is not None and
+                len(data) >= self._min_compress_size):
+            compressed = self._compression.compress(data)
+            if len(compressed) < len(data):
+                data = compressed
+                compressionid = self._compression.id
+        header = _MAGIC + bytes(bytearray([_VERSION, self._serializer.id,
+                                           compressionid]))
+        return header + data
+
+    def decode(self, data):
+        """Decode event data. See `decode`."""
+        return decode(data, self._allowed)
+
+
+def _split_header(data):
+    """Return the tuple `(serializer, compression, payload)` of event data.
+
+    `compression` is None for uncompressed events. Data lacking a header is
+    returned as is with the 'raw' serializer.
+
+    """
+    header = bytes(data[:_HEADER_LENGTH])
+    if len(header) < _HEADER_LENGTH or not header.startswith(_MAGIC):
+        return _serializers['raw'], None, data
+    version, serializerid, compressionid = bytearray(header[len(_MAGIC):])
+    if version != _VERSION:
+        raise CodecException("Event encoded using unknown header version"
+                             " {0}.".format(version))
+    try:
+        serializer = _serializers[serializerid]
+        compression = (_compressions[compressionid] if compressionid
+                       else None)
+    except KeyError:
+        raise CodecException("Event encoded using unknown or unavailable"
+                             " serializer {0} or compression"
+                             " {1}.".format(serializerid, compressionid))
+    return serializer, compression, data[_HEADER_LENGTH:]
+
+
+def decode(data, allowed=None):
+    """Decode event data encoded by any `EventCodec`.
+
+    Parameters:
+    data    -- the bytes-like event data.
+    allowed -- the (optional) names of the serializers to accept. Defaults
+               to every registered serializer but 'pickle', which must be
+               explicitly allowed since unpickling untrusted data runs
+               arbitrary code.
+
+    Returns the decoded object. Data published without a codec is returned as
+    a byte string. Raises `CodecException` if the serializer or compression
+    used is not available, or the serializer is not allowed.
+
+    """
+    serializer, compression, payload = _split_header(data)
+    if allowed is None:
+        refused = serializer.name in _UNSAFE
+    else:
+        refused = serializer.name not in allowed
+    if refused:
+        raise CodecException("Event encoded using serializer {0}, which is"
+                             " not allowed.".format(serializer.name))
+    if compression is not None:
+        payload = compression.decompress(payload)
+    return serializer.loads(payload)
+
+
+class LazyEvent(object):
+
+    """Received event data that is decoded on first access.
+
+    Attributes:
+    raw -- the received event data, including header.
+
+    """
+
+    __slots__ = ('raw', '_allowed', '_value')
+
+    _UNDECODED = object()
+
+    def __init__(self, raw, allowed=None):
+        """Constructor.
+
+        Parameters:
+        raw     -- the received bytes-like event data.
+        allowed -- the (optional) names of the serializers to accept. See
+                   `decode`.
+
+        """
+        self.raw = raw
+        self._allowed = allowed
+        self._value = self._UNDECODED
+
+    @property
+    def codec(self):
+        """The name of the serializer the event was encoded with.
+
+        Available without decoding the event.
+
+        """
+        return _split_header(self.raw)[0].name
+
+    @property
+    def value(self):
+        """The decoded event. Decoded once, on first access."""
+        if self._value is self._UNDECODED:
+            self._value = decode(self.raw, self._allowed)
+        return self._value
+
+    def __repr__(self):
+        """Return a representation not decoding the event."""
+        return '<LazyEvent of {0} bytes>'.format(len(self.raw))
+
+
+def publish_event(socket, codec, obj, timeout=None):
+    """Encode and publish an object as a new event.
+
+    Parameters:
+    socket  -- a ZeroMQ REQ socket connected to a Rewind instance.
+    codec   -- the `EventCodec` to encode the object with.
+    obj     -- the object to publish.
+    timeout -- see `rewind.client.publish_event`.
+
+    """
+    clients.publish_event(socket, codec.encode(obj), timeout)
+
+
+def query_events(socket, from_=None, to=None, copy=True, timeout=None,
+                 allowed=None):
+    """Yield a queried range of events as `LazyEvent`s.
+
+    See `rewind.client.query_events` for parameters, and `decode` for
+    `allowed`.
+
+    This function returns nothing, but yields `(eventid, LazyEvent)` tuples.
+
+    """
+    for eventid, eventdata in clients.query_events(socket, from_, to, copy,
+                                                   timeout):
+        yield eventid, LazyEvent(eventdata, allowed)
+
+
+def yield_events_after(streamsock, reqsock, lasteventid=None, copy=True,
+                       allowed=None):
+    """Yield missed out events, and a streamed one, as `LazyEvent`s.
+
+    See `rewind.client.yield_events_after` for parameters, and `decode` for
+    `allowed`.
+
+    """
+    for eventid, eventdata in clients.yield_events_after(streamsock, reqsock,
+                                                         lasteventid, copy):
+        yield eventid, LazyEvent(eventdata, allowed)
@@ -0,0 +1,133 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Creation of sockets tuned for talking to Rewind.
+
+The functions in this module create and connect sockets with a named profile
+of socket options applied. The stream socket's receive high watermark is
+the most important one: when it is reached, streamed events are dropped and
+`rewind.client.yield_events_after` has to fall back to querying. How often
+that happens is counted in `rewind.client.statistics.hwm_fallbacks`.
+
+Available profiles:
+
+    default            -- the pyzmq defaults, except for TCP keepalive.
+    low-latency        -- small queues and no lingering on close, so
+                          that stalls surface quickly.
+    high-throughput    -- deep queues and large kernel buffers that absorb
+                          bursts without dropping streamed events.
+    memory-constrained -- shallow queues and small kernel buffers.
+
+"""
+import logging
+
+import zmq
+
+
+logger = logging.getLogger(__name__)
+
+
+_KEEPALIVE = {
+    'TCP_KEEPALIVE': 1,
+    'TCP_KEEPALIVE_IDLE': 60,
+    'TCP_KEEPALIVE_INTVL': 10,
+}
+
+# Socket options for stream and query sockets, by profile name. Options are
+# given by their name in the `zmq` module so that options unknown to the
+# installed pyzmq/libzmq version can be skipped.
+PROFILES = {
+    'default': {
+        'stream': dict(_KEEPALIVE),
+        'query': dict(_KEEPALIVE),
+    },
+    'low-latency': {
+        'stream': dict(_KEEPALIVE, RCVHWM=1000, LINGER=0,
+                       TCP_KEEPALIVE_IDLE=10, TCP_KEEPALIVE_INTVL=2),
+        'query': dict(_KEEPALIVE, SNDHWM=100, LINGER=0, IMMEDIATE=1,
+                      TCP_KEEPALIVE_IDLE=10, TCP_KEEPALIVE_INTVL=2),
+    },
+    'high-throughput': {
+        'stream': dict(_KEEPALIVE, RCVHWM=1000000, RCVBUF=8 * 1024 * 1024),
+        'query': dict(_KEEPALIVE, RCVBUF=8 * 1024 * 1024,
+                      SNDBUF=1024 * 1024),
+    },
+    'memory-constrained': {
+        'stream': dict(_KEEPALIVE, RCVHWM=100, RCVBUF=64 * 1024),
+        'query': dict(_KEEPALIVE, RCVBUF=64 * 1024, SNDBUF=64 * 1024,
+                      LINGER=0),
+    },
+}
+
+
+def _apply_options(socket, kind, profile, overrides):
+    """Set the socket options of a profile, and any overrides, on a socket.
+
+    Parameters:
+    socket    -- the socket to configure.
+    kind      -- either 'stream' or 'query'.
+    profile   -- the name of a profile in `PROFILES`.
+    overrides -- a dictionary of option names and values taking precedence
+                 over the profile.
+
+    """
+    if profile not in PROFILES:
+        raise ValueError("Unknown socket profile: {0}".format(profile))
+    options = dict(PROFILES[profile][kind])
+    options.update(overrides)
+
+    for name, value in sorted(options.items()):
+        option = getattr(zmq, name, None)
+        if option is None:
+            logger.debug("Skipping socket option %s not supported by this"
+                         " ZeroMQ version.", name)
+            continue
+        socket.setsockopt(option, value)
+
+
+def connect_stream(context, endpoint, profile='default', subscribe=b'',
+                   **overrides):
+    """Create a SUB socket connected to the streaming endpoint of Rewind.
+
+    Parameters:
+    context   -- the ZeroMQ context to create the socket from.
+    endpoint  -- the streaming endpoint of a Rewind instance.
+    profile   -- the name of the socket option profile to apply.
+    subscribe -- the subscription prefix. Defaults to all events.
+    overrides -- socket options, by `zmq` name, overriding the profile. For
+                 example `RCVHWM=5000`.
+
+    Returns the connected socket. Options are set before connecting since
+    some of them only take effect for new connections.
+
+    """
+    socket = context.socket(zmq.SUB)
+    _apply_options(socket, 'stream', profile, overrides)
+    socket.setsockopt(zmq.SUBSCRIBE, subscribe)
+    socket.connect(endpoint)
+    return socket
+
+
+def connect_query(context, endpoint, profile='default', socket_type=zmq.REQ,
+                  **overrides):
+    """Create a socket connected to the query endpoint of Rewind.
+
+    Parameters:
+    context     -- the ZeroMQ context to create the socket from.
+    endpoint    -- the query endpoint of a Rewind instance.
+    profile     -- the name of the socket option profile to apply.
+    socket_type -- the ZeroMQ socket type. REQ for ordinary queries and
+                   publishing, DEALER for `rewind.client.batch`.
+    overrides   -- socket options, by `zmq` name, overriding the profile.
+
+    Returns the connected socket.
+
+    """
+    socket = context.socket(socket_type)
+    _apply_options(socket, 'query', profile, overrides)
+    socket.connect(endpoint)
+    return socket
@@ -0,0 +1,276 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Long-lived, gap-free subscription to the Rewind event stream.
+
+`rewind.client.yield_events_after` handles a single streamed event per call,
+leaving it to the caller to keep track of the last seen event id. The
+`Subscriber` in this module owns its sockets and yields an endless stream of
+events, back-filling through queries whenever a streamed event's previous
+event id reveals that messages were dropped.
+
+`replay_and_follow` yields all of history followed by live events, reading
+the stream while history is being queried so that the two are joined without
+gaps or duplicates.
+
+"""
+import collections
+import itertools
+import logging
+import time
+
+from rewind.client import instrumentation
+from rewind.client import _get_single_streamed_event
+from rewind.client import query_events
+from rewind.client import statistics
+from rewind.client.sockets import connect_query
+from rewind.client.sockets import connect_stream
+
+
+logger = logging.getLogger(__name__)
+
+# How many queried events to yield between reading the stream.
+_DRAIN_INTERVAL = 100
+
+
+def follow_stream(streamsock, reqsock, lasteventid=None, copy=True):
+    """Endlessly yield streamed events, back-filling any gaps.
+
+    Every streamed event carries the id of the event preceding it. Whenever
+    that id differs from the last event yielded, the missing events are
+    queried for before the streamed event is yielded. Live events arriving
+    in the meantime are buffered by the stream socket, up to its high
+    watermark. Any events dropped beyond that are detected, and back-filled,
+    once the stream is read again.
+
+    Parameters:
+    streamsock  -- ZeroMQ SUB socket subscribed to the streaming endpoint of a
+                   Rewind instance.
+    reqsock     -- ZeroMQ REQ socket connected to the query endpoint of the
+                   same Rewind instance.
+    lasteventid -- the event id of the last seen event. If None, all of
+                   history preceding the first streamed event is yielded
+                   first.
+    copy        -- whether event data should be copied into byte strings. See
+                   `rewind.client.query_events`.
+
+    This function returns nothing, but yields `(eventid, eventdata)` tuples
+    forever. Only the last event id is kept in memory.
+
+    """
+    assert lasteventid is None or isinstance(lasteventid, bytes)
+    return _follow(_streamed_events(streamsock, copy), reqsock, lasteventid,
+                   copy)
+
+
+def _streamed_events(streamsock, copy, buffered=()):
+    """Endlessly yield `(eventid, preveventid, eventdata)` stream tuples.
+
+    Parameters:
+    streamsock -- the stream socket to be reading from.
+    copy       -- see `rewind.client._get_single_streamed_event`.
+    buffered   -- a deque of already received stream tuples to yield, and
+                  remove, before reading from the socket.
+
+    """
+    while buffered:
+        yield buffered.popleft()
+    while True:
+        yield _get_single_streamed_event(streamsock, copy)
+
+
+def _follow(streamed, reqsock, lasteventid, copy):
+    """Yield streamed events, back-filling any gaps. See `follow_stream`.
+
+    Parameters:
+    streamed    -- an iterator of `(eventid, preveventid, eventdata)` tuples
+                   as received from the stream.
+    reqsock     -- see `follow_stream`.
+    lasteventid -- see `follow_stream`.
+    copy        -- see `follow_stream`.
+
+    """
+    funclogger = logger.getChild('follow_stream')
+
+    for eventid, preveventid, eventdata in streamed:
+        if eventid == lasteventid:
+            # Already yielded as part of a back-fill.
+            continue
+
+        if preveventid == b'' and lasteventid is not None:
+            # Rewind was restarted and lost track of its previous event. The
+            # query below includes the streamed event itself.
+            funclogger.info('Stream restarted. Querying to catch up.')
+            for qeventid, qeventdata in query_events(reqsock, lasteventid,
+                                                     eventid, copy):
+                lasteventid = qeventid
+                yield qeventid, qeventdata
+            continue
+
+        if preveventid != lasteventid and preveventid != b'':
+            funclogger.info('Seem to have reached high watermark. Doing'
+                            ' manually querying to catch up.')
+            statistics.count_hwm_fallback()
+            catchupstart = time.time()
+            nevents = 0
+            for qeventid, qeventdata in query_events(reqsock, lasteventid,
+                                                     preveventid, copy):
+                nevents += 1
+                yield qeventid, qeventdata
+            instrumentation.current.catchup(catchupstart, time.time(),
+                                            nevents)
+
+        lasteventid = eventid
+        yield eventid, eventdata
+
+
+def replay_and_follow(streamsock, reqsock, from_=None, copy=True,
+                      maxbuffer=10000):
+    """Yield all events after `from_`, first historical and then live ones.
+
+    The stream is read while history is being queried, so that events
+    published in the meantime are neither missed nor yielded twice. At most
+    `maxbuffer` streamed events are kept in memory while querying. Events
+    beyond that are left to the stream socket's queue and, if they are
+    dropped there, back-filled once the stream is followed.
+
+    Parameters:
+    streamsock -- ZeroMQ SUB socket subscribed to the streaming endpoint of a
+                  Rewind instance. It should be connected before calling this
+                  function, so that live events are received while querying.
+    reqsock    -- ZeroMQ REQ socket connected to the query endpoint of the
+                  same Rewind instance.
+    from_      -- the (optional) event id of the last seen event. If None,
+                  all of history is yielded.
+    copy       -- whether event data should be copied into byte strings. See
+                  `rewind.client.query_events`.
+    maxbuffer  -- the maximum number of streamed events buffered while
+                  querying. The ids of as many recently queried events are
+                  kept to recognize streamed duplicates, so the stream is
+                  read at least every `maxbuffer` queried events.
+
+    This function returns nothing, but yields `(eventid, eventdata)` tuples
+    forever.
+
+    """
+    assert from_ is None or isinstance(from_, bytes)
+    assert maxbuffer > 0
+    buffered = collections.deque()
+    recentids = collections.deque()
+    recent = set()
+
+    def drain():
+        while len(buffered) < maxbuffer and streamsock.poll(0):
+            event = _get_single_streamed_event(streamsock, copy)
+            if event[0] not in recent:
+                buffered.append(event)
+
+    # Streamed events must be read while the ids they are checked against
+    # are still kept.
+    interval = min(maxbuffer, _DRAIN_INTERVAL)
+    lasteventid = from_
+    queried = 0
+    for eventid, eventdata in query_events(reqsock, from_, None, copy):
+        lasteventid = eventid
+        recent.add(eventid)
+        recentids.append(eventid)
+        if len(recentids) > maxbuffer:
+            recent.discard(recentids.popleft())
+        # Buffered events are forgotten as soon as they have been queried
+        # for, leaving room for newer ones.
+        while buffered and buffered[0][0] in recent:
+            buffered.popleft()
+        yield eventid, eventdata
+
+        queried += 1
+        if queried % interval == 0:
+            drain()
+
+    # Skip streamed events that were queried for. An event whose predecessor
+    # was queried for, but was not the last queried event, has been queried
+    # for too.
+    streamed = _streamed_events(streamsock, copy, buffered)
+    for event in streamed:
+        eventid, preveventid, _ = event
+        if eventid in recent:
+            continue
+        if preveventid in recent and preveventid != lasteventid:
+            continue
+        break
+    # Free the ids while following. `drain` refers to them, so the names
+    # can not be deleted on Python 2.
+    recentids.clear()
+    recent.clear()
+
+    for event in _follow(itertools.chain([event], streamed), reqsock,
+                         lasteventid, copy):
+        yield event
+
+
+class Subscriber(object):
+
+    """Owns a stream and a query socket and yields every event exactly once.
+
+    Iterating over a subscriber yields `(eventid, eventdata)` tuples forever.
+    The id of the last yielded event is available as `lasteventid`, which can
+    be persisted and handed to a new subscriber to resume later on.
+
+    """
+
+    def __init__(self, context, stream_endpoint, query_endpoint,
+                 lasteventid=None, copy=True, profile='default',
+                 replay=False):
+        """Constructor.
+
+        Parameters:
+        context         -- the ZeroMQ context to create sockets from.
+        stream_endpoint -- the streaming endpoint of a Rewind instance.
+        query_endpoint  -- the query endpoint of the same Rewind instance.
+        lasteventid     -- the event id of the last seen event. If None, all
+                           of history is yielded before live events.
+        copy            -- whether event data should be copied into byte
+                           strings. See `rewind.client.query_events`.
+        profile         -- the name of the socket option profile to use. See
+                           `rewind.client.sockets`.
+        replay          -- whether to query for events after `lasteventid`
+                           right away using `replay_and_follow`, rather than
+                           once the first live event reveals them missing.
+
+        """
+        assert lasteventid is None or isinstance(lasteventid, bytes)
+        self.lasteventid = lasteventid
+        self._copy = copy
+        self._replay = replay
+
+        self._streamsock = connect_stream(context, stream_endpoint, profile)
+        self._reqsock = connect_query(context, query_endpoint, profile)
+
+    def __iter__(self):
+        """Yield events forever."""
+        follow = replay_and_follow if self._replay else follow_stream
+        for eventid, eventdata in follow(self._streamsock, self._reqsock,
+                                         self.lasteventid, self._copy):
+            self.lasteventid = eventid
+            yield eventid, eventdata
+
+    def close(self, linger=None):
+        """Close the sockets of the subscriber.
+
+        Parameters:
+        linger -- see `zmq.Socket.close`.
+
+        """
+        self._streamsock.close(linger)
+        self._reqsock.close(linger)
+
+    def __enter__(self):
+        """Enter the runtime context of the subscriber."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the subscriber."""
+        self.close()
@@ -0,0 +1,146 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test adaptive batch sizing using `rewind.client.adaptive`."""
+import unittest
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.adaptive as adaptive
+import rewind.client.testing as testing
+
+
+class TestBatchSizeController(unittest.TestCase):
+
+    """Test `BatchSizeController`."""
+
+    def setUp(self):
+        """Set up a controller."""
+        self.controller = adaptive.BatchSizeController(initial=100,
+                                                       maximum=1000,
+                                                       max_bytes=100000,
+                                                       hints=True)
+
+    def _observe(self, rate, eventsize=10):
+        """Observe a full batch received at a rate of events per second."""
+        hint = self.controller.hint
+        self.controller.observe(hint, hint * eventsize, float(hint) / rate,
+                                False)
+
+    def testAdditiveIncrease(self):
+        """Test that the hint grows while throughput holds."""
+        self._observe(1000)
+        self.assertEqual(self.controller.hint, 200)
+        self._observe(1000)
+        self._observe(950)
+        self.assertEqual(self.controller.hint, 400)
+        for _ in range(10):
+            self._observe(1000)
+        self.assertEqual(self.controller.hint, 1000)
+
+    def testMultiplicativeDecrease(self):
+        """Test that the hint halves when throughput drops."""
+        self._observe(1000)
+        self._observe(1000)
+        self.assertEqual(self.controller.hint, 300)
+        self._observe(500)
+        self.assertEqual(self.controller.hint, 150)
+
+    def testMemoryCap(self):
+        """Test that the hint keeps batches within the memory cap."""
+        self._observe(1000, eventsize=2000)
+        self.assertEqual(self.controller.hint, 50)
+        self._observe(1000, eventsize=100000)
+        self.assertEqual(self.controller.hint, 10)
+
+    def testServerCap(self):
+        """Test that the hint follows a server sending smaller batches."""
+        self.controller.observe(30, 300, 0.01, False)
+        self.assertEqual(self.controller.hint, 30)
+
+    def testLastBatchIgnored(self):
+        """Test that the batch ending a query does not change the hint."""
+        self.controller.observe(5, 50, 0.01, True)
+        self.assertEqual(self.controller.hint, 100)
+
+
+class TestQueryEvents(unittest.TestCase):
+
+    """Test `query_events` against a fake Rewind."""
+
+    def setUp(self):
+        """Set up a context."""
+        self.context = zmq.Context(1)
+        self.rewind = None
+        self.socket = None
+
+    def tearDown(self):
+        """Stop the fake Rewind and close the socket."""
+        self.rewind.stop()
+        self.socket.close(0)
+        self.context.term()
+
+    def _start(self, nevents, **kwargs):
+        """Start a fake Rewind holding `nevents` events."""
+        self.rewind = testing.FakeRewind(self.context, 'inproc://adaptive',
+                                         batch_size=10, **kwargs)
+        self.rewind.load(str(i).encode() for i in range(nevents))
+        self.rewind.start()
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.connect('inproc://adaptive')
+
+    def testHintHonoured(self):
+        """Test querying a server honouring the hint."""
+        self._start(1000, max_hint=500)
+        controller = adaptive.BatchSizeController(initial=20, minimum=10,
+                                                  hints=True)
+        events = list(adaptive.query_events(self.socket,
+                                            controller=controller))
+        self.assertEqual(events, self.rewind.events)
+        self.assertTrue(controller.supported)
+        self.assertTrue(controller.hint > 20, controller.hint)
+
+    def testNoHintsByDefault(self):
+        """Test that no hints are sent unless enabled."""
+        # Without `max_hint`, the fake fails on hints just like Rewind does.
+        self._start(25)
+        controller = adaptive.BatchSizeController()
+        events = list(adaptive.query_events(self.socket, copy=False,
+                                            controller=controller,
+                                            timeout=5))
+        self.assertEqual([(eventid, bytes(eventdata))
+                          for eventid, eventdata in events],
+                         self.rewind.events)
+        self.assertFalse(controller.supported)
+        self.assertEqual(controller.hint, 100)
+
+    def testInvalidHint(self):
+        """Test that the fake replies with an error to an invalid hint."""
+        self._start(10, max_hint=30)
+        for hint in (b'many', b'0'):
+            self.socket.send_multipart([b'QUERY', b'', b'', hint])
+            self.assertEqual(self.socket.recv_multipart(),
+                             [b'ERROR Invalid batch size hint'])
+
+    def testRange(self):
+        """Test querying a range."""
+        self._start(100, max_hint=30)
+        expected = self.rewind.events
+        controller = adaptive.BatchSizeController(initial=20, hints=True)
+        events = list(adaptive.query_events(self.socket, expected[9][0],
+                                            expected[79][0],
+                                            controller=controller))
+        self.assertEqual(events, expected[10:80])
+
+    def testUnknownKey(self):
+        """Test that query errors are raised."""
+        self._start(10, max_hint=30)
+        controller = adaptive.BatchSizeController(hints=True)
+        self.assertRaises(clients.QueryException, list,
+                          adaptive.query_events(self.socket, b'unknown',
+                                                controller=controller))
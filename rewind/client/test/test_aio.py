@@ -0,0 +1,105 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test the asyncio client in `rewind.client.aio`."""
+import asyncio
+import unittest
+
+import rewind.client as clients
+import rewind.client.aio as aio
+
+
+class _FakeAsyncSocket(object):
+
+    """An asyncio ZeroMQ socket stand-in replying with canned messages."""
+
+    def __init__(self, replies):
+        """Constructor.
+
+        Parameters:
+        replies -- a list of multipart messages to be received, in order.
+
+        """
+        self.replies = list(replies)
+        self.sent = []
+
+    async def send_multipart(self, frames):
+        """Record a sent multipart message."""
+        self.sent.append(frames)
+
+    async def recv_multipart(self):
+        """Return the next canned multipart message."""
+        return self.replies.pop(0)
+
+
+def _collect(agen):
+    """Run an asynchronous generator to completion and return its items."""
+    async def collector():
+        return [item async for item in agen]
+    return asyncio.run(collector())
+
+
+class TestAsyncQuerying(unittest.TestCase):
+
+    """Test `query_events` and `publish_event`."""
+
+    def testQueryInBatches(self):
+        """Test that batches are queried until Rewind says END."""
+        socket = _FakeAsyncSocket([
+            [b'a', b'event1', b'b', b'event2'],
+            [b'c', b'event3', b'END'],
+        ])
+
+        results = _collect(aio.query_events(socket))
+
+        self.assertEqual(results, [(b'a', b'event1'), (b'b', b'event2'),
+                                   (b'c', b'event3')])
+        self.assertEqual(socket.sent, [[b'QUERY', b'', b''],
+                                       [b'QUERY', b'b', b'']])
+
+    def testEventDataLookingLikeEnd(self):
+        """Test that event data equal to END is not mistaken for the end."""
+        socket = _FakeAsyncSocket([[b'a', b'END'], [b'END']])
+        results = _collect(aio.query_events(socket))
+        self.assertEqual(results, [(b'a', b'END')])
+
+    def testQueryError(self):
+        """Test that an error response raises `QueryException`."""
+        socket = _FakeAsyncSocket([[b'ERROR Key did not exist']])
+        self.assertRaises(clients.QueryException, _collect,
+                          aio.query_events(socket, b'non-exist'))
+
+    def testPublish(self):
+        """Test publishing an event."""
+        socket = _FakeAsyncSocket([[b'PUBLISHED']])
+        asyncio.run(aio.publish_event(socket, b'event'))
+        self.assertEqual(socket.sent, [[b'PUBLISH', b'event']])
+
+
+class TestAsyncEventReception(unittest.TestCase):
+
+    """Test event reception using `yield_events_after`."""
+
+    def testRecvNonFloodedNextEvent(self):
+        """Test receiving the next event through streaming socket only."""
+        streamsock = _FakeAsyncSocket([[b'c', b'b', b'event3']])
+        reqsock = _FakeAsyncSocket([])
+
+        results = _collect(aio.yield_events_after(streamsock, reqsock, b'b'))
+
+        self.assertEqual(results, [(b'c', b'event3')])
+        self.assertEqual(reqsock.sent, [])
+
+    def testRecvFloodedSocket(self):
+        """Test receiving an event when watermark was passed."""
+        streamsock = _FakeAsyncSocket([[b'c', b'b', b'event3']])
+        reqsock = _FakeAsyncSocket([[b'b', b'event2', b'END']])
+
+        results = _collect(aio.yield_events_after(streamsock, reqsock, b'a'))
+
+        self.assertEqual(results, [(b'b', b'event2'), (b'c', b'event3')])
+        self.assertEqual(reqsock.sent, [[b'QUERY', b'a', b'b']])
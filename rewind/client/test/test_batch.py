@@ -0,0 +1,76 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test pipelined publishing using `rewind.client.batch`."""
+import unittest
+
+import mock
+import zmq
+
+import rewind.client as clients
+import rewind.client.batch as batch
+
+
+class TestBatchPublisher(unittest.TestCase):
+
+    """Test `BatchPublisher` and `publish_events`."""
+
+    def setUp(self):
+        """Set up a mocked DEALER socket."""
+        self.socket = mock.NonCallableMock()
+        self.events = [b'event1', b'event2', b'event3']
+
+    def testPublishingRespectsWindow(self):
+        """Test that no more than `window` events are left in flight."""
+        self.socket.recv_multipart.side_effect = [[b'', b'PUBLISHED']] * 3
+
+        publisher = batch.BatchPublisher(self.socket, window=2)
+        publisher.publish(self.events[0])
+        publisher.publish(self.events[1])
+        self.assertEqual(publisher.inflight, 2)
+        assert not self.socket.recv_multipart.called
+
+        publisher.publish(self.events[2])
+        self.assertEqual(publisher.inflight, 2)
+        self.assertEqual(self.socket.recv_multipart.call_count, 1)
+
+        self.assertEqual(publisher.flush(), [])
+        self.assertEqual(publisher.inflight, 0)
+        self.socket.send.assert_has_calls([mock.call(b'', zmq.SNDMORE),
+                                           mock.call(b'PUBLISH', zmq.SNDMORE),
+                                           mock.call(self.events[2])])
+
+    def testFailuresAreReported(self):
+        """Test that events not acknowledged are reported back."""
+        self.socket.recv_multipart.side_effect = [
+            [b'', b'PUBLISHED'],
+            [b'', b'ERROR Something'],
+            [b'', b'PUBLISHED'],
+        ]
+
+        with self.assertRaises(batch.PublishException) as cm:
+            batch.publish_events(self.socket, self.events)
+        self.assertEqual(cm.exception.failures,
+                         [(1, self.events[1], b'ERROR Something')])
+
+    def testPublishEvents(self):
+        """Test publishing a bunch of events successfully."""
+        self.socket.recv_multipart.side_effect = [[b'', b'PUBLISHED']] * 3
+
+        npublished = batch.publish_events(self.socket, self.events)
+
+        self.assertEqual(npublished, 3)
+        self.assertEqual(self.socket.send.call_count, 9)
+
+    def testTimeout(self):
+        """Test that waiting too long for an acknowledgement raises."""
+        self.socket.poll.return_value = 0
+        publisher = batch.BatchPublisher(self.socket, timeout=0.5)
+        publisher.publish(self.events[0])
+        self.assertRaises(clients.TimeoutException, publisher.flush)
+        self.socket.poll.assert_called_once_with(500, zmq.POLLIN)
+        assert not self.socket.recv_multipart.called
@@ -0,0 +1,159 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test the on-disk event cache in `rewind.client.cache`."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import rewind.client.cache as cache
+
+
+def _events(first, last):
+    """Return a list of made up events with sequential ids."""
+    return [('{0:04d}'.format(i).encode(), 'event{0}'.format(i).encode())
+            for i in range(first, last)]
+
+
+class TestSegmentCache(unittest.TestCase):
+
+    """Test `SegmentCache`."""
+
+    def setUp(self):
+        """Create a temporary cache directory."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary cache directory."""
+        shutil.rmtree(self.directory)
+
+    def _fill(self, segcache, events, previd=None):
+        """Append `events` to `segcache`."""
+        for eventid, eventdata in events:
+            segcache.append(eventid, eventdata, previd)
+            previd = eventid
+
+    def testIterAfter(self):
+        """Test reading back ranges of cached events."""
+        segcache = cache.SegmentCache(self.directory, segment_bytes=100)
+        events = _events(0, 20)
+        self._fill(segcache, events)
+
+        self.assertEqual(list(segcache.iter_after(None)), events)
+        self.assertEqual(list(segcache.iter_after(b'0004', b'0011')),
+                         events[5:12])
+        self.assertEqual(list(segcache.iter_after(b'0019')), [])
+        self.assertTrue(segcache.covers(b'0007'))
+        self.assertFalse(segcache.covers(b'9999'))
+
+    def testReopen(self):
+        """Test that cached events survive reopening the cache."""
+        segcache = cache.SegmentCache(self.directory, segment_bytes=100)
+        events = _events(0, 20)
+        self._fill(segcache, events)
+        segcache.close()
+
+        segcache = cache.SegmentCache(self.directory, segment_bytes=100)
+        self.assertEqual(len(segcache), 20)
+        self.assertEqual(segcache.last, b'0019')
+        self._fill(segcache, _events(20, 22), b'0019')
+        self.assertEqual(list(segcache.iter_after(None)), _events(0, 22))
+
+    def testInvalidSegmentIsSkipped(self):
+        """Test lookups after an invalid segment between valid ones."""
+        segcache = cache.SegmentCache(self.directory, segment_bytes=100)
+        events = _events(0, 20)
+        self._fill(segcache, events)
+        segcache.close()
+        # Make room for an invalid segment after the first one.
+        paths = sorted(os.listdir(self.directory))
+        for seqno, filename in reversed(list(enumerate(paths))):
+            if seqno > 0:
+                os.rename(os.path.join(self.directory, filename),
+                          segcache._segment_path(seqno + 1))
+        with open(segcache._segment_path(1), 'wb') as f:
+            f.write(b'garbage')
+
+        segcache = cache.SegmentCache(self.directory, segment_bytes=100)
+        self.assertEqual(list(segcache.iter_after(None)), events)
+        for i in range(19):
+            self.assertEqual(list(segcache.iter_after(events[i][0])),
+                             events[i + 1:])
+
+    def testTruncatedRecordIsDropped(self):
+        """Test that a partially written record is dropped when reopening."""
+        segcache = cache.SegmentCache(self.directory)
+        self._fill(segcache, _events(0, 3))
+        segcache.close()
+
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 2)
+
+        segcache = cache.SegmentCache(self.directory)
+        self.assertEqual(list(segcache.iter_after(None)), _events(0, 2))
+
+    def testEviction(self):
+        """Test that the oldest segments are evicted beyond the size cap."""
+        segcache = cache.SegmentCache(self.directory, max_bytes=200,
+                                      segment_bytes=100)
+        self._fill(segcache, _events(0, 40))
+
+        self.assertLessEqual(segcache.size, 200 + 100)
+        self.assertIsNotNone(segcache.base)
+        self.assertNotIn(b'0000', segcache)
+        cached = list(segcache.iter_after(segcache.base))
+        self.assertEqual(cached[-1], _events(39, 40)[0])
+        self.assertEqual(len(cached), len(segcache))
+
+
+class TestCachingQuerier(unittest.TestCase):
+
+    """Test `CachingQuerier`."""
+
+    def setUp(self):
+        """Create a temporary cache."""
+        self.directory = tempfile.mkdtemp()
+        self.segcache = cache.SegmentCache(self.directory)
+        self.socket = mock.NonCallableMock()
+
+    def tearDown(self):
+        """Remove the temporary cache."""
+        self.segcache.close()
+        shutil.rmtree(self.directory)
+
+    @mock.patch('rewind.client.cache.query_events')
+    def testOnlyTailIsQueried(self, query_events):
+        """Test that only events newer than the cache are queried."""
+        querier = cache.CachingQuerier(self.segcache, self.socket)
+
+        query_events.return_value = iter(_events(0, 10))
+        self.assertEqual(list(querier.query_events()), _events(0, 10))
+        query_events.assert_called_with(self.socket, None, None)
+
+        query_events.return_value = iter(_events(10, 12))
+        self.assertEqual(list(querier.query_events()), _events(0, 12))
+        query_events.assert_called_with(self.socket, b'0009', None)
+
+        query_events.return_value = iter([])
+        self.assertEqual(list(querier.query_events(b'0003', b'0005')),
+                         _events(4, 6))
+        self.assertEqual(query_events.call_count, 2)
+
+    @mock.patch('rewind.client.cache.query_events')
+    def testUncachedRangeIsPassedThrough(self, query_events):
+        """Test that queries starting outside the cache go to Rewind."""
+        querier = cache.CachingQuerier(self.segcache, self.socket)
+        query_events.return_value = iter(_events(0, 10))
+        list(querier.query_events())
+
+        query_events.return_value = iter(_events(51, 53))
+        self.assertEqual(list(querier.query_events(b'0050')), _events(51, 53))
+        self.assertEqual(len(self.segcache), 10)
@@ -0,0 +1,157 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test consumer checkpointing using `rewind.client.checkpoint`."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import rewind.client.checkpoint as checkpoint
+
+
+class _StoreTests(object):
+
+    """Tests common to all checkpoint stores."""
+
+    def testLoadMissing(self):
+        """Test that a consumer without a checkpoint loads None."""
+        self.assertEqual(self.store.load('consumer'), None)
+
+    def testSaveAndLoad(self):
+        """Test that the latest saved checkpoint is loaded."""
+        self.store.save('consumer', b'a')
+        self.store.save('consumer', b'b')
+        self.store.save('other', b'\x00\xff')
+        self.assertEqual(self.store.load('consumer'), b'b')
+        self.assertEqual(self.store.load('other'), b'\x00\xff')
+
+    def testSurvivesReopening(self):
+        """Test that checkpoints are persisted."""
+        self.store.save('consumer', b'a')
+        self.store.close()
+        self.store = self.open()
+        self.assertEqual(self.store.load('consumer'), b'a')
+
+
+class TestFileCheckpointStore(_StoreTests, unittest.TestCase):
+
+    """Test `FileCheckpointStore`."""
+
+    def setUp(self):
+        """Create a store in a temporary directory."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = self.open()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def open(self):
+        """Open the store."""
+        return checkpoint.FileCheckpointStore(
+            os.path.join(self.tmpdir, 'checkpoints'))
+
+    def testEmptyFile(self):
+        """Test that an empty checkpoint file loads None."""
+        path = os.path.join(self.tmpdir, 'checkpoints', 'consumer.checkpoint')
+        open(path, 'wb').close()
+        self.assertEqual(self.store.load('consumer'), None)
+
+    def testTemporaryFileIsReplaced(self):
+        """Test that saving leaves no temporary file behind."""
+        self.store.save('consumer', b'a')
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'checkpoints')),
+                         ['consumer.checkpoint'])
+
+
+class TestSQLiteCheckpointStore(_StoreTests, unittest.TestCase):
+
+    """Test `SQLiteCheckpointStore`."""
+
+    def setUp(self):
+        """Create a store in a temporary directory."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = self.open()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+
+    def open(self):
+        """Open the store."""
+        return checkpoint.SQLiteCheckpointStore(
+            os.path.join(self.tmpdir, 'checkpoints.db'))
+
+
+class TestCheckpointer(unittest.TestCase):
+
+    """Test `Checkpointer` and the checkpointing wrappers."""
+
+    def setUp(self):
+        """Set up a mocked store."""
+        self.store = mock.NonCallableMock()
+        self.store.load.return_value = b'a'
+
+    def testGroupCommit(self):
+        """Test that the store is written every `every` events."""
+        checkpointer = checkpoint.Checkpointer(self.store, 'consumer',
+                                               every=3, interval=None)
+        self.assertEqual(checkpointer.lasteventid, b'a')
+        for eventid in (b'b', b'c', b'd', b'e'):
+            checkpointer.record(eventid)
+        self.store.save.assert_called_once_with('consumer', b'd')
+
+        checkpointer.flush()
+        self.store.save.assert_called_with('consumer', b'e')
+        checkpointer.flush()
+        self.assertEqual(self.store.save.call_count, 2)
+
+    def testInterval(self):
+        """Test that the store is written when the interval has passed."""
+        with mock.patch.object(checkpoint.time, 'time') as time:
+            time.return_value = 100
+            checkpointer = checkpoint.Checkpointer(self.store, 'consumer',
+                                                   interval=1.0)
+            checkpointer.record(b'b')
+            self.assertFalse(self.store.save.called)
+            time.return_value = 101
+            checkpointer.record(b'c')
+        self.store.save.assert_called_once_with('consumer', b'c')
+
+    def testQueryResumesFromCheckpoint(self):
+        """Test that a query starts after, and records, the checkpoint."""
+        socket = mock.NonCallableMock()
+        with mock.patch.object(checkpoint, '_query_events') as query_events:
+            query_events.return_value = iter([(b'b', b'2'), (b'c', b'3')])
+            with checkpoint.Checkpointer(self.store, 'consumer') as cp:
+                events = checkpoint.query_events(socket, cp)
+                self.assertEqual(next(events), (b'b', b'2'))
+                # Not processed until the next event is asked for.
+                self.assertEqual(cp.lasteventid, b'a')
+                self.assertEqual(list(events), [(b'c', b'3')])
+            query_events.assert_called_once_with(socket, b'a', None, True,
+                                                 None)
+
+        self.assertEqual(cp.lasteventid, b'c')
+        self.store.save.assert_called_once_with('consumer', b'c')
+
+    def testFollowStreamResumesFromCheckpoint(self):
+        """Test that following the stream starts after the checkpoint."""
+        with mock.patch.object(checkpoint, '_follow_stream') as follow:
+            follow.return_value = iter([(b'b', b'2'), (b'c', b'3')])
+            cp = checkpoint.Checkpointer(self.store, 'consumer')
+            events = list(checkpoint.follow_stream(mock.sentinel.streamsock,
+                                                   mock.sentinel.reqsock, cp))
+            follow.assert_called_once_with(mock.sentinel.streamsock,
+                                           mock.sentinel.reqsock, b'a', True)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(cp.lasteventid, b'c')
@@ -0,0 +1,106 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test the command line tools in `rewind.client.cli`."""
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import mock
+import zmq
+
+import rewind.client.cli as cli
+import rewind.client.testing as testing
+
+
+class _Stream(object):
+
+    """A text stream stand-in with a binary buffer."""
+
+    def __init__(self, data=b''):
+        """Constructor."""
+        self.buffer = io.BytesIO(data)
+
+
+class TestCli(unittest.TestCase):
+
+    """Test `publish_main` and `query_main` against a fake Rewind."""
+
+    def setUp(self):
+        """Start a fake Rewind on an ipc endpoint."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.endpoint = 'ipc://' + os.path.join(self.tmpdir, 'query')
+        self.context = zmq.Context(1)
+        self.rewind = testing.FakeRewind(self.context, self.endpoint)
+        self.rewind.start()
+
+    def tearDown(self):
+        """Stop the fake Rewind."""
+        self.rewind.stop()
+        self.context.term()
+        shutil.rmtree(self.tmpdir)
+
+    def _query(self, *args):
+        """Run `query_main`, returning its exit code and output."""
+        stdout = _Stream()
+        with mock.patch.object(cli.sys, 'stdout', stdout):
+            code = cli.query_main(['--query-endpoint', self.endpoint] +
+                                  list(args))
+        return code, stdout.buffer.getvalue()
+
+    def testPublishArguments(self):
+        """Test publishing events given as arguments."""
+        code = cli.publish_main(['--query-endpoint', self.endpoint,
+                                 'first', 'second'])
+        self.assertEqual(code, 0)
+        self.assertEqual([eventdata for _, eventdata in self.rewind.events],
+                         [b'first', b'second'])
+
+    def testPublishStdin(self):
+        """Test publishing standard input."""
+        with mock.patch.object(cli.sys, 'stdin', _Stream(b'\x00binary')):
+            code = cli.publish_main(['--query-endpoint', self.endpoint])
+        self.assertEqual(code, 0)
+        self.assertEqual(self.rewind.events[0][1], b'\x00binary')
+
+    def testQuery(self):
+        """Test querying events."""
+        cli.publish_main(['--query-endpoint', self.endpoint, 'a', 'b', 'c'])
+        (firstid, _), (secondid, _), _ = self.rewind.events
+        self.assertEqual(self._query(), (0, b'a\nb\nc\n'))
+        self.assertEqual(self._query('--from', firstid.decode(), '--to',
+                                     secondid.decode(), '--ids'),
+                         (0, secondid + b'\tb\n'))
+
+    def testQueryFailure(self):
+        """Test that a failed query exits with status 2."""
+        self.assertEqual(self._query('--from', 'unknown'), (2, b''))
+
+    def testTimeout(self):
+        """Test that not getting a reply in time exits with status 1."""
+        self.rewind.reply_delay = 0.2
+        code = cli.publish_main(['--query-endpoint', self.endpoint,
+                                 '--timeout', '0.05', 'event'])
+        self.assertEqual(code, 1)
+
+
+class TestColdStart(unittest.TestCase):
+
+    """Test that importing the client is cheap."""
+
+    def testNoEagerZmq(self):
+        """Test that ZeroMQ is not imported eagerly."""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        statement = 'import sys, rewind.client; print("zmq" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', statement],
+                                         cwd=root)
+        self.assertEqual(output.strip(), b'False')
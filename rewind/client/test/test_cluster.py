@@ -0,0 +1,99 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test querying multiple nodes using `rewind.client.cluster`."""
+import itertools
+import unittest
+
+import mock
+
+import rewind.client as clients
+import rewind.client.cluster as cluster
+
+
+EVENTS = [(b'a', b'event1'), (b'b', b'event2'), (b'c', b'event3')]
+
+
+def _query(from_=None, to=None, copy=True, timeout=None, failafter=None):
+    """Yield `EVENTS` after `from_`, optionally timing out halfway."""
+    ids = [eventid for eventid, _ in EVENTS]
+    start = ids.index(from_) + 1 if from_ else 0
+    for i, event in enumerate(EVENTS[start:]):
+        if failafter is not None and i == failafter:
+            raise clients.TimeoutException("No reply.")
+        yield event
+
+
+class TestClusterClient(unittest.TestCase):
+
+    """Test `ClusterClient`."""
+
+    def setUp(self):
+        """Set up a client with mocked pools for a primary and a replica."""
+        self.pools = {}
+
+        def create_pool(context, endpoint, maxsize, profile):
+            pool = mock.NonCallableMock()
+            pool.endpoint = endpoint
+            pool.query_events.side_effect = _query
+            self.pools[endpoint] = pool
+            return pool
+
+        patcher = mock.patch.object(cluster, 'RewindPool', create_pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = cluster.ClusterClient(mock.NonCallableMock(),
+                                            'primary', ['replica'],
+                                            timeout=1.0)
+
+    def testPublishGoesToPrimary(self):
+        """Test that events are only published to the primary."""
+        for _ in range(5):
+            self.client.publish_event(b'event')
+        self.assertEqual(self.pools['primary'].publish_event.call_count, 5)
+        assert not self.pools['replica'].publish_event.called
+
+    def testQueriesAreSpread(self):
+        """Test that queries are sent to all nodes."""
+        # Let every node reply equally fast, as measured latencies would
+        # skew the odds at random.
+        with mock.patch.object(cluster, 'time') as clock:
+            clock.time.side_effect = itertools.count(1000, 0.01)
+            for _ in range(50):
+                self.assertEqual(list(self.client.query_events()), EVENTS)
+        self.assertTrue(self.pools['primary'].query_events.called)
+        self.assertTrue(self.pools['replica'].query_events.called)
+
+    def testFailoverResumesQuery(self):
+        """Test that a failing node's query is resumed on another node."""
+        self.pools['replica'].query_events.side_effect = (
+            lambda *args: _query(*args, failafter=1))
+        self.client._pick = mock.Mock(side_effect=[
+            self.client._readers[0], self.client._readers[1]])
+
+        self.assertEqual(list(self.client.query_events()), EVENTS)
+        self.pools['primary'].query_events.assert_called_once_with(
+            b'a', None, True, 1.0)
+        health = self.client.health()
+        self.assertFalse(health['replica']['up'])
+        self.assertEqual(health['replica']['failures'], 1)
+        self.assertTrue(health['primary']['up'])
+
+    def testAllNodesFailing(self):
+        """Test that a query fails when every node has failed."""
+        for pool in self.pools.values():
+            pool.query_events.side_effect = (
+                lambda *args: _query(*args, failafter=0))
+        self.assertRaises(cluster.NoHealthyNodes, list,
+                          self.client.query_events())
+
+    def testSlowNodesGetLessTraffic(self):
+        """Test that nodes are picked inversely to their latency."""
+        self.client._readers[0].latency = 1.0
+        self.client._readers[1].latency = 0.01
+        picks = [self.client._pick([]) for _ in range(1000)]
+        self.assertTrue(picks.count(self.client._readers[0]) < 100)
@@ -0,0 +1,137 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test columnar querying using `rewind.client.columnar`."""
+import threading
+import unittest
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.columnar as columnar
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestEventBatch(unittest.TestCase):
+
+    """Test `EventBatch`."""
+
+    def setUp(self):
+        """Set up a batch of three events."""
+        self.events = [(b'a', b'event1'), (b'bb', b''), (b'c', b'event3!')]
+        self.batch = columnar.EventBatch.from_events(self.events)
+
+    def testColumns(self):
+        """Test that ids and data are concatenated with offsets."""
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual(self.batch.ids, b'abbc')
+        self.assertEqual(list(self.batch.id_offsets), [0, 1, 3, 4])
+        self.assertEqual(self.batch.data, b'event1event3!')
+        self.assertEqual(list(self.batch.data_offsets), [0, 6, 6, 13])
+        self.assertEqual(self.batch.nbytes, 13)
+
+    def testAccess(self):
+        """Test accessing single events."""
+        self.assertEqual(self.batch.first_id, b'a')
+        self.assertEqual(self.batch.last_id, b'c')
+        self.assertEqual(bytes(self.batch.eventdata(2)), b'event3!')
+        self.assertEqual([(eventid, bytes(eventdata))
+                          for eventid, eventdata in self.batch], self.events)
+
+    def testEmpty(self):
+        """Test an empty batch."""
+        batch = columnar.EventBatch.from_events([])
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch.last_id, None)
+        self.assertEqual(list(batch), [])
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def testToNumpy(self):
+        """Test converting to NumPy arrays."""
+        ids, idoffsets, data, dataoffsets = self.batch.to_numpy()
+        self.assertEqual(data[dataoffsets[2]:dataoffsets[3]].tobytes(),
+                         b'event3!')
+        self.assertEqual(idoffsets.tolist(), [0, 1, 3, 4])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def testToArrow(self):
+        """Test converting to an Arrow table."""
+        table = self.batch.to_arrow()
+        self.assertEqual(table.column('eventid').to_pylist(),
+                         [b'a', b'bb', b'c'])
+        self.assertEqual(table.column('eventdata').to_pylist(),
+                         [b'event1', b'', b'event3!'])
+
+
+class TestQueryEventBatches(unittest.TestCase):
+
+    """Test `query_event_batches` against a scripted Rewind."""
+
+    def setUp(self):
+        """Set up a REP socket replying with scripted batches."""
+        self.context = zmq.Context(1)
+        self.rewind = self.context.socket(zmq.REP)
+        self.rewind.bind('inproc://scripted-rewind')
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.connect('inproc://scripted-rewind')
+
+    def tearDown(self):
+        """Close the sockets."""
+        self.socket.close(0)
+        self.rewind.close(0)
+        self.context.term()
+
+    def _serve(self, replies):
+        """Reply to one request for each of `replies` in a thread.
+
+        Returns the thread and a list that the requests are appended to.
+
+        """
+        requests = []
+
+        def serve():
+            for reply in replies:
+                requests.append(self.rewind.recv_multipart())
+                self.rewind.send_multipart(reply)
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread, requests
+
+    def testBatches(self):
+        """Test that every reply is yielded as a batch."""
+        thread, requests = self._serve([
+            [b'a', b'event1', b'b', b'event2'],
+            [b'c', b'event3', b'END'],
+        ])
+        batches = list(columnar.query_event_batches(self.socket, b'0'))
+        thread.join()
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(batches[0].data, b'event1event2')
+        self.assertEqual(requests, [[b'QUERY', b'0', b''],
+                                    [b'QUERY', b'b', b'']])
+
+    def testEmptyResult(self):
+        """Test that an empty result yields no batches."""
+        thread, _ = self._serve([[b'END']])
+        self.assertEqual(list(columnar.query_event_batches(self.socket)), [])
+        thread.join()
+
+    def testError(self):
+        """Test that a query error is raised."""
+        thread, _ = self._serve([[b'ERROR Key did not exist']])
+        self.assertRaises(clients.QueryException, list,
+                          columnar.query_event_batches(self.socket, b'x'))
+        thread.join()
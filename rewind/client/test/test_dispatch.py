@@ -0,0 +1,168 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test dispatching events to handlers using `rewind.client.dispatch`."""
+import functools
+import threading
+import time
+import unittest
+
+import rewind.client.dispatch as dispatch
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+
+EVENTS = [(str(i).encode(), b'event' + str(i).encode() * i)
+          for i in range(50)]
+
+
+def _record(results, name, eventid, eventdata):
+    """Process handler putting the events it is called with on a queue."""
+    results.put((name, eventid, bytes(eventdata)))
+
+
+def _fail(eventid, eventdata):
+    """Process handler that always fails."""
+    raise RuntimeError("Handler failure.")
+
+
+def _sleep(eventid, eventdata):
+    """Process handler that takes a long time."""
+    time.sleep(60)
+
+
+class TestThreadDispatch(unittest.TestCase):
+
+    """Test `Dispatcher` with thread workers."""
+
+    def testEveryHandlerGetsEveryEvent(self):
+        """Test that all handlers get all events, in order."""
+        received = {'a': [], 'b': []}
+        with dispatch.Dispatcher() as dispatcher:
+            for name, events in received.items():
+                dispatcher.register(name, lambda eventid, eventdata,
+                                    events=events: events.append(eventid))
+            dispatcher.run(iter(EVENTS))
+        ids = [eventid for eventid, _ in EVENTS]
+        self.assertEqual(received, {'a': ids, 'b': ids})
+
+    def testBackpressure(self):
+        """Test that dispatching waits for a slow handler."""
+        release = threading.Event()
+        dispatcher = dispatch.Dispatcher(maxqueue=2)
+        dispatcher.register('slow', lambda eventid, eventdata: release.wait())
+        runner = threading.Thread(target=dispatcher.run, args=(iter(EVENTS),))
+        runner.start()
+        time.sleep(0.2)
+
+        lag = dispatcher.lag()['slow']
+        self.assertEqual(lag['processed'], 0)
+        self.assertTrue(lag['pending'] <= 3, lag)
+        self.assertTrue(runner.is_alive())
+
+        release.set()
+        runner.join()
+        dispatcher.close()
+        lag = dispatcher.lag()
+        self.assertEqual(lag, {})
+
+    def testLag(self):
+        """Test that lag is reported per handler."""
+        dispatcher = dispatch.Dispatcher()
+        dispatcher.register('fast', lambda eventid, eventdata: None)
+        dispatcher.run(iter(EVENTS))
+        time.sleep(0.1)
+        lag = dispatcher.lag()['fast']
+        dispatcher.close()
+        self.assertEqual(lag['dispatched'], len(EVENTS))
+        self.assertEqual(lag['processed'], len(EVENTS))
+        self.assertEqual(lag['pending'], 0)
+        self.assertFalse(lag['failed'])
+
+    def testFailingHandler(self):
+        """Test that a failed handler stops dispatching."""
+        dispatcher = dispatch.Dispatcher()
+        dispatcher.register('failing', _fail)
+        self.assertRaises(dispatch.HandlerFailed, dispatcher.run,
+                          iter(EVENTS * 100))
+        self.assertTrue(dispatcher.lag()['failing']['failed'])
+        dispatcher.close()
+
+    def testCloseAbandonsStuckHandler(self):
+        """Test that closing does not wait forever for a stuck handler."""
+        release = threading.Event()
+        handled = []
+
+        def stuck(eventid, eventdata):
+            release.wait()
+            handled.append(eventid)
+        dispatcher = dispatch.Dispatcher(maxqueue=1)
+        dispatcher.register('stuck', stuck)
+        worker = dispatcher._threads[0]
+        for eventid, eventdata in EVENTS[:2]:
+            dispatcher.dispatch(eventid, eventdata)
+        start = time.time()
+        dispatcher.close(timeout=0.3)
+        self.assertLess(time.time() - start, 5)
+
+        # The rest of the queue is left once the handler returns.
+        release.set()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(handled, [EVENTS[0][0]])
+
+
+@unittest.skipIf(shared_memory is None, "shared_memory not available")
+class TestProcessDispatch(unittest.TestCase):
+
+    """Test `Dispatcher` with process workers."""
+
+    def testSharedRing(self):
+        """Test that process handlers get all events through the ring."""
+        results = dispatch._default_mpcontext().Queue()
+        # A small ring makes the data wrap around many times.
+        with dispatch.Dispatcher(maxqueue=10, ring_bytes=300) as dispatcher:
+            for name in ('a', 'b'):
+                dispatcher.register(name,
+                                    functools.partial(_record, results, name),
+                                    process=True)
+            dispatcher.run(iter(EVENTS))
+        received = {'a': [], 'b': []}
+        for _ in range(2 * len(EVENTS)):
+            name, eventid, eventdata = results.get(timeout=10)
+            received[name].append((eventid, eventdata))
+        results.close()
+        self.assertEqual(received, {'a': EVENTS, 'b': EVENTS})
+
+    def testFailingProcessHandler(self):
+        """Test that a failed process handler stops dispatching."""
+        dispatcher = dispatch.Dispatcher(maxqueue=1, ring_bytes=1000)
+        dispatcher.register('failing', _fail, process=True)
+        self.assertRaises(dispatch.HandlerFailed, dispatcher.run,
+                          iter(EVENTS * 100))
+        dispatcher.close()
+
+    def testCloseTerminatesSlowHandler(self):
+        """Test that closing terminates a handler not done in time."""
+        dispatcher = dispatch.Dispatcher(maxqueue=1, ring_bytes=1000)
+        dispatcher.register('slow', _sleep, process=True)
+        for eventid, eventdata in EVENTS[:2]:
+            dispatcher.dispatch(eventid, eventdata)
+        start = time.time()
+        dispatcher.close(timeout=0.5)
+        self.assertLess(time.time() - start, 10)
+
+    def testTooLargeEvent(self):
+        """Test that events larger than the ring are refused."""
+        with dispatch.Dispatcher(ring_bytes=10) as dispatcher:
+            dispatcher.register('a', _fail, process=True)
+            self.assertRaises(ValueError, dispatcher.dispatch, b'a',
+                              b'x' * 11)
@@ -0,0 +1,106 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test filtered querying using `rewind.client.filtering`."""
+import threading
+import unittest
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.filtering as filtering
+
+
+class TestPredicates(unittest.TestCase):
+
+    """Test the predicate factories."""
+
+    def testPrefix(self):
+        """Test matching prefixes of byte strings and memoryviews."""
+        predicate = filtering.prefix(b'user-1:', b'user-22:')
+        for convert in (bytes, memoryview):
+            self.assertTrue(predicate(convert(b'user-1:created')))
+            self.assertTrue(predicate(convert(b'user-22:created')))
+            self.assertFalse(predicate(convert(b'user-2:created')))
+            self.assertFalse(predicate(convert(b'')))
+
+    def testAt(self):
+        """Test matching a value at an offset."""
+        predicate = filtering.at(2, b'42')
+        for convert in (bytes, memoryview):
+            self.assertTrue(predicate(convert(b'v142abc')))
+            self.assertFalse(predicate(convert(b'v143abc')))
+            self.assertFalse(predicate(convert(b'v1')))
+
+    def testMatches(self):
+        """Test matching a regular expression."""
+        predicate = filtering.matches(b'[a-z]+-[0-9]+:')
+        for convert in (bytes, memoryview):
+            self.assertTrue(predicate(convert(b'user-42:created')))
+            self.assertFalse(predicate(convert(b':user-42')))
+
+
+class TestFilteredQuery(unittest.TestCase):
+
+    """Test `query_events` against a scripted Rewind."""
+
+    def setUp(self):
+        """Set up a REP socket replying with scripted batches."""
+        self.context = zmq.Context(1)
+        self.rewind = self.context.socket(zmq.REP)
+        self.rewind.bind('inproc://scripted-rewind')
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.connect('inproc://scripted-rewind')
+        self.requests = []
+
+    def tearDown(self):
+        """Close the sockets."""
+        self.socket.close(0)
+        self.rewind.close(0)
+        self.context.term()
+
+    def _serve(self, replies):
+        """Reply to one request for each of `replies` in a thread."""
+        def serve():
+            for reply in replies:
+                self.requests.append(self.rewind.recv_multipart())
+                self.rewind.send_multipart(reply)
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread
+
+    def testBatchesFollowLastReceivedEvent(self):
+        """Test that batches continue after rejected events too."""
+        for copy in (True, False):
+            thread = self._serve([[b'a', b'keep1', b'b', b'drop2'],
+                                  [b'c', b'keep3', b'END']])
+            events = list(filtering.query_events(
+                self.socket, filtering.prefix(b'keep'), copy=copy))
+            thread.join()
+
+            self.assertEqual([(eventid, bytes(eventdata))
+                              for eventid, eventdata in events],
+                             [(b'a', b'keep1'), (b'c', b'keep3')])
+            self.assertEqual(self.requests[-1], [b'QUERY', b'b', b''])
+
+    def testProjection(self):
+        """Test that matching events are projected."""
+        thread = self._serve([[b'a', b'keep1', b'END']])
+        events = list(filtering.query_events(
+            self.socket, filtering.prefix(b'keep'),
+            project=lambda eventdata: eventdata[4:]))
+        thread.join()
+        self.assertEqual(events, [(b'a', b'1')])
+
+    def testError(self):
+        """Test that a query error is raised."""
+        thread = self._serve([[b'ERROR Key did not exist']])
+        self.assertRaises(clients.QueryException, list,
+                          filtering.query_events(self.socket,
+                                                 filtering.prefix(b'a'),
+                                                 b'nonexistent'))
+        thread.join()
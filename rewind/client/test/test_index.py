@@ -0,0 +1,64 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test the compact event id index in `rewind.client.index`."""
+import unittest
+import uuid
+
+import rewind.client.index as index
+
+
+class TestEventIndex(unittest.TestCase):
+
+    """Test `EventIndex`."""
+
+    def setUp(self):
+        """Create a bunch of event ids."""
+        self.ids = [uuid.uuid4().hex.encode() for _ in range(5000)]
+
+    def testAddAndGet(self):
+        """Test lookups of indexed ids, including across table growth."""
+        eventindex = index.EventIndex()
+        for i, eventid in enumerate(self.ids):
+            eventindex.add(eventid, i)
+
+        self.assertEqual(len(eventindex), len(self.ids))
+        for i, eventid in enumerate(self.ids):
+            self.assertEqual(eventindex[eventid], i)
+        self.assertNotIn(b'non-exist', eventindex)
+        self.assertIsNone(eventindex.get(b'non-exist'))
+        self.assertRaises(KeyError, eventindex.__getitem__, b'non-exist')
+
+    def testOverwrite(self):
+        """Test that adding an id twice overwrites its value."""
+        eventindex = index.EventIndex()
+        eventindex.add(b'a', 1)
+        eventindex.add(b'a', 2)
+        self.assertEqual(len(eventindex), 1)
+        self.assertEqual(eventindex[b'a'], 2)
+
+    def testPrune(self):
+        """Test removing entries with small values."""
+        eventindex = index.EventIndex()
+        for i, eventid in enumerate(self.ids):
+            eventindex.add(eventid, i)
+
+        eventindex.prune(1000)
+
+        self.assertEqual(len(eventindex), len(self.ids) - 1000)
+        self.assertNotIn(self.ids[999], eventindex)
+        self.assertEqual(eventindex[self.ids[1000]], 1000)
+
+    def testTrack(self):
+        """Test indexing events while they are consumed."""
+        eventindex = index.EventIndex()
+        events = [(eventid, b'data') for eventid in self.ids[:10]]
+
+        self.assertEqual(list(eventindex.track(iter(events))), events)
+
+        self.assertEqual(eventindex[self.ids[0]], 0)
+        self.assertEqual(eventindex[self.ids[9]], 9)
@@ -0,0 +1,81 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test metrics and tracing hooks in `rewind.client.instrumentation`."""
+import unittest
+
+import mock
+
+import rewind.client as clients
+import rewind.client.instrumentation as instrumentation
+
+
+def _query_socket():
+    """Return a mocked REQ socket replying with two batches of events."""
+    socket = mock.NonCallableMock()
+    socket.recv.side_effect = [b'a', b'event1', b'b', b'event2',
+                               b'c', b'event3', b'END']
+    socket.getsockopt.side_effect = [True, True, True, False,
+                                     True, True, False, False]
+    return socket
+
+
+def _publish_socket():
+    """Return a mocked REQ socket acknowledging a published event."""
+    socket = mock.NonCallableMock()
+    socket.recv.return_value = b'PUBLISHED'
+    socket.getsockopt.return_value = False
+    return socket
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    """Test that client functions report to the installed instrumentation."""
+
+    def tearDown(self):
+        """Uninstall any instrumentation."""
+        instrumentation.set_instrumentation(None)
+
+    def testDisabledByDefault(self):
+        """Test that the default instrumentation is disabled."""
+        self.assertFalse(instrumentation.get_instrumentation().enabled)
+
+    def testPrometheusExport(self):
+        """Test collecting and rendering Prometheus metrics."""
+        metrics = instrumentation.PrometheusInstrumentation()
+        instrumentation.set_instrumentation(metrics)
+
+        list(clients.query_events(_query_socket()))
+        clients.publish_event(_publish_socket(), b'event')
+
+        rendered = metrics.render()
+        self.assertIn('rewind_client_query_events_total 3\n', rendered)
+        self.assertIn('rewind_client_query_bytes_total 18\n', rendered)
+        self.assertIn('rewind_client_queries_total 1\n', rendered)
+        self.assertIn('rewind_client_query_batch_seconds_count 2\n',
+                      rendered)
+        self.assertIn('rewind_client_query_batch_events_bucket{le="1.0"} 1\n',
+                      rendered)
+        self.assertIn('rewind_client_published_bytes_total 5\n', rendered)
+        self.assertIn('# TYPE rewind_client_publish_seconds histogram\n',
+                      rendered)
+
+    def testTracing(self):
+        """Test that spans are recorded with a tracer."""
+        tracer = mock.NonCallableMock()
+        instrumentation.set_instrumentation(
+            instrumentation.TracingInstrumentation(tracer))
+
+        clients.publish_event(_publish_socket(), b'event')
+
+        self.assertEqual(tracer.start_span.call_count, 1)
+        args, kwargs = tracer.start_span.call_args
+        self.assertEqual(args, ('rewind.publish',))
+        self.assertEqual(kwargs['attributes'], {'rewind.bytes': 5})
+        span = tracer.start_span.return_value
+        self.assertGreaterEqual(span.end.call_args[1]['end_time'],
+                                kwargs['start_time'])
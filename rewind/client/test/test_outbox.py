@@ -0,0 +1,143 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test publishing through an outbox using `rewind.client.outbox`."""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import zmq
+
+import rewind.client.outbox as outbox
+import rewind.client.testing as testing
+
+
+class TestOutbox(unittest.TestCase):
+
+    """Test `Outbox` against a fake Rewind."""
+
+    def setUp(self):
+        """Set up a temporary directory and a context."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'outbox')
+        self.endpoint = 'ipc://' + os.path.join(self.tmpdir, 'query')
+        self.context = zmq.Context(1)
+        self.rewind = None
+
+    def tearDown(self):
+        """Stop any fake Rewind and remove the temporary directory."""
+        if self.rewind is not None:
+            self.rewind.stop()
+        self.context.term()
+        shutil.rmtree(self.tmpdir)
+
+    def _start_rewind(self):
+        """Start a fake Rewind."""
+        self.rewind = testing.FakeRewind(self.context, self.endpoint)
+        self.rewind.start()
+
+    def _open(self, **kwargs):
+        """Open the outbox with short timeouts."""
+        kwargs.setdefault('timeout', 0.2)
+        kwargs.setdefault('retry_interval', 0.05)
+        kwargs.setdefault('sync_interval', 0.01)
+        return outbox.Outbox(self.context, self.endpoint, self.directory,
+                             **kwargs)
+
+    def _published(self):
+        """Return the data of the events received by the fake Rewind."""
+        return [eventdata for _, eventdata in self.rewind.events]
+
+    def testPublish(self):
+        """Test that events are published in order."""
+        self._start_rewind()
+        events = [str(i).encode() for i in range(500)]
+        with self._open(window=10, batch_size=50) as ob:
+            for event in events:
+                ob.publish(event)
+            self.assertTrue(ob.drain(10))
+            self.assertEqual(ob.pending, 0)
+        self.assertEqual(self._published(), events)
+
+    def testOutage(self):
+        """Test that publishing does not wait for an unreachable Rewind."""
+        with self._open() as ob:
+            start = time.time()
+            for i in range(100):
+                ob.publish(b'event')
+            self.assertTrue(time.time() - start < 0.5)
+            self.assertTrue(ob.sync(5))
+            self.assertFalse(ob.drain(0.3))
+            self.assertEqual(ob.pending, 100)
+
+            self._start_rewind()
+            self.assertTrue(ob.drain(10))
+        self.assertEqual(len(self._published()), 100)
+
+    def testDrainWhileClosing(self):
+        """Test that an unbounded drain returns when the outbox is closed."""
+        ob = self._open()
+        ob.publish(b'event')
+        closer = threading.Timer(0.2, ob.close)
+        closer.start()
+        start = time.time()
+        self.assertFalse(ob.drain())
+        self.assertTrue(time.time() - start < 5)
+        closer.join()
+
+    def testRestart(self):
+        """Test that unpublished events are published after a restart."""
+        with self._open() as ob:
+            ob.publish(b'first')
+            ob.publish(b'second')
+        self._start_rewind()
+        with self._open() as ob:
+            self.assertEqual(ob.pending, 2)
+            ob.publish(b'third')
+            self.assertTrue(ob.drain(10))
+        # Acknowledged events are not published again.
+        with self._open() as ob:
+            self.assertEqual(ob.pending, 0)
+        self.assertEqual(self._published(), [b'first', b'second', b'third'])
+
+    def testTornRecord(self):
+        """Test that a torn record ends the log on recovery."""
+        with self._open() as ob:
+            ob.publish(b'first')
+            ob.publish(b'second')
+        segment = outbox._segment_name(0)
+        with open(os.path.join(self.directory, segment), 'r+b') as f:
+            data = f.read()
+            # Corrupt the last byte of the second event.
+            f.seek(data.index(b'second') + 5)
+            f.write(b'X')
+
+        self._start_rewind()
+        with self._open() as ob:
+            self.assertEqual(ob.pending, 1)
+            ob.publish(b'third')
+            self.assertTrue(ob.drain(10))
+        self.assertEqual(self._published(), [b'first', b'third'])
+
+    def testSegments(self):
+        """Test that the log rolls over segments and deletes them."""
+        self._start_rewind()
+        events = [str(i).encode() * 10 for i in range(100)]
+        with self._open(segment_bytes=200) as ob:
+            for event in events:
+                ob.publish(event)
+            self.assertTrue(ob.drain(10))
+            self.assertRaises(ValueError, ob.publish, b'x' * 200)
+            # Give the committer time to delete published segments.
+            time.sleep(0.1)
+            segments = [name for name in os.listdir(self.directory)
+                        if name.endswith('.wal')]
+            self.assertTrue(len(segments) <= 2, segments)
+        self.assertEqual(self._published(), events)
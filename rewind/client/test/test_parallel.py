@@ -0,0 +1,100 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test parallel querying using `rewind.client.parallel`."""
+import unittest
+
+import mock
+
+import rewind.client as clients
+import rewind.client.parallel as parallel
+
+
+class _FakeQuerySocket(object):
+
+    """A REQ socket stand-in that answers queries from a list of events."""
+
+    def __init__(self, events, batchsize):
+        """Constructor.
+
+        Parameters:
+        events    -- a list of `(eventid, eventdata)` tuples to query.
+        batchsize -- the maximum number of events per reply.
+
+        """
+        self._events = events
+        self._ids = [eventid for eventid, _ in events]
+        self._batchsize = batchsize
+        self._reply = None
+
+    def connect(self, endpoint):
+        """Pretend to connect."""
+        pass
+
+    def close(self, linger=None):
+        """Pretend to close."""
+        pass
+
+    def send_multipart(self, frames):
+        """Prepare the reply to a query."""
+        request, from_, to = frames
+        assert request == b'QUERY'
+        try:
+            start = self._ids.index(from_) + 1 if from_ else 0
+            end = self._ids.index(to) + 1 if to else len(self._ids)
+        except ValueError:
+            self._reply = [b'ERROR Key did not exist']
+            return
+        events = self._events[start:min(end, start + self._batchsize)]
+        self._reply = [frame for event in events for frame in event]
+        if len(events) < self._batchsize:
+            self._reply.append(b'END')
+
+    def recv_multipart(self):
+        """Return the reply to the last query."""
+        return self._reply
+
+
+class TestParallelQuery(unittest.TestCase):
+
+    """Test `parallel_query`."""
+
+    def setUp(self):
+        """Create a history of events and a context handing out sockets."""
+        self.events = [('{0:03d}'.format(i).encode(),
+                        'event{0}'.format(i).encode())
+                       for i in range(50)]
+        self.context = mock.NonCallableMock()
+        self.context.socket.side_effect = \
+            lambda socktype: _FakeQuerySocket(self.events, 3)
+
+    def testSplitRanges(self):
+        """Test splitting up history into ranges."""
+        self.assertEqual(parallel.split_ranges([b'a', b'b']),
+                         [(None, b'a'), (b'a', b'b'), (b'b', None)])
+        self.assertEqual(parallel.split_ranges([]), [(None, None)])
+
+    def testOrderedQuery(self):
+        """Test that ordered queries yield the whole history in order."""
+        boundaries = [b'007', b'020', b'021', b'040']
+        results = list(parallel.parallel_query(self.context, 'endpoint',
+                                               boundaries, workers=3))
+        self.assertEqual(results, self.events)
+
+    def testUnorderedQuery(self):
+        """Test that unordered queries yield every event exactly once."""
+        boundaries = [b'007', b'020', b'040']
+        results = list(parallel.parallel_query(self.context, 'endpoint',
+                                               boundaries, workers=2,
+                                               ordered=False))
+        self.assertEqual(sorted(results), self.events)
+
+    def testNonExistentBoundary(self):
+        """Test that a non-existent boundary raises `QueryException`."""
+        result = parallel.parallel_query(self.context, 'endpoint',
+                                         [b'007', b'non-exist'])
+        self.assertRaises(clients.QueryException, list, result)
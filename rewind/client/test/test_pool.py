@@ -0,0 +1,144 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test socket pooling using `rewind.client.pool`."""
+import threading
+import time
+import unittest
+
+import mock
+import zmq
+
+import rewind.client as clients
+import rewind.client.pool as pool
+
+
+class TestRewindPool(unittest.TestCase):
+
+    """Test `RewindPool`."""
+
+    def setUp(self):
+        """Set up a pool creating mocked sockets."""
+        self.sockets = []
+
+        def create_socket(socket_type):
+            socket = mock.NonCallableMock()
+            socket.closed = False
+            socket.getsockopt.return_value = zmq.POLLOUT
+            self.sockets.append(socket)
+            return socket
+
+        self.context = mock.NonCallableMock()
+        self.context.socket.side_effect = create_socket
+        self.pool = pool.RewindPool(self.context, 'tcp://localhost:8090',
+                                    maxsize=2)
+
+    def testSocketsAreReused(self):
+        """Test that a handed back socket is checked out again."""
+        with self.pool.connection() as socket1:
+            pass
+        with self.pool.connection() as socket2:
+            pass
+
+        self.assertIs(socket1, socket2)
+        self.assertEqual(self.pool.size, 1)
+        self.assertEqual(self.pool.statistics.checkouts, 2)
+        self.sockets[0].connect.assert_called_once_with(
+            'tcp://localhost:8090')
+
+    def testExceptionRecyclesSocket(self):
+        """Test that a socket is closed if its user raised an exception."""
+        def failing_query():
+            with self.pool.connection():
+                raise clients.QueryException("Key did not exist")
+        self.assertRaises(clients.QueryException, failing_query)
+
+        self.sockets[0].close.assert_called_once_with(0)
+        self.assertEqual(self.pool.size, 0)
+        self.assertEqual(self.pool.statistics.recycled, 1)
+        with self.pool.connection() as socket:
+            self.assertIs(socket, self.sockets[1])
+
+    def testUnreadReplyRecyclesSocket(self):
+        """Test that a socket with an unread reply is not reused."""
+        with self.pool.connection() as socket:
+            socket.getsockopt.return_value = zmq.POLLIN
+
+        socket.close.assert_called_once_with(0)
+        self.assertEqual(self.pool.idle, 0)
+
+    def testMaximumSize(self):
+        """Test that an exhausted pool makes checkouts wait."""
+        socket1 = self.pool.checkout()
+        self.pool.checkout()
+        self.assertRaises(pool.PoolTimeout, self.pool.checkout, 0.01)
+
+        timer = threading.Timer(0.05, self.pool.checkin, [socket1])
+        timer.start()
+        socket3 = self.pool.checkout(5)
+        timer.join()
+
+        self.assertIs(socket3, socket1)
+        self.assertEqual(len(self.sockets), 2)
+        stats = self.pool.statistics
+        self.assertEqual(stats.waits, 1)
+        self.assertTrue(stats.max_wait_seconds >= 0.04)
+
+    def testAbandonedQueryRecyclesSocket(self):
+        """Test that a query not iterated to its end recycles its socket."""
+        with mock.patch.object(pool, 'query_events') as query_events:
+            query_events.return_value = iter([(b'a', b'1'), (b'b', b'2')])
+            events = self.pool.query_events()
+            self.assertEqual(next(events), (b'a', b'1'))
+            events.close()
+
+        self.assertEqual(self.pool.statistics.recycled, 1)
+
+    def testClose(self):
+        """Test that closing the pool closes idle sockets."""
+        with self.pool.connection():
+            pass
+        self.pool.close()
+
+        self.sockets[0].close.assert_called_once_with(None)
+        self.assertRaises(RuntimeError, self.pool.checkout)
+
+
+class TestRewindPoolThreads(unittest.TestCase):
+
+    """Test `RewindPool` used by multiple threads."""
+
+    def testThreadsNeverShareSockets(self):
+        """Test that a socket is only ever used by one thread at a time."""
+        context = mock.NonCallableMock()
+        context.socket.side_effect = lambda socket_type: mock.NonCallableMock(
+            closed=False, **{'getsockopt.return_value': 0})
+        rewindpool = pool.RewindPool(context, 'inproc://nowhere', maxsize=3)
+        inuse = set()
+        lock = threading.Lock()
+        errors = []
+
+        def worker():
+            for _ in range(20):
+                with rewindpool.connection() as socket:
+                    with lock:
+                        if socket in inuse:
+                            errors.append(socket)
+                        inuse.add(socket)
+                    time.sleep(0.001)
+                    with lock:
+                        inuse.discard(socket)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(rewindpool.size <= 3)
+        self.assertEqual(rewindpool.statistics.checkouts, 120)
@@ -0,0 +1,56 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test prefetching queries using `rewind.client.prefetch`."""
+import unittest
+
+import mock
+
+import rewind.client as clients
+import rewind.client.prefetch as prefetch
+
+
+class TestPrefetchingQuery(unittest.TestCase):
+
+    """Test `rewind.client.prefetch.query_events`."""
+
+    def testQueryInBatches(self):
+        """Test that all batches are yielded in order."""
+        socket = mock.NonCallableMock()
+        socket.recv_multipart.side_effect = [
+            [b'a', b'event1', b'b', b'event2'],
+            [b'c', b'event3', b'END'],
+        ]
+
+        results = list(prefetch.query_events(socket, depth=1))
+
+        self.assertEqual(results, [(b'a', b'event1'), (b'b', b'event2'),
+                                   (b'c', b'event3')])
+        socket.send_multipart.assert_has_calls([
+            mock.call([b'QUERY', b'', b'']),
+            mock.call([b'QUERY', b'b', b'']),
+        ])
+
+    def testQueryError(self):
+        """Test that a failed query raises `QueryException` for the caller."""
+        socket = mock.NonCallableMock()
+        socket.recv_multipart.side_effect = [[b'ERROR Key did not exist']]
+
+        result = prefetch.query_events(socket, from_=b'non-exist')
+        self.assertRaises(clients.QueryException, list, result)
+
+    def testClosingStopsFetching(self):
+        """Test that closing the generator stops the background thread."""
+        socket = mock.NonCallableMock()
+        socket.recv_multipart.side_effect = [[b'a', b'event1']
+                                             for _ in range(100)]
+
+        result = prefetch.query_events(socket, depth=1)
+        self.assertEqual(next(result), (b'a', b'event1'))
+        result.close()
+
+        self.assertLess(socket.recv_multipart.call_count, 10)
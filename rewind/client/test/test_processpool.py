@@ -0,0 +1,135 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test replaying in worker processes using `rewind.client.processpool`."""
+import time
+import unittest
+
+import zmq
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+import rewind.client.dispatch as dispatch
+import rewind.client.processpool as processpool
+import rewind.client.testing as testing
+
+
+def _copy(eventid, eventdata):
+    """Return the event, copying its data."""
+    return eventid, bytes(eventdata)
+
+
+def _even(eventid, eventdata):
+    """Return the data of events holding an even number, else None."""
+    if int(bytes(eventdata)) % 2 == 0:
+        return bytes(eventdata)
+
+
+def _fail(eventid, eventdata):
+    """Fail on the event holding 42."""
+    if bytes(eventdata) == b'42':
+        raise ValueError("Failing on 42.")
+
+
+def _sleep(eventid, eventdata):
+    """Take a long time."""
+    time.sleep(60)
+
+
+class TestChunks(unittest.TestCase):
+
+    """Test splitting batches into slots."""
+
+    def testSplit(self):
+        """Test that batches are split into chunks that fit in a slot."""
+        ids = [b'a', b'b', b'c']
+        data = [b'x' * 10, b'y' * 10, b'z' * 10]
+        # An event takes up 2 offsets, its id and its data; 27 bytes.
+        chunks = list(processpool._chunks(ids, data, 16 + 2 * 27))
+        self.assertEqual(chunks, [(ids[:2], data[:2]), (ids[2:], data[2:])])
+        self.assertRaises(ValueError, list,
+                          processpool._chunks(ids, data, 16 + 26))
+
+    def testRoundTrip(self):
+        """Test reading what was written to a slot."""
+        ids = [b'a', b'bb', b'c']
+        data = [b'event1', b'', b'event3!']
+        buf = memoryview(bytearray(200))
+        sizes = processpool._write_slot(buf, ids, data)
+        events = [(eventid, bytes(eventdata)) for eventid, eventdata
+                  in processpool._read_slot(buf, *sizes)]
+        self.assertEqual(events, list(zip(ids, data)))
+
+
+@unittest.skipIf(shared_memory is None, "shared_memory not available")
+class TestProcessPoolReplay(unittest.TestCase):
+
+    """Test `ProcessPoolReplay` against a fake Rewind."""
+
+    def setUp(self):
+        """Set up a fake Rewind holding 500 events."""
+        self.context = zmq.Context(1)
+        self.rewind = testing.FakeRewind(self.context, 'inproc://replay',
+                                         batch_size=30)
+        self.rewind.load(str(i).encode() for i in range(500))
+        self.rewind.start()
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.connect('inproc://replay')
+
+    def tearDown(self):
+        """Stop the fake Rewind."""
+        self.rewind.stop()
+        self.socket.close(0)
+        self.context.term()
+
+    def testOrdered(self):
+        """Test that results are yielded in order."""
+        with processpool.ProcessPoolReplay(_copy, workers=3) as pool:
+            self.assertEqual(list(pool.replay(self.socket)),
+                             self.rewind.events)
+            # A pool can be reused.
+            fromid = self.rewind.events[99][0]
+            self.assertEqual(list(pool.replay(self.socket, fromid)),
+                             self.rewind.events[100:])
+
+    def testUnordered(self):
+        """Test that all results are yielded when unordered."""
+        with processpool.ProcessPoolReplay(_copy, workers=3,
+                                           ordered=False) as pool:
+            self.assertEqual(sorted(pool.replay(self.socket)),
+                             sorted(self.rewind.events))
+
+    def testNoneLeftOut(self):
+        """Test that None results are not yielded."""
+        with processpool.ProcessPoolReplay(_even, workers=2) as pool:
+            self.assertEqual(list(pool.replay(self.socket)),
+                             [str(i).encode() for i in range(0, 500, 2)])
+
+    def testSmallSlots(self):
+        """Test that batches larger than a slot are split."""
+        with processpool.ProcessPoolReplay(_copy, workers=2,
+                                           slot_bytes=300) as pool:
+            self.assertEqual(list(pool.replay(self.socket)),
+                             self.rewind.events)
+
+    def testHandlerFailure(self):
+        """Test that a failing handler fails the replay."""
+        with processpool.ProcessPoolReplay(_fail, workers=2) as pool:
+            self.assertRaises(dispatch.HandlerFailed, list,
+                              pool.replay(self.socket))
+
+    def testCloseTerminates(self):
+        """Test that closing terminates workers not done in time."""
+        pool = processpool.ProcessPoolReplay(_sleep, workers=1)
+        pool._submit([b'a'], [b'x'])
+        start = time.time()
+        pool.close(timeout=0.5)
+        self.assertLess(time.time() - start, 10)
@@ -0,0 +1,119 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test event encoding using `rewind.client.serialization`."""
+import unittest
+
+import mock
+
+import rewind.client.serialization as serialization
+
+
+class TestEventCodec(unittest.TestCase):
+
+    """Test `EventCodec` and `decode`."""
+
+    def testJSONRoundtrip(self):
+        """Test encoding and decoding JSON."""
+        codec = serialization.EventCodec('json')
+        data = codec.encode(['created', 5])
+        self.assertEqual(data, b'\xffRWC\x01\x01\x00["created",5]')
+        self.assertEqual(serialization.decode(data), ['created', 5])
+
+    def testPickleRoundtrip(self):
+        """Test encoding and decoding pickles."""
+        codec = serialization.EventCodec('pickle', allowed=['pickle'])
+        self.assertEqual(codec.decode(codec.encode((1, b'two', 3.0))),
+                         (1, b'two', 3.0))
+
+    def testPickleNotAllowedByDefault(self):
+        """Test that pickles are only decoded if explicitly allowed."""
+        data = serialization.EventCodec('pickle').encode([1])
+        self.assertRaises(serialization.CodecException,
+                          serialization.decode, data)
+        self.assertRaises(serialization.CodecException,
+                          serialization.decode, data, ['json'])
+        self.assertEqual(serialization.decode(data, ['pickle']), [1])
+        jsondata = serialization.EventCodec('json').encode([1])
+        self.assertRaises(serialization.CodecException,
+                          serialization.decode, jsondata, ['pickle'])
+
+    def testCompression(self):
+        """Test that large events are compressed and small ones not."""
+        codec = serialization.EventCodec('raw', 'zlib', min_compress_size=100)
+
+        small = codec.encode(b'a' * 99)
+        self.assertEqual(small[:7], b'\xffRWC\x01\x00\x00')
+        large = codec.encode(b'a' * 1000)
+        self.assertEqual(large[:7], b'\xffRWC\x01\x00\x01')
+        self.assertTrue(len(large) < 100)
+        self.assertEqual(serialization.decode(memoryview(large)),
+                         b'a' * 1000)
+
+    def testIncompressibleDataIsStoredUncompressed(self):
+        """Test that compression is skipped if it does not pay off."""
+        codec = serialization.EventCodec('raw', 'zlib', min_compress_size=1)
+        self.assertEqual(codec.encode(b'ab')[:7], b'\xffRWC\x01\x00\x00')
+
+    def testDataWithoutHeader(self):
+        """Test that events published without a codec pass through."""
+        self.assertEqual(serialization.decode(b'{"legacy": true}'),
+                         b'{"legacy": true}')
+        self.assertEqual(serialization.decode(b''), b'')
+        # Data merely starting with 0xFF is not mistaken for encoded data.
+        self.assertEqual(serialization.decode(b'\xff\x01\x00data'),
+                         b'\xff\x01\x00data')
+
+    def testUnknownSerializer(self):
+        """Test that unknown serializers are refused."""
+        self.assertRaises(serialization.CodecException,
+                          serialization.EventCodec, 'no-such-serializer')
+        self.assertRaises(serialization.CodecException,
+                          serialization.decode, b'\xffRWC\x01\xee\x00data')
+        self.assertRaises(serialization.CodecException,
+                          serialization.decode, b'\xffRWC\x09\x01\x00[]')
+
+    @unittest.skipIf(serialization.msgpack is None, "msgpack not installed")
+    def testMsgpackRoundtrip(self):
+        """Test encoding and decoding MessagePack."""
+        codec = serialization.EventCodec('msgpack')
+        self.assertEqual(codec.decode(codec.encode({'a': [1, 2]})),
+                         {'a': [1, 2]})
+
+
+class TestLazyDecoding(unittest.TestCase):
+
+    """Test `LazyEvent` and the wrapped client functions."""
+
+    def testDecodedOnlyOnAccess(self):
+        """Test that events are decoded once, and only when accessed."""
+        data = serialization.EventCodec('json').encode([1, 2, 3])
+        with mock.patch.object(serialization, 'decode',
+                               wraps=serialization.decode) as decode:
+            event = serialization.LazyEvent(data)
+            self.assertEqual(event.codec, 'json')
+            self.assertFalse(decode.called)
+            self.assertEqual(event.value, [1, 2, 3])
+            self.assertEqual(event.value, [1, 2, 3])
+            self.assertEqual(decode.call_count, 1)
+
+    def testQueryAndPublish(self):
+        """Test publishing and querying encoded events."""
+        codec = serialization.EventCodec('json')
+        socket = mock.NonCallableMock()
+        with mock.patch.object(serialization.clients,
+                               'publish_event') as publish_event:
+            serialization.publish_event(socket, codec, {'a': 1})
+            publish_event.assert_called_once_with(socket, codec.encode(
+                {'a': 1}), None)
+
+        with mock.patch.object(serialization.clients,
+                               'query_events') as query_events:
+            query_events.return_value = [(b'a', codec.encode({'a': 1}))]
+            events = list(serialization.query_events(socket))
+        self.assertEqual(events[0][0], b'a')
+        self.assertEqual(events[0][1].value, {'a': 1})
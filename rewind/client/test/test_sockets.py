@@ -0,0 +1,77 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test socket creation using `rewind.client.sockets`."""
+import unittest
+
+import mock
+import zmq
+
+import rewind.client as clients
+import rewind.client.sockets as sockets
+
+
+class TestSocketProfiles(unittest.TestCase):
+
+    """Test `connect_stream` and `connect_query`."""
+
+    def setUp(self):
+        """Set up a mocked context."""
+        self.socket = mock.NonCallableMock()
+        self.context = mock.NonCallableMock()
+        self.context.socket.return_value = self.socket
+
+    def testConnectStream(self):
+        """Test that profile options are set before connecting."""
+        sockets.connect_stream(self.context, 'tcp://localhost:8091',
+                               'high-throughput')
+
+        self.context.socket.assert_called_with(zmq.SUB)
+        self.socket.setsockopt.assert_any_call(zmq.RCVHWM, 1000000)
+        self.socket.setsockopt.assert_called_with(zmq.SUBSCRIBE, b'')
+        self.assertEqual(self.socket.method_calls[-1],
+                         mock.call.connect('tcp://localhost:8091'))
+
+    def testOverrides(self):
+        """Test that overrides take precedence over the profile."""
+        sockets.connect_query(self.context, 'tcp://localhost:8090',
+                              'low-latency', zmq.DEALER, LINGER=500)
+
+        self.context.socket.assert_called_with(zmq.DEALER)
+        self.socket.setsockopt.assert_any_call(zmq.LINGER, 500)
+        self.assertNotIn(mock.call(zmq.LINGER, 0),
+                         self.socket.setsockopt.call_args_list)
+
+    def testUnsupportedOptionsAreSkipped(self):
+        """Test that options unknown to pyzmq are skipped."""
+        sockets.connect_query(self.context, 'tcp://localhost:8090',
+                              NO_SUCH_OPTION=1)
+        self.assertEqual(self.socket.connect.call_count, 1)
+
+    def testUnknownProfile(self):
+        """Test that an unknown profile is refused."""
+        self.assertRaises(ValueError, sockets.connect_stream, self.context,
+                          'tcp://localhost:8091', 'no-such-profile')
+
+
+class TestHighWatermarkStatistics(unittest.TestCase):
+
+    """Test counting of high watermark fallbacks."""
+
+    def testFallbackIsCounted(self):
+        """Test that catching up through a query is counted."""
+        clients.statistics.reset()
+        streamsock = mock.NonCallableMock()
+        streamsock.recv.side_effect = [b'c', b'b', b'event3']
+        streamsock.getsockopt.side_effect = [True, True, False]
+        reqsock = mock.NonCallableMock()
+        reqsock.recv.side_effect = [b'b', b'event2', b'END']
+        reqsock.getsockopt.side_effect = [True, True, False, False]
+
+        list(clients.yield_events_after(streamsock, reqsock, b'a'))
+
+        self.assertEqual(clients.statistics.hwm_fallbacks, 1)
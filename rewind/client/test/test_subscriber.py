@@ -0,0 +1,232 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test gap-free stream subscription using `rewind.client.subscriber`."""
+import itertools
+import unittest
+
+import mock
+import zmq
+
+import rewind.client as clients
+import rewind.client.subscriber as subscriber
+import rewind.client.testing as testing
+
+
+def _stream_socket(events):
+    """Return a mocked SUB socket streaming `events`.
+
+    Parameters:
+    events -- a list of `(eventid, preveventid, eventdata)` tuples.
+
+    """
+    streamsock = mock.NonCallableMock()
+    streamsock.recv.side_effect = [frame for event in events
+                                   for frame in event]
+    streamsock.getsockopt.side_effect = [True, True, False] * len(events)
+    return streamsock
+
+
+class TestFollowStream(unittest.TestCase):
+
+    """Test `follow_stream`."""
+
+    def setUp(self):
+        """Set up the each test."""
+        self.events = [
+            (b'a', b'', b'event1'),
+            (b'b', b'a', b'event2'),
+            (b'c', b'b', b'event3'),
+            (b'd', b'c', b'event4'),
+        ]
+
+    def testNoGaps(self):
+        """Test following a stream without dropped messages."""
+        streamsock = _stream_socket(self.events[1:])
+        reqsock = mock.NonCallableMock()
+
+        results = list(itertools.islice(
+            subscriber.follow_stream(streamsock, reqsock, b'a'), 3))
+
+        self.assertEqual(results, [(b'b', b'event2'), (b'c', b'event3'),
+                                   (b'd', b'event4')])
+        assert not reqsock.send.called
+
+    def testGapIsBackfilled(self):
+        """Test that dropped messages are queried for."""
+        streamsock = _stream_socket([self.events[1], self.events[3]])
+        reqsock = mock.NonCallableMock()
+        reqsock.recv.side_effect = [b'c', b'event3', b'END']
+        reqsock.getsockopt.side_effect = [True, True, False, False]
+
+        results = list(itertools.islice(
+            subscriber.follow_stream(streamsock, reqsock, b'a'), 3))
+
+        self.assertEqual(results, [(b'b', b'event2'), (b'c', b'event3'),
+                                   (b'd', b'event4')])
+        reqsock.send.assert_has_calls([mock.call(b'QUERY', zmq.SNDMORE),
+                                       mock.call(b'b', zmq.SNDMORE),
+                                       mock.call(b'c')])
+
+    def testRestartedRewind(self):
+        """Test catching up after Rewind lost track of the previous event."""
+        streamsock = _stream_socket([(b'd', b'', b'event4'), self.events[3]])
+        reqsock = mock.NonCallableMock()
+        reqsock.recv.side_effect = [b'c', b'event3', b'd', b'event4', b'END']
+        reqsock.getsockopt.side_effect = [True, True, True, True, False,
+                                          False]
+
+        results = list(itertools.islice(
+            subscriber.follow_stream(streamsock, reqsock, b'b'), 2))
+
+        self.assertEqual(results, [(b'c', b'event3'), (b'd', b'event4')])
+
+
+class TestSubscriber(unittest.TestCase):
+
+    """Test `Subscriber`."""
+
+    def testLastEventIdIsTracked(self):
+        """Test that the subscriber keeps track of the last event id."""
+        streamsock = _stream_socket([(b'b', b'a', b'event2'),
+                                     (b'c', b'b', b'event3')])
+        reqsock = mock.NonCallableMock()
+        context = mock.NonCallableMock()
+        context.socket.side_effect = [streamsock, reqsock]
+
+        with subscriber.Subscriber(context, 'stream', 'query', b'a') as sub:
+            results = list(itertools.islice(sub, 2))
+            self.assertEqual(sub.lasteventid, b'c')
+
+        self.assertEqual(results, [(b'b', b'event2'), (b'c', b'event3')])
+        streamsock.setsockopt.assert_called_with(zmq.SUBSCRIBE, b'')
+        streamsock.connect.assert_called_with('stream')
+        reqsock.connect.assert_called_with('query')
+        assert streamsock.close.called
+        assert reqsock.close.called
+
+
+def _query_socket(replies):
+    """Return a mocked REQ socket answering queries with `replies`.
+
+    Parameters:
+    replies -- a list of replies, each a list of `(eventid, eventdata)`
+               tuples ended by END.
+
+    """
+    reqsock = mock.NonCallableMock()
+    frames = []
+    rcvmore = []
+    for reply in replies:
+        for eventid, eventdata in reply:
+            frames.extend([eventid, eventdata])
+            rcvmore.extend([True, True])
+        frames.append(b'END')
+        rcvmore.extend([False, False])
+    reqsock.recv.side_effect = frames
+    reqsock.getsockopt.side_effect = rcvmore
+    return reqsock
+
+
+class TestReplayAndFollow(unittest.TestCase):
+
+    """Test `replay_and_follow`."""
+
+    def testStreamReadWhileQuerying(self):
+        """Test joining history with events streamed while querying."""
+        streamsock = _stream_socket([(b'b', b'a', b'2'), (b'c', b'b', b'3'),
+                                     (b'd', b'c', b'4'), (b'e', b'd', b'5')])
+        streamsock.poll.side_effect = [True, False, True, False, False]
+        reqsock = _query_socket([[(b'a', b'1'), (b'b', b'2'), (b'c', b'3')]])
+
+        with mock.patch.object(subscriber, '_DRAIN_INTERVAL', 1):
+            results = list(itertools.islice(
+                subscriber.replay_and_follow(streamsock, reqsock), 5))
+
+        self.assertEqual(results, [(b'a', b'1'), (b'b', b'2'), (b'c', b'3'),
+                                   (b'd', b'4'), (b'e', b'5')])
+        self.assertEqual(reqsock.send.call_count, 3)
+
+    def testStreamedDuplicatesAreSkipped(self):
+        """Test that streamed events already queried for are skipped."""
+        streamsock = _stream_socket([(b'a', b'', b'1'), (b'b', b'a', b'2'),
+                                     (b'c', b'b', b'3')])
+        reqsock = _query_socket([[(b'a', b'1'), (b'b', b'2')]])
+
+        results = list(itertools.islice(
+            subscriber.replay_and_follow(streamsock, reqsock), 3))
+
+        self.assertEqual(results, [(b'a', b'1'), (b'b', b'2'), (b'c', b'3')])
+        assert not streamsock.poll.called
+
+    def testGapAtJoinIsBackfilled(self):
+        """Test that events dropped at the join point are queried for."""
+        streamsock = _stream_socket([(b'd', b'c', b'4')])
+        reqsock = _query_socket([[(b'a', b'1'), (b'b', b'2')],
+                                 [(b'c', b'3')]])
+
+        results = list(itertools.islice(
+            subscriber.replay_and_follow(streamsock, reqsock, b'0'), 4))
+
+        self.assertEqual(results, [(b'a', b'1'), (b'b', b'2'), (b'c', b'3'),
+                                   (b'd', b'4')])
+        reqsock.send.assert_has_calls([mock.call(b'QUERY', zmq.SNDMORE),
+                                       mock.call(b'0', zmq.SNDMORE),
+                                       mock.call(b''),
+                                       mock.call(b'QUERY', zmq.SNDMORE),
+                                       mock.call(b'b', zmq.SNDMORE),
+                                       mock.call(b'c')])
+
+
+class TestReplayAndFollowBusyStream(unittest.TestCase):
+
+    """Test `replay_and_follow` against a fake Rewind streaming events."""
+
+    def setUp(self):
+        """Set up a fake Rewind holding 300 events and connected sockets."""
+        self.context = zmq.Context(1)
+        self.rewind = testing.FakeRewind(self.context, 'inproc://busy-query',
+                                         'inproc://busy-stream',
+                                         batch_size=32)
+        self.rewind.load(str(i).encode() for i in range(300))
+        self.rewind.start()
+        self.sockets = []
+        self.pubsock = self._socket(zmq.REQ, 'inproc://busy-query')
+        self.reqsock = self._socket(zmq.REQ, 'inproc://busy-query')
+        self.streamsock = self._socket(zmq.SUB, 'inproc://busy-stream')
+
+    def tearDown(self):
+        """Stop the fake Rewind and close the sockets."""
+        self.rewind.stop()
+        for socket in self.sockets:
+            socket.close(0)
+        self.context.term()
+
+    def _socket(self, type_, endpoint):
+        """Return a socket connected to the fake Rewind."""
+        socket = self.context.socket(type_)
+        if type_ == zmq.SUB:
+            socket.setsockopt(zmq.SUBSCRIBE, b'')
+        socket.connect(endpoint)
+        self.sockets.append(socket)
+        return socket
+
+    def testSmallBuffer(self):
+        """Test that a buffer smaller than the drain interval suffices."""
+        events = subscriber.replay_and_follow(self.streamsock, self.reqsock,
+                                              maxbuffer=10)
+        results = []
+        for i in range(300):
+            results.append(next(events))
+            if i < 150:
+                # An event published for every one queried.
+                clients.publish_event(self.pubsock, b'live')
+        # History ends after the first 450 events, joining the stream.
+        results.extend(itertools.islice(events, 150))
+        clients.publish_event(self.pubsock, b'live')
+        results.append(next(events))
+        self.assertEqual(results, self.rewind.events)
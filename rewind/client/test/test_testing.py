@@ -0,0 +1,113 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test the client against the fake Rewind of `rewind.client.testing`."""
+import time
+import unittest
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.testing as testing
+
+
+class TestFakeRewind(unittest.TestCase):
+
+    """Test the client against `FakeRewind`."""
+
+    def setUp(self):
+        """Set up a fake Rewind and sockets connected to it."""
+        self.context = zmq.Context(1)
+        self.rewind = testing.FakeRewind(self.context, 'inproc://fake-query',
+                                         'inproc://fake-stream', batch_size=3)
+        self.rewind.start()
+        self.reqsock = self.context.socket(zmq.REQ)
+        self.reqsock.connect('inproc://fake-query')
+        self.streamsock = self.context.socket(zmq.SUB)
+        self.streamsock.setsockopt(zmq.SUBSCRIBE, b'')
+        self.streamsock.connect('inproc://fake-stream')
+
+    def tearDown(self):
+        """Stop the fake Rewind and close the sockets."""
+        self.rewind.stop()
+        self.reqsock.close(0)
+        self.streamsock.close(0)
+        self.context.term()
+
+    def _publish(self, n):
+        """Publish `n` events and return them as they should be queried."""
+        for i in range(n):
+            clients.publish_event(self.reqsock, str(i).encode())
+        return self.rewind.events
+
+    def testPaginatedQuery(self):
+        """Test querying across batches of `batch_size` events."""
+        events = self._publish(7)
+        self.assertEqual([eventdata for _, eventdata in events],
+                         [str(i).encode() for i in range(7)])
+        self.assertEqual(list(clients.query_events(self.reqsock)), events)
+        self.assertEqual(list(clients.query_events(self.reqsock,
+                                                   events[1][0],
+                                                   events[5][0])),
+                         events[2:6])
+
+    def testFullLastBatch(self):
+        """Test querying when the last batch is full."""
+        events = self._publish(6)
+        self.assertEqual(list(clients.query_events(self.reqsock)), events)
+
+    def testDeterministicIds(self):
+        """Test that event ids do not differ between runs."""
+        self.assertEqual(self._publish(1)[0][0],
+                         b'00000000-0000-0000-0000-000000000001')
+
+    def testUnknownKey(self):
+        """Test querying from an event id that does not exist."""
+        self._publish(1)
+        self.assertRaises(clients.QueryException, list,
+                          clients.query_events(self.reqsock, b'unknown'))
+
+    def testDroppedStreamMessages(self):
+        """Test that dropped streamed events are queried for."""
+        self.rewind.drop_stream = lambda sequence: sequence in (1, 2)
+        # Give the subscription time to reach the PUB socket.
+        time.sleep(0.1)
+        events = self._publish(4)
+        self.assertEqual(self.rewind.dropped, 2)
+
+        received = list(clients.yield_events_after(self.streamsock,
+                                                   self.reqsock))
+        self.assertEqual(received, events[:1])
+        received = list(clients.yield_events_after(self.streamsock,
+                                                   self.reqsock,
+                                                   events[0][0]))
+        self.assertEqual(received, events[1:])
+
+    def testSlowReplies(self):
+        """Test that slow replies time out."""
+        self.rewind.reply_delay = 0.2
+        self.assertRaises(clients.TimeoutException, clients.publish_event,
+                          self.reqsock, b'event', timeout=0.05)
+
+    def testLoad(self):
+        """Test that loaded events can be queried but are not streamed."""
+        context = zmq.Context(1)
+        rewind = testing.FakeRewind(context, 'inproc://loaded',
+                                    'inproc://loaded-stream')
+        lasteventid = rewind.load([b'a', b'b'])
+        rewind.start()
+        socket = context.socket(zmq.REQ)
+        socket.connect('inproc://loaded')
+        try:
+            self.assertEqual(list(clients.query_events(socket)),
+                             rewind.events)
+            self.assertEqual(rewind.events[-1][0], lasteventid)
+            self.assertEqual(rewind.streamed, 0)
+        finally:
+            rewind.stop()
+            socket.close(0)
+            context.term()
@@ -0,0 +1,74 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test timeouts of queries and publishing."""
+import threading
+import time
+import unittest
+
+import zmq
+
+import rewind.client as clients
+import rewind.client.pool as pool
+
+
+class TestTimeouts(unittest.TestCase):
+
+    """Test the `timeout` parameter against a Rewind that never replies."""
+
+    def setUp(self):
+        """Set up a REP socket that receives requests but never replies."""
+        self.context = zmq.Context(1)
+        self.stalled = self.context.socket(zmq.REP)
+        self.stalled.bind('inproc://stalled-rewind')
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.connect('inproc://stalled-rewind')
+
+    def tearDown(self):
+        """Close the sockets."""
+        self.socket.close(0)
+        self.stalled.close(0)
+        self.context.term()
+
+    def testQueryTimeout(self):
+        """Test that a query raises when no reply arrives in time."""
+        start = time.time()
+        self.assertRaises(clients.TimeoutException, list,
+                          clients.query_events(self.socket, timeout=0.05))
+        self.assertTrue(time.time() - start < 2)
+
+    def testNoCopyQueryTimeout(self):
+        """Test that a zero-copy query raises when no reply arrives."""
+        self.assertRaises(clients.TimeoutException, list,
+                          clients.query_events(self.socket, copy=False,
+                                               timeout=0.05))
+
+    def testPublishTimeout(self):
+        """Test that publishing raises when no reply arrives in time."""
+        self.assertRaises(clients.TimeoutException, clients.publish_event,
+                          self.socket, b'event', 0.05)
+
+    def testReplyWithinTimeout(self):
+        """Test that a timely reply is received as usual."""
+        def reply():
+            self.stalled.recv_multipart()
+            self.stalled.send_multipart([b'a', b'event', b'END'])
+        replier = threading.Thread(target=reply)
+        replier.start()
+        events = list(clients.query_events(self.socket, timeout=5))
+        replier.join()
+
+        self.assertEqual(events, [(b'a', b'event')])
+
+    def testPoolRecyclesTimedOutSocket(self):
+        """Test that a pooled socket that timed out is not reused."""
+        rewindpool = pool.RewindPool(self.context, 'inproc://stalled-rewind')
+        self.assertRaises(clients.TimeoutException, rewindpool.publish_event,
+                          b'event', 0.05)
+        self.assertEqual(rewindpool.statistics.recycled, 1)
+        self.assertEqual(rewindpool.size, 0)
+        rewindpool.close()
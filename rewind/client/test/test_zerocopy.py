@@ -0,0 +1,75 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""Test the zero-copy receive path of `rewind.client`."""
+import unittest
+
+import mock
+
+import rewind.client as clients
+
+
+class _Frame(object):
+
+    """A `zmq.Frame` stand-in."""
+
+    def __init__(self, data):
+        """Constructor."""
+        self.bytes = data
+        self.buffer = memoryview(data)
+
+
+def _frames(*datas):
+    """Return a list of `_Frame`s wrapping `datas`."""
+    return [_Frame(data) for data in datas]
+
+
+class TestZeroCopy(unittest.TestCase):
+
+    """Test querying and streaming with `copy=False`."""
+
+    def testQueryYieldsMemoryviews(self):
+        """Test that event data is handed over as memoryviews."""
+        socket = mock.NonCallableMock()
+        socket.recv_multipart.side_effect = [
+            _frames(b'a', b'event1', b'b', b'event2'),
+            _frames(b'c', b'END', b'END'),
+        ]
+
+        results = list(clients.query_events(socket, copy=False))
+
+        self.assertEqual([eventid for eventid, _ in results],
+                         [b'a', b'b', b'c'])
+        for _, eventdata in results:
+            self.assertIsInstance(eventdata, memoryview)
+        self.assertEqual([bytes(eventdata) for _, eventdata in results],
+                         [b'event1', b'event2', b'END'])
+        socket.recv_multipart.assert_called_with(copy=False)
+        socket.send_multipart.assert_called_with([b'QUERY', b'b', b''])
+
+    def testQueryError(self):
+        """Test that an error response raises `QueryException`."""
+        socket = mock.NonCallableMock()
+        socket.recv_multipart.return_value = _frames(b'ERROR Key missing')
+        result = clients.query_events(socket, b'non-exist', copy=False)
+        self.assertRaises(clients.QueryException, list, result)
+
+    def testRecvFloodedSocket(self):
+        """Test catching up without copying when watermark was passed."""
+        streamsock = mock.NonCallableMock()
+        streamsock.recv_multipart.return_value = _frames(b'c', b'b',
+                                                         b'event3')
+        reqsock = mock.NonCallableMock()
+        reqsock.recv_multipart.return_value = _frames(b'b', b'event2', b'END')
+
+        results = [(eventid, bytes(eventdata))
+                   for eventid, eventdata in
+                   clients.yield_events_after(streamsock, reqsock, b'a',
+                                              copy=False)]
+
+        self.assertEqual(results, [(b'b', b'event2'), (b'c', b'event3')])
+        reqsock.send_multipart.assert_called_with([b'QUERY', b'a', b'b'])
@@ -0,0 +1,245 @@
+# rewind-client talks to rewind, an event store server.
+#
+# Copyright (C) 2012  Jens Rantil
+#
+# This program is distributed under the MIT License. See the file LICENSE.txt
+# for details.
+
+"""An in-memory stand-in for Rewind, for tests and benchmarks.
+
+`FakeRewind` speaks the same QUERY/PUBLISH request protocol and event
+streaming protocol as Rewind, keeping all events in an indexed in-memory log.
+It makes it possible to exercise the client without the `rewind` package::
+
+    server = FakeRewind(context, 'inproc://query', 'inproc://stream')
+    server.start()
+    ...
+    server.stop()
+
+Queries are answered in batches of `batch_size` events, just like Rewind
+does. Event ids are deterministic, so runs can be compared to each other.
+
+Faults can be injected to exercise error handling in the client:
+`drop_stream` drops streamed events, just like a PUB socket does when the
+high watermark is reached, and `reply_delay` makes replies slow.
+
+Can also be run standalone::
+
+    python -m rewind.client.testing --query-endpoint tcp://127.0.0.1:8090
+
+"""
+from __future__ import print_function
+import argparse
+import signal
+import sys
+import threading
+import time
+import uuid
+
+import zmq
+
+
+class FakeRewind(threading.Thread):
+
+    """A thread serving a Rewind compatible query and streaming endpoint."""
+
+    def __init__(self, context, query_endpoint, stream_endpoint=None,
+                 batch_size=100, max_hint=None, drop_stream=None,
+                 reply_delay=0.0):
+        """Constructor. Binds the sockets right away.
+
+        Parameters:
+        context         -- the ZeroMQ context to create sockets from.
+        query_endpoint  -- the endpoint to bind the REP query socket to.
+        stream_endpoint -- the (optional) endpoint to bind the PUB streaming
+                           socket to.
+        batch_size      -- the maximum number of events in a query reply.
+        max_hint        -- the largest batch size hint to honour, see
+                           `rewind.client.adaptive`. If None, a `QUERY`
+                           with a hint makes the thread fail, just like it
+                           makes Rewind's query loop fail.
+        drop_stream     -- an (optional) function called with the zero-based
+                           sequence number of every published event. The
+                           event is not streamed if it returns true.
+        reply_delay     -- the number of seconds to wait before replying to a
+                           request.
+
+        `drop_stream` and `reply_delay` are also attributes, and can be
+        changed while serving.
+
+        """
+        assert batch_size >= 1
+        super(FakeRewind, self).__init__(name="fake-rewind")
+        self.daemon = True
+        self._context = context
+        self.batch_size = batch_size
+        self.max_hint = max_hint
+        self.drop_stream = drop_stream
+        self.reply_delay = reply_delay
+
+        self._querysock = context.socket(zmq.REP)
+        self._querysock.bind(query_endpoint)
+        self._streamsock = None
+        if stream_endpoint:
+            self._streamsock = context.socket(zmq.PUB)
+            self._streamsock.bind(stream_endpoint)
+
+        self._control_endpoint = 'inproc://fake-rewind-{0}'.format(
+            uuid.uuid4().hex)
+        self._controlsock = context.socket(zmq.PAIR)
+        self._controlsock.bind(self._control_endpoint)
+
+        self._events = []
+        self._positions = {}
+        self.streamed = 0
+        self.dropped = 0
+
+    @property
+    def events(self):
+        """A list of all stored `(eventid, eventdata)` tuples."""
+        return list(self._events)
+
+    def load(self, events):
+        """Store events without streaming them. Call before `start()`.
+
+        Parameters:
+        events -- an iterable of event data byte strings.
+
+        Returns the id of the last stored event, or None if none were.
+
+        """
+        assert not self.is_alive()
+        eventid = None
+        for eventdata in events:
+            eventid = self._store(eventdata)
+        return eventid
+
+    def stop(self):
+        """Stop serving and wait for the thread to finish."""
+        socket = self._context.socket(zmq.PAIR)
+        socket.connect(self._control_endpoint)
+        socket.send(b'STOP')
+        self.join()
+        socket.close()
+
+    def run(self):
+        """Serve requests until stopped."""
+        poller = zmq.Poller()
+        poller.register(self._querysock, zmq.POLLIN)
+        poller.register(self._controlsock, zmq.POLLIN)
+        try:
+            while True:
+                ready = dict(poller.poll())
+                if self._controlsock in ready:
+                    break
+                self._handle_request(self._querysock.recv_multipart())
+        finally:
+            for socket in (self._querysock, self._streamsock,
+                           self._controlsock):
+                if socket is not None:
+                    socket.close(0)
+
+    def _store(self, eventdata):
+        """Append an event to the log and return its id."""
+        # Rewind uses UUIDs for event ids. Deriving them from the position
+        # keeps runs deterministic.
+        eventid = str(uuid.UUID(int=len(self._events) + 1)).encode()
+        self._positions[eventid] = len(self._events)
+        self._events.append((eventid, eventdata))
+        return eventid
+
+    def _reply(self, frames):
+        """Send a reply, after `reply_delay` seconds."""
+        if self.reply_delay:
+            time.sleep(self.reply_delay)
+        self._querysock.send_multipart(frames)
+
+    def _handle_request(self, frames):
+        """Respond to a single request."""
+        if frames[0] == b'PUBLISH' and len(frames) == 2:
+            self._handle_publish(frames[1])
+        elif frames[0] == b'QUERY' and len(frames) == 3:
+            self._handle_query(frames[1], frames[2], self.batch_size)
+        elif frames[0] == b'QUERY' and len(frames) == 4:
+            assert self.max_hint is not None, "Unexpected batch size hint."
+            try:
+                hint = int(frames[3])
+            except ValueError:
+                hint = 0
+            if hint < 1:
+                self._reply([b'ERROR Invalid batch size hint'])
+                return
+            self._handle_query(frames[1], frames[2],
+                               min(hint, self.max_hint))
+        else:
+            self._reply([b'ERROR Unknown request type'])
+
+    def _handle_publish(self, eventdata):
+        """Store and stream a published event."""
+        preveventid = self._events[-1][0] if self._events else b''
+        sequence = len(self._events)
+        eventid = self._store(eventdata)
+        if self._streamsock is not None:
+            if self.drop_stream is not None and self.drop_stream(sequence):
+                self.dropped += 1
+            else:
+                self._streamsock.send_multipart([eventid, preveventid,
+                                                 eventdata])
+                self.streamed += 1
+        self._reply([b'PUBLISHED'])
+
+    def _handle_query(self, from_, to, batch_size):
+        """Respond with a batch of at most `batch_size` queried events."""
+        try:
+            start = self._positions[from_] + 1 if from_ else 0
+            end = self._positions[to] + 1 if to else len(self._events)
+        except KeyError:
+            self._reply([b'ERROR Key did not exist'])
+            return
+
+        events = self._events[start:min(end, start + batch_size)]
+        frames = [frame for event in events for frame in event]
+        # Like Rewind, only a reply of less than a full batch ends a query.
+        if len(events) < batch_size:
+            frames.append(b'END')
+        self._reply(frames)
+
+
+def main(argv=None):
+    """Serve a fake Rewind until interrupted or terminated."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--query-endpoint', default='tcp://127.0.0.1:8090',
+                        help='the endpoint to bind the query socket to.')
+    parser.add_argument('--stream-endpoint', default=None,
+                        help='the endpoint to bind the streaming socket to.')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='the maximum number of events per query reply.')
+    parser.add_argument('--reply-delay', type=float, default=0.0,
+                        help='the number of seconds to delay replies.')
+    args = parser.parse_args(argv)
+
+    # Raising from the signal handler could interrupt a join of the server
+    # thread, so only flag that we should stop.
+    stopping = threading.Event()
+
+    def terminate(signum, frame):
+        stopping.set()
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    context = zmq.Context(1)
+    server = FakeRewind(context, args.query_endpoint, args.stream_endpoint,
+                        batch_size=args.batch_size,
+                        reply_delay=args.reply_delay)
+    server.start()
+    print("Serving on", args.query_endpoint)
+    sys.stdout.flush()
+    while not stopping.is_set():
+        stopping.wait(0.5)
+    server.stop()
+    context.term()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,9 +3,9 @@ import sys
 
 
 py_version = sys.version_info[:2]
-if py_version <= (2, 6):
-    raise RuntimeError("Python <= 2.6 does not ship with argparse. "
-                        "Therefore, rewind will not work with these.")
+if py_version < (3, 8):
+    raise RuntimeError("Python < 3.8 lacks asyncio and shared memory support"
+                       " used by rewind-client.")
 
 
 setup(
@@ -30,19 +30,33 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Natural Language :: English",
         "Operating System :: OS Independent",
-        "Programming Language :: Python :: 2.7",
-        "Programming Language :: Python :: 3.2",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
         "Topic :: Software Development :: Object Brokering",
         "Topic :: System :: Distributed Computing",
     ],
     keywords="CQRS, event sourcing, ZeroMQ",
+    python_requires=">=3.8",
     setup_requires=[
         'nose>=1.0',
         'coverage==3.5.1',
     ],
     install_requires=[
-        "pyzmq==2.2.0.1",
+        "pyzmq>=17.0",
     ],
+    entry_points={
+        "console_scripts": [
+            "rewind-publish = rewind.client.cli:publish_main",
+            "rewind-query = rewind.client.cli:query_main",
+        ],
+    },
+    extras_require={
+        "msgpack": ["msgpack"],
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"],
+    },
     tests_require=[
         "rewind==0.3.1",
         "mock==0.8",